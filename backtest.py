@@ -0,0 +1,316 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from chain_store import EASTERN, ChainStore
+from config import BACKTEST_RESULTS_PATH, CHAIN_STORE_DIR, STRATEGY_MODES, save_learned_config
+from spread_optimizer import WIDTH_RANGE, score_put_spreads
+
+logger = logging.getLogger(__name__)
+
+# 默认扫描网格 (5 × 4 × 3 × 4 × 3 = 720 组)
+SWEEP_GRID = {
+    'CC_DELTA_TARGET': [0.10, 0.15, 0.20, 0.25, 0.30],
+    'PCS_SELL_DELTA': [0.05, 0.07, 0.10, 0.15],
+    'PCS_WIDTH': [20, 30, 50],
+    'ROLL_DELTA_THRESHOLD': [0.40, 0.45, 0.50, 0.55],
+    'ROLL_DTE_THRESHOLD': [0, 1, 2],
+}
+
+MULTIPLIER = 100
+# 开 Covered Call 时所选行权价 |Delta| 与目标的最大偏差
+CC_DELTA_TOLERANCE = 0.05
+SPREAD_THRESHOLD = 0.1
+
+
+class Snapshot(NamedTuple):
+    """列式存储中的一个链截面 (同一时刻、同一到期日、同一方向)"""
+    ts: float
+    day: date
+    expiry: date
+    dte: int
+    right: str
+    underlying_price: float
+    strikes: np.ndarray
+    bids: np.ndarray
+    asks: np.ndarray
+    deltas: np.ndarray
+
+
+class BacktestResult(NamedTuple):
+    params: dict
+    pnl: float
+    max_drawdown: float
+    trades: int
+    cc_pnl: float
+    pcs_pnl: float
+
+    def to_dict(self):
+        return self._asdict()
+
+
+def _expiry_date(value: int) -> date:
+    return date(value // 10000, value // 100 % 100, value % 100)
+
+
+def split_snapshots(columns) -> List[Snapshot]:
+    """按 (ts, expiry, right) 把一天的列切成截面；存储中同一截面的行是连续写入的"""
+    n = len(columns)
+    if not n:
+        return []
+    ts, expiry, right = np.asarray(columns.ts), np.asarray(columns.expiry), np.asarray(columns.right)
+    change = (ts[1:] != ts[:-1]) | (expiry[1:] != expiry[:-1]) | (right[1:] != right[:-1])
+    bounds = np.concatenate(([0], np.flatnonzero(change) + 1, [n]))
+    snapshots = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        day = datetime.fromtimestamp(ts[start], EASTERN).date()
+        exp = _expiry_date(int(expiry[start]))
+        snapshots.append(Snapshot(
+            ts=float(ts[start]),
+            day=day,
+            expiry=exp,
+            dte=(exp - day).days,
+            right=chr(right[start]),
+            underlying_price=float(columns.underlying[start]),
+            strikes=np.asarray(columns.strike[start:end], dtype=float),
+            bids=np.asarray(columns.bid[start:end], dtype=float),
+            asks=np.asarray(columns.ask[start:end], dtype=float),
+            deltas=np.asarray(columns.delta[start:end], dtype=float),
+        ))
+    return snapshots
+
+
+def load_snapshots(store: ChainStore, symbols=None, days: Optional[int] = None) -> Dict[str, Dict[str, List[Snapshot]]]:
+    """{symbol: {'C': [...], 'P': [...]}}，按时间排序；days 为只取最近 N 个交易日"""
+    if symbols is None:
+        symbols = sorted(p.name for p in store.root.iterdir() if p.is_dir()) if store.root.exists() else []
+    data = {}
+    for symbol in symbols:
+        by_right = {'C': [], 'P': []}
+        recorded = store.days(symbol)
+        for day in recorded[-days:] if days else recorded:
+            for s in split_snapshots(store.load_day(symbol, day)):
+                by_right.setdefault(s.right, []).append(s)
+        for snaps in by_right.values():
+            snaps.sort(key=lambda s: s.ts)
+        data[symbol.upper()] = by_right
+    return data
+
+
+def _strike_index(snapshot: Snapshot, strike: float) -> Optional[int]:
+    i = int(np.searchsorted(snapshot.strikes, strike))
+    if i < len(snapshot.strikes) and abs(snapshot.strikes[i] - strike) < 1e-6:
+        return i
+    return None
+
+
+def _liquid(snapshot: Snapshot) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mid = (snapshot.bids + snapshot.asks) / 2
+        return (mid > 0) & ((snapshot.asks - snapshot.bids) / mid <= SPREAD_THRESHOLD)
+
+
+def pick_by_delta(snapshot: Snapshot, target: float, tolerance: float = CC_DELTA_TOLERANCE) -> Optional[int]:
+    """|Delta| 最接近目标、流动性达标且有 Bid 的行权价"""
+    diff = np.abs(snapshot.deltas - target)
+    ok = _liquid(snapshot) & (snapshot.bids > 0) & (diff <= tolerance)
+    if not ok.any():
+        return None
+    return int(np.argmin(np.where(ok, diff, np.inf)))
+
+
+def simulate_covered_calls(snapshots: List[Snapshot], params: dict) -> list:
+    """
+    按 manage_covered_calls / check_and_roll_call 的规则逐截面回放一张 Covered Call：
+    无仓位时以 Bid 卖出 Delta≈CC_DELTA_TARGET 的 Call；Delta 超过 ROLL_DELTA_THRESHOLD 或
+    DTE 小于 ROLL_DTE_THRESHOLD 时以 Ask 买回并在下一个可用到期日重新卖出；到期按内在价值结算。
+    返回 [(ts, 已实现盈亏, 成交笔数)]
+    """
+    target = params['CC_DELTA_TARGET']
+    roll_delta, roll_dte = params['ROLL_DELTA_THRESHOLD'], params['ROLL_DTE_THRESHOLD']
+    events = []
+    pos = None      # [expiry, strike, credit, mark]
+    last_price, last_ts = None, None
+    for s in snapshots:
+        if pos and s.day > pos[0]:
+            events.append((s.ts, pos[2] - max(0.0, last_price - pos[1]), 0))
+            pos = None
+        last_price, last_ts = s.underlying_price, s.ts
+        if pos and s.expiry == pos[0]:
+            i = _strike_index(s, pos[1])
+            if i is not None and s.asks[i] > 0:
+                pos[3] = s.asks[i]
+                if s.deltas[i] > roll_delta or s.dte < roll_dte:
+                    events.append((s.ts, pos[2] - s.asks[i], 1))
+                    pos = None
+        if pos is None and s.dte >= roll_dte:
+            i = pick_by_delta(s, target)
+            if i is not None:
+                pos = [s.expiry, s.strikes[i], s.bids[i], s.asks[i]]
+                events.append((s.ts, 0.0, 1))
+    if pos:
+        # 数据结束时仍持仓：按最后一次 Ask 计价
+        events.append((last_ts, pos[2] - pos[3], 0))
+    return events
+
+
+def simulate_put_spreads(snapshots: List[Snapshot], params: dict) -> list:
+    """
+    按 manage_index_spreads 的规则回放 0DTE Put Credit Spread：每个标的同时最多一组，
+    用 score_put_spreads 在宽度 PCS_WIDTH × WIDTH_RANGE 内联合选腿，按对手价成交，持有到期结算。
+    """
+    sell_delta, width = params['PCS_SELL_DELTA'], params['PCS_WIDTH']
+    events = []
+    pos = None      # [expiry, sell_strike, buy_strike, credit, mark]
+    last_price, last_ts = None, None
+    for s in snapshots:
+        if pos and s.day > pos[0]:
+            loss = max(0.0, pos[1] - last_price) - max(0.0, pos[2] - last_price)
+            events.append((s.ts, pos[3] - loss, 0))
+            pos = None
+        last_price, last_ts = s.underlying_price, s.ts
+        if pos and s.expiry == pos[0]:
+            i, j = _strike_index(s, pos[1]), _strike_index(s, pos[2])
+            if i is not None and j is not None:
+                pos[4] = s.asks[i] - s.bids[j]
+        if pos is None and s.dte == 0 and len(s.strikes) >= 2:
+            scores = score_put_spreads(s, sell_delta, width * WIDTH_RANGE[0], width * WIDTH_RANGE[1],
+                                       spread_threshold=SPREAD_THRESHOLD, target_width=width)
+            i, j = np.unravel_index(np.argmax(scores), scores.shape)
+            if np.isfinite(scores[i, j]):
+                credit = s.bids[i] - s.asks[j]
+                pos = [s.expiry, s.strikes[i], s.strikes[j], credit, credit]
+                events.append((s.ts, 0.0, 1))
+    if pos:
+        events.append((last_ts, pos[3] - pos[4], 0))
+    return events
+
+
+def evaluate(params: dict, data) -> BacktestResult:
+    cc_events, pcs_events = [], []
+    for by_right in data.values():
+        cc_events += simulate_covered_calls(by_right.get('C', []), params)
+        pcs_events += simulate_put_spreads(by_right.get('P', []), params)
+    events = sorted(cc_events + pcs_events, key=lambda e: e[0])
+    pnl = np.array([e[1] for e in events], dtype=float) * MULTIPLIER
+    equity = np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:]
+    max_drawdown = float(np.max(peak - equity)) if len(equity) else 0.0
+    return BacktestResult(
+        params=dict(params),
+        pnl=float(equity[-1]) if len(equity) else 0.0,
+        max_drawdown=max_drawdown,
+        trades=sum(e[2] for e in events),
+        cc_pnl=sum(e[1] for e in cc_events) * MULTIPLIER,
+        pcs_pnl=sum(e[1] for e in pcs_events) * MULTIPLIER,
+    )
+
+
+def param_grid(grid: dict = None) -> List[dict]:
+    grid = grid or SWEEP_GRID
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def sample_params(count: int, grid: dict = None, seed: Optional[int] = None) -> List[dict]:
+    """从网格中不放回随机抽取 count 组"""
+    combos = param_grid(grid)
+    if count >= len(combos):
+        return combos
+    rng = np.random.default_rng(seed)
+    return [combos[i] for i in sorted(rng.choice(len(combos), size=count, replace=False))]
+
+
+def rank_results(results) -> List[BacktestResult]:
+    """按总盈亏降序，同盈亏时回撤小的在前"""
+    return sorted(results, key=lambda r: (-r.pnl, r.max_drawdown))
+
+
+# --- 进程池：每个工作进程在初始化时自行 memmap 同一份数据，参数组只传字典 ---
+_worker_data = None
+
+
+def _init_worker(root, symbols, days):
+    global _worker_data
+    _worker_data = load_snapshots(ChainStore(root), symbols, days)
+
+
+def _evaluate_in_worker(params):
+    return evaluate(params, _worker_data)
+
+
+def run_sweep(param_sets: List[dict], root=CHAIN_STORE_DIR, symbols=None, days: Optional[int] = None,
+              workers: Optional[int] = None) -> List[BacktestResult]:
+    """在 ProcessPoolExecutor (默认每核一个进程) 上评估所有参数组，返回排名后的结果"""
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(param_sets) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(str(root), symbols, days)) as pool:
+        results = list(pool.map(_evaluate_in_worker, param_sets, chunksize=chunksize))
+    return rank_results(results)
+
+
+def save_results(results: List[BacktestResult], path=BACKTEST_RESULTS_PATH, meta: dict = None):
+    payload = {
+        'generated_at': datetime.utcnow().isoformat(),
+        **(meta or {}),
+        'results': [dict(rank=i + 1, **r.to_dict()) for i, r in enumerate(results)],
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+
+
+def load_results(path=BACKTEST_RESULTS_PATH) -> List[dict]:
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def adopt(mode: str, path=BACKTEST_RESULTS_PATH, rank: int = 1) -> dict:
+    """把排名第 rank 的参数写入 learned_config 的 mode 段"""
+    results = load_results(path)
+    chosen = next((r for r in results if r['rank'] == rank), None)
+    if chosen is None:
+        raise ValueError(f"{path} 中没有排名 {rank} 的结果")
+    save_learned_config(mode, chosen['params'])
+    return chosen['params']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep strategy parameters over recorded option-chain snapshots')
+    parser.add_argument('--symbols', nargs='*', help='Symbols to replay (default: every symbol in the chain store)')
+    parser.add_argument('--days', type=int, help='Only use the most recent N recorded days')
+    parser.add_argument('--samples', type=int, help='Random sweep: evaluate N parameter sets drawn from the grid')
+    parser.add_argument('--seed', type=int, help='Seed for --samples')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per core)')
+    parser.add_argument('--store', default=str(CHAIN_STORE_DIR), help='Chain store directory')
+    parser.add_argument('--output', default=str(BACKTEST_RESULTS_PATH), help='Where to write the ranked results')
+    parser.add_argument('--top', type=int, default=10, help='Print the top N results')
+    parser.add_argument('--adopt', choices=list(STRATEGY_MODES.keys()), metavar='MODE',
+                        help='Save the best parameter set to learned_config.json for MODE')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    param_sets = sample_params(args.samples, seed=args.seed) if args.samples else param_grid()
+    started = time.perf_counter()
+    results = run_sweep(param_sets, args.store, args.symbols, args.days, args.workers)
+    elapsed = time.perf_counter() - started
+    logger.info(f"📈 回测完成: {len(results)} 组参数, 耗时 {elapsed:.1f}s")
+    save_results(results, args.output, {'symbols': args.symbols, 'days': args.days})
+
+    for i, r in enumerate(results[:args.top], 1):
+        print(f"#{i:<3} PnL ${r.pnl:>10,.2f}  回撤 ${r.max_drawdown:>9,.2f}  成交 {r.trades:>4}  {json.dumps(r.params)}")
+
+    if args.adopt and results:
+        params = adopt(args.adopt, args.output)
+        logger.info(f"✨ 已将最优参数写入 learned_config ({args.adopt}): {params}")
+
+
+if __name__ == '__main__':
+    main()
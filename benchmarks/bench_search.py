@@ -0,0 +1,112 @@
+"""
+合约搜索路径的基准测试 (合成期权链)。
+
+    pytest benchmarks/ -q
+
+每个用例记录墙钟时间、IB 请求数、往返次数与 tracemalloc 峰值内存，
+结果写入 benchmarks/results/<git revision>.json，并与上一次 latest.json 对比。
+"""
+import time
+import tracemalloc
+
+import pytest
+from ib_insync import Index, Option
+
+from market_data import count_requests
+from options_lookup import is_contract_liquid, search_contract_by_delta, select_put_spread_legs
+from spread_optimizer import select_put_spread
+from synthetic_chain import SyntheticChainIB
+
+STRATEGIES = ('scan', 'model', 'bisect')
+# (行权价步长, 链半宽)：SPX 5 点步长 ±50% ≈ 2000 个行权价；1 点步长 ≈ 10000 个
+CHAIN_SIZES = {'small': (25.0, 0.2), 'spx': (5.0, 0.5), 'dense': (1.0, 0.5)}
+LATENCY = 0.002          # 每次往返 2ms
+PER_CONTRACT = 0.0001    # 每个合约 0.1ms
+
+
+def _underlying(ib):
+    index = Index(ib.symbol, 'CBOE', 'USD')
+    index.conId = 416904
+    return index
+
+
+async def _measure(record_result, case, strategy, ib, coro_factory):
+    tracemalloc.start()
+    started = time.perf_counter()
+    with count_requests() as counter:
+        outcome = await coro_factory()
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    round_trips = counter.pop('round_trips', 0)
+    record_result(
+        case=case, strategy=strategy, strikes=len(ib.strikes), wall_ms=wall * 1000,
+        ib_requests=sum(counter.values()), round_trips=round_trips, peak_kb=peak / 1024,
+    )
+    return outcome
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('size', list(CHAIN_SIZES))
+@pytest.mark.parametrize('strategy', STRATEGIES)
+async def test_find_contract_by_delta(record_result, size, strategy):
+    step, span = CHAIN_SIZES[size]
+    ib = SyntheticChainIB(strike_step=step, strike_span=span, latency=LATENCY, per_contract_latency=PER_CONTRACT)
+    underlying = _underlying(ib)
+    expiry = ib.expirations[1]
+
+    result = await _measure(
+        record_result, 'find_by_delta', strategy, ib,
+        lambda: search_contract_by_delta(ib, underlying, expiry, 0.07, 'P', mode=strategy),
+    )
+    assert result.contract is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('strategy', STRATEGIES)
+async def test_find_contract_with_missing_greeks(record_result, strategy):
+    ib = SyntheticChainIB(strike_step=5.0, missing_greeks=0.3, latency=LATENCY, per_contract_latency=PER_CONTRACT)
+    underlying = _underlying(ib)
+
+    result = await _measure(
+        record_result, 'missing_greeks', strategy, ib,
+        lambda: search_contract_by_delta(ib, underlying, ib.expirations[0], 0.07, 'P', mode=strategy),
+    )
+    assert result.contract is not None
+
+
+@pytest.mark.asyncio
+async def test_is_contract_liquid(record_result):
+    ib = SyntheticChainIB(strike_step=5.0, latency=LATENCY, per_contract_latency=PER_CONTRACT)
+    contract = Option(ib.symbol, ib.expirations[0], 4800.0, 'P', 'SMART')
+    contract.conId = 1
+
+    async def check_many():
+        return [await is_contract_liquid(ib, contract) for _ in range(20)]
+
+    assert all(await _measure(record_result, 'is_liquid_x20', 'n/a', ib, check_many))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('strategy', STRATEGIES)
+async def test_spread_leg_selection(record_result, strategy):
+    ib = SyntheticChainIB(strike_step=5.0, latency=LATENCY, per_contract_latency=PER_CONTRACT)
+    underlying = _underlying(ib)
+
+    sell, buy = await _measure(
+        record_result, 'spread_legs', strategy, ib,
+        lambda: select_put_spread_legs(ib, underlying, ib.expirations[0], 0.07, 30, mode=strategy),
+    )
+    assert sell is not None and buy.strike == sell.strike - 30
+
+
+@pytest.mark.asyncio
+async def test_spread_joint_optimizer(record_result):
+    ib = SyntheticChainIB(strike_step=5.0, latency=LATENCY, per_contract_latency=PER_CONTRACT)
+    underlying = _underlying(ib)
+
+    pick = await _measure(
+        record_result, 'spread_legs', 'joint', ib,
+        lambda: select_put_spread(ib, underlying, ib.expirations[0], 0.07, 30),
+    )
+    assert pick is not None and 15 <= pick.width <= 45
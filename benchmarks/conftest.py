@@ -0,0 +1,88 @@
+import asyncio
+import json
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+try:
+    asyncio.get_event_loop()
+except RuntimeError:
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / 'results'
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+_results = []
+
+
+def pytest_collect_file(file_path, parent):
+    # bench_*.py 只在显式指定 benchmarks/ 时收集，避免拖慢默认的单元测试
+    if file_path.suffix == '.py' and file_path.name.startswith('bench_'):
+        targets = [Path(a.split('::')[0]).resolve() for a in parent.config.args]
+        if any(t == BENCH_DIR or BENCH_DIR in t.parents for t in targets):
+            return pytest.Module.from_parent(parent, path=file_path)
+    return None
+
+
+@pytest.fixture(autouse=True)
+def _cold_caches():
+    """每个用例都从冷缓存开始，请求数才可比"""
+    from contract_registry import registry
+    from market_data import ticker_cache
+    registry.clear()
+    ticker_cache.clear()
+    yield
+    registry.clear()
+    ticker_cache.clear()
+
+
+@pytest.fixture
+def record_result():
+    def _record(**row):
+        _results.append(row)
+    return _record
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return 'unknown'
+
+
+def _row_key(row):
+    return (row['case'], row['strategy'], row['strikes'])
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _results:
+        return
+    RESULTS_DIR.mkdir(exist_ok=True)
+    latest = RESULTS_DIR / 'latest.json'
+    previous, previous_revision = {}, None
+    if latest.exists():
+        old_payload = json.loads(latest.read_text())
+        previous = {_row_key(r): r for r in old_payload['results']}
+        previous_revision = old_payload['revision']
+
+    payload = {'revision': _git_revision(), 'timestamp': datetime.utcnow().isoformat(), 'results': _results}
+    text = json.dumps(payload, indent=2)
+    (RESULTS_DIR / f"{payload['revision']}.json").write_text(text)
+    latest.write_text(text)
+
+    lines = ['', f"benchmark results -> {RESULTS_DIR / (payload['revision'] + '.json')}"]
+    for row in _results:
+        line = (f"{row['case']:<14} {row['strategy']:<7} strikes={row['strikes']:<5} "
+                f"wall={row['wall_ms']:>8.1f}ms requests={row['ib_requests']:>4} "
+                f"round_trips={row['round_trips']:>3} peak={row['peak_kb']:>7.1f}KB")
+        old = previous.get(_row_key(row))
+        if old and old['wall_ms']:
+            line += f"  ({row['wall_ms'] / old['wall_ms'] - 1:+.0%} wall vs {previous_revision})"
+        lines.append(line)
+    session.config.get_terminal_writer().line('\n'.join(lines))
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+from ib_insync import OptionChain, OptionComputation, Ticker
+
+from pricing import bs_delta, bs_price, year_fraction
+
+
+def future_fridays(count, start=None):
+    start = start or datetime.now()
+    days_ahead = (4 - start.weekday()) % 7 or 7
+    first = start + timedelta(days=days_ahead)
+    return [(first + timedelta(weeks=i)).strftime('%Y%m%d') for i in range(count)]
+
+
+class SyntheticChainIB:
+    """
+    可配置规模的合成期权链，模拟 IB 的链查询/合约确认/行情接口。
+
+    - strikes: spot*(1±strike_span) 范围内步长 strike_step 的行权价
+    - latency: 每次往返的固定延迟；per_contract_latency: 每个合约额外延迟
+    - missing_greeks: 随机缺失 Greeks 的合约比例
+    """
+
+    def __init__(self, symbol='SPX', sec_type='IND', spot=5000.0, strike_step=5.0, strike_span=0.5,
+                 expirations=4, base_iv=0.18, skew=-0.6, spread_bps=300, missing_greeks=0.0,
+                 latency=0.0, per_contract_latency=0.0, seed=7):
+        self.symbol = symbol
+        self.sec_type = sec_type
+        self.spot = spot
+        lo, hi = spot * (1 - strike_span), spot * (1 + strike_span)
+        self.strikes = np.arange(np.ceil(lo / strike_step) * strike_step, hi + strike_step / 2, strike_step)
+        self.expirations = future_fridays(expirations)
+        self.base_iv = base_iv
+        self.skew = skew
+        self.spread_bps = spread_bps
+        self.latency = latency
+        self.per_contract_latency = per_contract_latency
+        rng = np.random.default_rng(seed)
+        self._missing = set(self.strikes[rng.random(len(self.strikes)) < missing_greeks].tolist())
+        self.requests = 0
+        self.round_trips = 0
+        self._next_con_id = 1000
+
+    def iv(self, strikes):
+        moneyness = np.log(np.asarray(strikes, dtype=float) / self.spot)
+        return np.maximum(self.base_iv + self.skew * moneyness, 0.05)
+
+    async def _round_trip(self, n):
+        self.requests += n
+        self.round_trips += 1
+        delay = self.latency + self.per_contract_latency * n
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def reqSecDefOptParamsAsync(self, symbol, exchange, sec_type, con_id):
+        await self._round_trip(1)
+        chain = OptionChain('SMART', con_id, symbol, '100', list(self.expirations), self.strikes.tolist())
+        return [chain, chain._replace(exchange='CBOE')]
+
+    async def qualifyContractsAsync(self, *contracts):
+        await self._round_trip(len(contracts))
+        for c in contracts:
+            if not c.conId:
+                self._next_con_id += 1
+                c.conId = self._next_con_id
+                c.localSymbol = f"{c.symbol} {c.lastTradeDateOrContractMonth} {c.strike}{c.right}"
+        return list(contracts)
+
+    async def reqTickersAsync(self, *contracts):
+        await self._round_trip(len(contracts))
+        return [self._ticker(c) for c in contracts]
+
+    def _ticker(self, contract):
+        if contract.secType != 'OPT':
+            return Ticker(contract=contract, bid=self.spot - 0.5, ask=self.spot + 0.5, bidSize=10, askSize=10,
+                          last=self.spot)
+        t = year_fraction(contract.lastTradeDateOrContractMonth)
+        iv = float(self.iv([contract.strike])[0])
+        price = float(bs_price(self.spot, [contract.strike], t, iv, contract.right)[0])
+        half_spread = max(price * self.spread_bps / 20000, 0.025)
+        greeks = None
+        if contract.strike not in self._missing:
+            delta = float(bs_delta(self.spot, [contract.strike], t, iv, contract.right)[0])
+            greeks = OptionComputation(0, iv, delta, price, 0, 0, 0, 0, self.spot)
+        bid = max(price - half_spread, 0.0)
+        return Ticker(contract=contract, bid=bid, ask=price + half_spread, bidSize=10, askSize=10, close=price,
+                      modelGreeks=greeks)
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pytz
+
+from config import CHAIN_STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+EASTERN = pytz.timezone('US/Eastern')
+
+# 每列一个只追加的原始二进制文件 (小端、无文件头)，可直接 np.memmap 零拷贝读取
+COLUMNS = {
+    'ts': '<f8',            # UTC epoch 秒
+    'underlying': '<f8',
+    'expiry': '<i4',        # YYYYMMDD
+    'strike': '<f8',
+    'right': 'u1',          # ord('C') / ord('P')
+    'bid': '<f4',
+    'ask': '<f4',
+    'iv': '<f4',
+    'delta': '<f4',         # |Delta|
+}
+
+
+class ChainColumns(NamedTuple):
+    ts: np.ndarray
+    underlying: np.ndarray
+    expiry: np.ndarray
+    strike: np.ndarray
+    right: np.ndarray
+    bid: np.ndarray
+    ask: np.ndarray
+    iv: np.ndarray
+    delta: np.ndarray
+
+    def __len__(self):
+        return len(self.ts)
+
+
+def _column_paths(partition: Path) -> dict:
+    return {name: partition / f'{name}.bin' for name in COLUMNS}
+
+
+def _committed_rows(paths: dict) -> int:
+    """各列都完整写入的行数 (写入中途崩溃时各列长度可能不一致，以最短列为准)"""
+    return min(
+        (os.path.getsize(p) if p.exists() else 0) // np.dtype(COLUMNS[name]).itemsize
+        for name, p in paths.items()
+    )
+
+
+class ChainStore:
+    """
+    期权链截面的列式存储：按 <root>/<symbol>/<美东日期>/<列名>.bin 分区，只追加写入，
+    读取时每列 np.memmap 映射，一天的 SPX 链无需拷贝即可整体分析。
+    """
+
+    def __init__(self, root=CHAIN_STORE_DIR):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def _partition(self, symbol: str, day: date) -> Path:
+        return self.root / symbol.upper() / day.strftime('%Y%m%d')
+
+    def append(self, snapshot) -> int:
+        """写入一个 ChainSnapshot，返回写入的行数"""
+        n = len(snapshot.strikes)
+        if not n:
+            return 0
+        taken_at = snapshot.taken_at
+        if taken_at.tzinfo is None:
+            taken_at = taken_at.astimezone()
+        day = taken_at.astimezone(EASTERN).date()
+        values = {
+            'ts': np.full(n, taken_at.timestamp()),
+            'underlying': np.full(n, snapshot.underlying_price),
+            'expiry': np.full(n, int(snapshot.expiry)),
+            'strike': snapshot.strikes,
+            'right': np.full(n, ord(snapshot.right)),
+            'bid': snapshot.bids,
+            'ask': snapshot.asks,
+            'iv': snapshot.ivs,
+            'delta': snapshot.deltas,
+        }
+        partition = self._partition(snapshot.symbol, day)
+        # 多列文件必须整体追加，否则行会错位
+        with self._lock:
+            partition.mkdir(parents=True, exist_ok=True)
+            paths = _column_paths(partition)
+            # 上次写入中途中断留下的多余尾部先截掉，新行从各列共同的行数处接着写
+            rows = _committed_rows(paths)
+            for name, path in paths.items():
+                size = rows * np.dtype(COLUMNS[name]).itemsize
+                if path.exists() and os.path.getsize(path) > size:
+                    logger.warning(f"截面存储 {path} 有未完成的写入，截断到 {rows} 行")
+                    os.truncate(path, size)
+            for name, dtype in COLUMNS.items():
+                with open(paths[name], 'ab') as f:
+                    f.write(np.ascontiguousarray(values[name], dtype=dtype).tobytes())
+        return n
+
+    def days(self, symbol: str) -> List[str]:
+        base = self.root / symbol.upper()
+        if not base.exists():
+            return []
+        return sorted(p.name for p in base.iterdir() if p.is_dir())
+
+    def load_day(self, symbol: str, day) -> Optional[ChainColumns]:
+        """按日读取 (只读 memmap)；day 为 date 或 'YYYYMMDD'"""
+        if isinstance(day, (date, datetime)):
+            day = day.strftime('%Y%m%d')
+        partition = self.root / symbol.upper() / day
+        if not partition.exists():
+            return None
+        paths = _column_paths(partition)
+        rows = _committed_rows(paths)
+        columns = {}
+        for name, path in paths.items():
+            dtype = np.dtype(COLUMNS[name])
+            if rows == 0:
+                columns[name] = np.empty(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+        return ChainColumns(**columns)
+
+
+_store: Optional[ChainStore] = None
+_pending = set()
+
+
+def install(store: ChainStore = None) -> ChainStore:
+    """启用截面落盘，之后 record() 写入该存储"""
+    global _store
+    _store = store or ChainStore()
+    return _store
+
+
+def uninstall():
+    global _store
+    _store = None
+
+
+def get_store() -> Optional[ChainStore]:
+    return _store
+
+
+def record(snapshot):
+    """后台线程写入一个截面 (未 install 或截面为空时忽略)，不阻塞调用方"""
+    if _store is None or snapshot is None or not len(snapshot.strikes):
+        return
+    store = _store
+
+    async def write():
+        try:
+            await asyncio.to_thread(store.append, snapshot)
+        except Exception as exc:
+            logger.warning(f"期权链截面写入失败 ({snapshot.symbol} {snapshot.expiry}): {exc}")
+
+    task = asyncio.ensure_future(write())
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+async def flush():
+    """等待已提交的截面全部写完"""
+    if _pending:
+        await asyncio.gather(*list(_pending), return_exceptions=True)
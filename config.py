@@ -1,9 +1,22 @@
+import fcntl
 import json
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Mapping
 from pathlib import Path
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / 'strategy_data.db'
 LEARNED_CONFIG_PATH = BASE_DIR / 'learned_config.json'
+# 期权链截面列式存储 (chain_store.py)，按 标的/日期 分区
+CHAIN_STORE_DIR = BASE_DIR / 'chain_store'
+# backtest.py 参数扫描的排名结果
+BACKTEST_RESULTS_PATH = BASE_DIR / 'backtest_results.json'
 
 DEFAULTS = {
     'CC_DELTA_TARGET': 0.15,
@@ -27,6 +40,32 @@ STRATEGY_MODES = {
 
 DEFAULT_MODE = 'base'
 
+# VIX 节流：高于 VIX_ELEVATED 时 Covered Call 目标 Delta 乘以 ELEVATED_DELTA_SCALE，
+# 高于 VIX_PANIC 时暂停开新 Put Credit Spread
+VIX_ELEVATED = 30
+VIX_PANIC = 40
+ELEVATED_DELTA_SCALE = 0.8
+# 波动率环境服务 (vix_monitor.VolRegimeService)：VIX EWMA 半衰期 (秒)；降级所需的回差 (VIX 点)；
+# (VIX3M - VIX9D) / VIX 低于该斜率视为期限结构倒挂，按高波动处理
+VIX_EWMA_HALFLIFE = 900
+VIX_HYSTERESIS = 2.0
+VIX_INVERSION_SLOPE = 0.0
+
+# 每轮策略同时在途的候选标的数上限 (限制 IB 请求并发)
+CANDIDATE_CONCURRENCY = 4
+
+# Rolling 时并发评估的到期日 (距下一个周五的周数偏移)
+ROLL_EXPIRY_WEEKS = (1, 2, 3)
+
+# market_snapshots 保留策略：原始记录保留 7 天，小时 OHLC 保留 90 天，日 OHLC 永久保留
+RETENTION_RAW_DAYS = 7
+RETENTION_HOURLY_DAYS = 90
+RETENTION_INTERVAL = 3600  # 后台保留任务的运行间隔 (秒)
+
+# 财报日历：设置后从本地 CSV/ICS 文件读取 (离线)，否则在线查询 yfinance；预取线程池大小
+EARNINGS_FILE = os.environ.get('EARNINGS_FILE') or None
+EARNINGS_PREFETCH_WORKERS = 4
+
 
 def _build_mode_params(mode):
     params = DEFAULTS.copy()
@@ -36,29 +75,131 @@ def _build_mode_params(mode):
     return params
 
 
-def load_parameters(mode: str = None):
-    mode = mode or DEFAULT_MODE
-    params = _build_mode_params(mode)
-    if LEARNED_CONFIG_PATH.exists():
-        try:
-            with LEARNED_CONFIG_PATH.open() as f:
-                learned = json.load(f)
-            mode_updates = learned.get(mode, {})
-            params.update({k: v for k, v in mode_updates.items() if k in params})
-        except Exception:
-            pass
-    return params
+class Parameters(Mapping):
+    """某个模式的不可变参数视图；version 为 learned_config.json 的写入版本号 (文件不存在为 0)"""
+
+    def __init__(self, data: dict, mode: str, version: int):
+        self._data = MappingProxyType(dict(data))
+        self.mode = mode
+        self.version = version
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"Parameters({self.mode!r}, v{self.version}, {dict(self._data)})"
 
 
-def save_learned_config(mode: str, params: dict):
-    LEARNED_CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    data = {}
-    if LEARNED_CONFIG_PATH.exists():
+class ParameterStore:
+    """
+    learned_config.json 的读写入口：
+    - 读取按 (inode, mtime, size) 缓存解析结果，文件未变时只需一次 stat；文件变化后下次读取即热加载
+    - 写入在文件锁内读-改-写，先写临时文件再 rename 原子替换，读者不会看到半个文件
+    - 文件内 _version 每次写入加一，多个进程据此判断看到的是否为同一版本
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._key = None
+        self._learned = {}
+        self._version = 0
+        self._params = {}
+
+    @property
+    def path(self) -> Path:
+        # 未指定时每次取模块级 LEARNED_CONFIG_PATH (便于测试替换)
+        return Path(self._path or LEARNED_CONFIG_PATH)
+
+    def _refresh(self):
+        path = self.path
         try:
-            with LEARNED_CONFIG_PATH.open('r') as f:
-                data = json.load(f)
-        except Exception:
-            data = {}
-    data.setdefault(mode, {}).update(params)
-    with LEARNED_CONFIG_PATH.open('w') as f:
-        json.dump(data, f, indent=2)
+            st = path.stat()
+            key = (str(path), st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            key = (str(path), None)
+        with self._lock:
+            if key == self._key:
+                return
+            if key[1] is None:
+                learned, version = {}, 0
+            else:
+                try:
+                    with path.open() as f:
+                        data = json.load(f)
+                    learned = {k: v for k, v in data.items() if not k.startswith('_')}
+                    version = int(data.get('_version', 0))
+                except Exception as exc:
+                    # 保留上一份有效内容，不静默回退到默认值
+                    logger.warning(f"读取 {path} 失败，继续使用版本 v{self._version}: {exc}")
+                    return
+            self._key, self._learned, self._version, self._params = key, learned, version, {}
+
+    @property
+    def version(self) -> int:
+        self._refresh()
+        return self._version
+
+    def learned(self, mode: str) -> dict:
+        self._refresh()
+        return dict(self._learned.get(mode, {}))
+
+    def get(self, mode: str = None) -> Parameters:
+        """文件未变化时返回同一个对象；文件重新加载后返回新对象 (手工编辑时 version 可能不变)"""
+        mode = mode or DEFAULT_MODE
+        self._refresh()
+        with self._lock:
+            params = self._params.get(mode)
+            if params is None:
+                merged = _build_mode_params(mode)
+                merged.update({k: v for k, v in self._learned.get(mode, {}).items() if k in merged})
+                params = self._params[mode] = Parameters(merged, mode, self._version)
+            return params
+
+    def save(self, mode: str, params: dict) -> int:
+        """合并写入 mode 段，返回新版本号"""
+        path = self.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_name(path.name + '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                data = {}
+                if path.exists():
+                    try:
+                        with path.open() as f:
+                            data = json.load(f)
+                    except Exception as exc:
+                        logger.warning(f"{path} 无法解析，将被覆盖: {exc}")
+                data.setdefault(mode, {}).update(params)
+                data['_version'] = int(data.get('_version', 0)) + 1
+                fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(data, f, indent=2)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp, path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._refresh()
+        return data['_version']
+
+
+parameter_store = ParameterStore()
+
+
+def load_parameters(mode: str = None) -> Parameters:
+    return parameter_store.get(mode)
+
+
+def save_learned_config(mode: str, params: dict) -> int:
+    return parameter_store.save(mode, params)
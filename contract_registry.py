@@ -0,0 +1,156 @@
+import json
+import logging
+from datetime import datetime, timedelta
+
+import pytz
+from ib_insync import OptionChain, util
+
+from data_logger import delete_registry_entries, load_registry_entries, save_registry_entries
+from market_data import note_request
+from utils import now
+
+logger = logging.getLogger(__name__)
+
+CHAIN_TTL = timedelta(hours=12)
+CONTRACT_TTL = timedelta(days=7)
+
+# 只缓存这些可由 IB 回填的标量字段，用于在命中时原地补全调用方的合约对象
+_CONTRACT_FIELDS = (
+    'secType', 'conId', 'symbol', 'lastTradeDateOrContractMonth', 'strike', 'right', 'multiplier',
+    'exchange', 'primaryExchange', 'currency', 'localSymbol', 'tradingClass',
+)
+
+
+def _today():
+    return now(pytz.timezone('US/Eastern')).strftime('%Y%m%d')
+
+
+def _chain_key(underlying):
+    return f"chain|{underlying.symbol}|{underlying.secType}|{underlying.conId}"
+
+
+def _contract_key(contract):
+    return "contract|" + "|".join(str(getattr(contract, f) or '') for f in (
+        'secType', 'symbol', 'lastTradeDateOrContractMonth', 'strike', 'right', 'exchange', 'currency',
+    ))
+
+
+class ContractRegistry:
+    """
+    期权链参数与已确认 conId 的缓存。
+    内存常驻，warm_start() 之后同时持久化到 SQLite 的 contract_registry 表。
+    过期规则：超过 TTL，或链中最早到期日/合约到期日已过 (到期日滚动)。
+    """
+
+    def __init__(self, chain_ttl=CHAIN_TTL, contract_ttl=CONTRACT_TTL):
+        self.chain_ttl = chain_ttl
+        self.contract_ttl = contract_ttl
+        self.persistent = False
+        self._chains = {}      # key -> ([OptionChain], fetched_at)
+        self._contracts = {}   # key -> (field dict, fetched_at)
+
+    def clear(self):
+        self._chains.clear()
+        self._contracts.clear()
+        self.persistent = False
+
+    async def warm_start(self):
+        """从 SQLite 载入未过期的条目，并开启持久化"""
+        rows = await load_registry_entries()
+        stale = []
+        for key, kind, payload, fetched_at in rows:
+            fetched = datetime.fromisoformat(fetched_at)
+            data = json.loads(payload)
+            if kind == 'chain':
+                entry = ([OptionChain(**c) for c in data], fetched)
+                target = self._chains
+            else:
+                entry = (data, fetched)
+                target = self._contracts
+            if self._is_fresh(kind, entry):
+                target[key] = entry
+            else:
+                stale.append(key)
+        if stale:
+            await delete_registry_entries(stale)
+        self.persistent = True
+        logger.info(f"♻️ 合约注册表预热: {len(self._chains)} 条期权链, {len(self._contracts)} 个合约, 清理 {len(stale)} 条过期")
+
+    def _is_fresh(self, kind, entry):
+        value, fetched = entry
+        today = _today()
+        if kind == 'chain':
+            if datetime.utcnow() - fetched >= self.chain_ttl:
+                return False
+            return all(not c.expirations or min(c.expirations) >= today for c in value)
+        if datetime.utcnow() - fetched >= self.contract_ttl:
+            return False
+        expiry = value.get('lastTradeDateOrContractMonth')
+        return not expiry or expiry[:8] >= today
+
+    async def _persist(self, entries):
+        if not self.persistent or not entries:
+            return
+        try:
+            await save_registry_entries(entries)
+        except Exception as exc:
+            logger.warning(f"写入合约注册表失败: {exc}")
+
+    async def get_option_chains(self, ib, underlying):
+        """reqSecDefOptParamsAsync 的缓存版本"""
+        key = _chain_key(underlying)
+        entry = self._chains.get(key)
+        if entry and self._is_fresh('chain', entry):
+            return entry[0]
+
+        note_request('contract_details')
+        chains = await ib.reqSecDefOptParamsAsync(underlying.symbol, '', underlying.secType, underlying.conId)
+        if chains:
+            fetched = datetime.utcnow()
+            chains = [
+                OptionChain(c.exchange, c.underlyingConId, c.tradingClass, c.multiplier,
+                            sorted(c.expirations), sorted(c.strikes))
+                for c in chains
+            ]
+            self._chains[key] = (chains, fetched)
+            if self.persistent:
+                payload = json.dumps([c._asdict() for c in chains])
+                await self._persist([(key, 'chain', payload, fetched.isoformat())])
+        return chains
+
+    async def qualify(self, ib, *contracts):
+        """
+        qualifyContractsAsync 的缓存版本：命中时原地回填 conId 等字段，
+        未命中的合约一次性批量向 IB 确认。返回成功确认的合约 (保持输入顺序)。
+        """
+        misses = []
+        for contract in contracts:
+            entry = self._contracts.get(_contract_key(contract))
+            if entry and self._is_fresh('contract', entry):
+                for field, value in entry[0].items():
+                    setattr(contract, field, value)
+            else:
+                misses.append(contract)
+
+        if misses:
+            keys = [_contract_key(c) for c in misses]
+            note_request('contract_details', len(misses))
+            qualified = await ib.qualifyContractsAsync(*misses)
+            fetched = datetime.utcnow()
+            ok = {id(c) for c in qualified}
+            entries = []
+            for key, contract in zip(keys, misses):
+                if id(contract) not in ok or not contract.conId:
+                    continue
+                fields = util.dataclassNonDefaults(contract)
+                data = {f: fields[f] for f in _CONTRACT_FIELDS if f in fields}
+                self._contracts[key] = (data, fetched)
+                if self.persistent:
+                    entries.append((key, 'contract', json.dumps(data), fetched.isoformat()))
+            await self._persist(entries)
+            miss_ids = {id(c) for c in misses}
+            return [c for c in contracts if id(c) not in miss_ids or id(c) in ok]
+        return list(contracts)
+
+
+registry = ContractRegistry()
@@ -1,9 +1,22 @@
 import asyncio
+import logging
+import re
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from config import DB_PATH
 
+logger = logging.getLogger(__name__)
+
+# 写入队列攒批：满 BATCH_SIZE 条或距首条入队 FLUSH_INTERVAL 秒即提交一个事务
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 0.5
+
+# trade_stats 中 Delta 指数加权均值的平滑系数 (写入触发器，修改需新增迁移)
+STATS_EWMA_ALPHA = 0.1
+
 TRADES_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS trades (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -36,9 +49,26 @@ CREATE TABLE IF NOT EXISTS earnings_cache (
 )
 """
 
+CONTRACT_REGISTRY_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS contract_registry (
+    cache_key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    fetched_at TEXT NOT NULL
+)
+"""
+
+SCHEMA_VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+)
+"""
+
 INSERT_TRADE_SQL = """
-INSERT INTO trades (timestamp, trade_type, symbol, action, quantity, price, delta, notes)
-VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+INSERT INTO trades (timestamp, trade_type, symbol, action, quantity, price, delta, notes, local_symbol, vix, mode)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 """
 
 INSERT_MARKET_SQL = """
@@ -46,54 +76,357 @@ INSERT INTO market_snapshots (timestamp, symbol, value, notes)
 VALUES (?, ?, ?, ?)
 """
 
+UPSERT_EARNINGS_SQL = """
+INSERT INTO earnings_cache (symbol, earnings_dates, fetched_at) VALUES (?, ?, ?)
+ON CONFLICT(symbol) DO UPDATE SET earnings_dates=excluded.earnings_dates, fetched_at=excluded.fetched_at
+"""
 
-def _init_db():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+UPSERT_REGISTRY_SQL = """
+INSERT INTO contract_registry (cache_key, kind, payload, fetched_at) VALUES (?, ?, ?, ?)
+ON CONFLICT(cache_key) DO UPDATE SET kind=excluded.kind, payload=excluded.payload, fetched_at=excluded.fetched_at
+"""
+
+DELETE_REGISTRY_SQL = "DELETE FROM contract_registry WHERE cache_key = ?"
+
+
+# --- Schema 迁移：按版本号顺序执行，每个迁移一个事务，已执行的记录在 schema_version ---
+
+def _migration_base_tables(conn):
+    # 迁移框架之前的库已有这些表，CREATE IF NOT EXISTS 保证可重复执行
     conn.execute(TRADES_TABLE_SQL)
     conn.execute(MARKET_TABLE_SQL)
     conn.execute(EARNINGS_CACHE_TABLE_SQL)
-    conn.commit()
-    conn.close()
+    conn.execute(CONTRACT_REGISTRY_TABLE_SQL)
 
 
-def _log_trade_sync(trade_type, symbol, action, quantity, price, delta, notes):
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(INSERT_TRADE_SQL, (
-        datetime.utcnow().isoformat(),
-        trade_type,
-        symbol,
-        action,
-        quantity,
-        price,
-        delta,
-        notes
-    ))
+def _migration_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_type_ts ON trades (trade_type, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol_ts ON trades (symbol, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_symbol_ts ON market_snapshots (symbol, timestamp)")
+
+
+_NOTES_LOCAL_SYMBOL = (
+    re.compile(r'Contract: (.+?), VIX:'),
+    re.compile(r'From .+? to (.+?)(?:, Net:|$)'),
+    re.compile(r'Emergency liquidation of (.+)$'),
+)
+_NOTES_VIX = re.compile(r'VIX: ([0-9.]+)')
+
+
+def parse_trade_notes(notes):
+    """从历史 notes 文本中提取 (local_symbol, vix)，提取不到的为 None"""
+    if not notes:
+        return None, None
+    local_symbol = None
+    for pattern in _NOTES_LOCAL_SYMBOL:
+        match = pattern.search(notes)
+        if match:
+            local_symbol = match.group(1).strip() or None
+            break
+    vix = _NOTES_VIX.search(notes)
+    return local_symbol, float(vix.group(1)) if vix else None
+
+
+def _migration_typed_trade_columns(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+    if 'local_symbol' not in columns:
+        conn.execute("ALTER TABLE trades ADD COLUMN local_symbol TEXT")
+    if 'vix' not in columns:
+        conn.execute("ALTER TABLE trades ADD COLUMN vix REAL")
+    rows = conn.execute("SELECT id, notes FROM trades WHERE notes IS NOT NULL").fetchall()
+    updates = [(*parse_trade_notes(notes), row_id) for row_id, notes in rows]
+    conn.executemany(
+        "UPDATE trades SET local_symbol = COALESCE(local_symbol, ?), vix = COALESCE(vix, ?) WHERE id = ?",
+        [u for u in updates if u[0] is not None or u[1] is not None]
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_local_symbol ON trades (local_symbol)")
+
+
+def _migration_rollups(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS market_rollups (
+            symbol TEXT NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (symbol, resolution, bucket_start)
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS retention_state (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+
+TRADE_STATS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS trade_stats (
+    trade_type TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    mean REAL NOT NULL,
+    m2 REAL NOT NULL,
+    ewma REAL NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (trade_type, mode)
+)
+"""
+
+# 每插入一条带 Delta 的成交即按 Welford 算法更新 (count, mean, m2) 与 EWMA，
+# 与成交记录在同一事务内完成；DO UPDATE 中的列名均为更新前的旧值
+TRADE_STATS_TRIGGER_SQL = f"""
+CREATE TRIGGER IF NOT EXISTS trg_trade_stats AFTER INSERT ON trades
+WHEN NEW.delta IS NOT NULL
+BEGIN
+    INSERT INTO trade_stats (trade_type, mode, count, mean, m2, ewma, updated_at)
+    VALUES (NEW.trade_type, COALESCE(NEW.mode, ''), 1, NEW.delta, 0.0, NEW.delta, NEW.timestamp)
+    ON CONFLICT(trade_type, mode) DO UPDATE SET
+        count = count + 1,
+        mean = mean + (NEW.delta - mean) / (count + 1),
+        m2 = m2 + (NEW.delta - mean) * (NEW.delta - (mean + (NEW.delta - mean) / (count + 1))),
+        ewma = ewma + {STATS_EWMA_ALPHA} * (NEW.delta - ewma),
+        updated_at = NEW.timestamp;
+END
+"""
+
+
+def _migration_trade_stats(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(trades)")}
+    if 'mode' not in columns:
+        conn.execute("ALTER TABLE trades ADD COLUMN mode TEXT")
+    conn.execute(TRADE_STATS_TABLE_SQL)
+    # 已有成交按时间顺序回放一遍得到初始汇总 (历史记录没有 mode，归入 '')
+    stats = {}
+    for trade_type, mode, delta, timestamp in conn.execute(
+        "SELECT trade_type, COALESCE(mode, ''), delta, timestamp FROM trades WHERE delta IS NOT NULL ORDER BY id"
+    ):
+        count, mean, m2, ewma, _ = stats.get((trade_type, mode), (0, 0.0, 0.0, delta, None))
+        count += 1
+        diff = delta - mean
+        mean += diff / count
+        m2 += diff * (delta - mean)
+        ewma += STATS_EWMA_ALPHA * (delta - ewma)
+        stats[(trade_type, mode)] = (count, mean, m2, ewma, timestamp)
+    conn.executemany(
+        "INSERT OR REPLACE INTO trade_stats (trade_type, mode, count, mean, m2, ewma, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(*key, *values) for key, values in stats.items()]
+    )
+    conn.execute(TRADE_STATS_TRIGGER_SQL)
+
+
+MIGRATIONS = [
+    (1, 'base tables', _migration_base_tables),
+    (2, 'indexes on (trade_type, timestamp) and (symbol, timestamp)', _migration_indexes),
+    (3, 'typed trades.local_symbol / trades.vix backfilled from notes', _migration_typed_trade_columns),
+    (4, 'market_rollups (hourly/daily OHLC) and retention_state', _migration_rollups),
+    (5, 'trades.mode and trade_stats running aggregates kept by trigger', _migration_trade_stats),
+]
+
+
+def schema_version(conn) -> int:
+    conn.execute(SCHEMA_VERSION_TABLE_SQL)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn, migrations=None) -> int:
+    """把数据库升级到最新版本，返回执行的迁移数"""
+    migrations = sorted(migrations or MIGRATIONS)
+    current = schema_version(conn)
     conn.commit()
-    conn.close()
+    applied = 0
+    for version, description, apply in migrations:
+        if version <= current:
+            continue
+        with conn:
+            apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.utcnow().isoformat())
+            )
+        logger.info(f"🗄️ 数据库迁移 v{version}: {description}")
+        applied += 1
+    return applied
 
 
-def _log_market_sync(symbol, value, notes):
+def _init_db():
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
-    conn.execute(INSERT_MARKET_SQL, (
-        datetime.utcnow().isoformat(),
-        symbol,
-        value,
-        notes
-    ))
-    conn.commit()
+    # 新建库启用增量 VACUUM，保留策略删除的页可逐步归还给文件系统 (对已有库不生效)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL：写入不阻塞读取，journal_mode 会持久化在数据库文件中
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrate(conn)
     conn.close()
 
 
-def _get_cached_earnings_sync(symbol, max_age_days):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
+class _Connection:
+    """独占一个线程的长连接：sqlite3 连接只在该线程内使用"""
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-reader' if readonly else 'sqlite-writer')
+
+    def _call(self, fn, args):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            if not self.readonly:
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+        return fn(self._conn, *args)
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, args)
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close).result()
+        self._executor.shutdown(wait=True)
+
+
+def _write_batch(conn, batch):
+    with conn:
+        for sql, rows in batch:
+            conn.executemany(sql, rows)
+
+
+class DbWriter:
+    """
+    长驻写入任务：持有唯一的 WAL 写连接，从 asyncio 队列中攒批，
+    每批在一个事务中提交。调用方入队即返回，不再为每条记录开关连接、跳一次线程池。
+    """
+
+    def __init__(self, path, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.loop = asyncio.get_running_loop()
+        self._conn = _Connection(path)
+        self._queue = asyncio.Queue()
+        self._task = None
+        self.stats = {'rows': 0, 'batches': 0, 'errors': 0}
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, sql, rows):
+        self._queue.put_nowait((sql, list(rows)))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def flush(self):
+        """等待此前入队的写入全部提交"""
+        if self._task is None or self._task.done():
+            return
+        marker = self.loop.create_future()
+        self._queue.put_nowait(marker)
+        await marker
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._queue.put_nowait(None)
+            await self._task
+        self._conn.close()
+
+    async def _next(self, timeout):
+        if timeout <= 0:
+            return self._queue.get_nowait()
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            items = [first]
+            deadline = time.monotonic() + self.flush_interval
+            # 攒批直到满额、超时、遇到 flush/关闭标记
+            while len(items) < self.batch_size and isinstance(items[-1], tuple):
+                try:
+                    items.append(await self._next(deadline - time.monotonic()))
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+            batch = [i for i in items if isinstance(i, tuple)]
+            if batch:
+                await self._commit(batch)
+            for item in items:
+                if item is None:
+                    stopping = True
+                elif isinstance(item, asyncio.Future) and not item.done():
+                    item.set_result(None)
+            if stopping:
+                # 关闭前把标记之后仍在队列中的写入一并提交
+                rest = []
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if isinstance(item, tuple):
+                        rest.append(item)
+                    elif isinstance(item, asyncio.Future) and not item.done():
+                        item.set_result(None)
+                if rest:
+                    await self._commit(rest)
+
+    async def _commit(self, batch):
+        """整批一个事务提交；失败时逐组各自重试，只丢弃出错的那一组"""
+        try:
+            await self._conn.run(_write_batch, batch)
+            self.stats['rows'] += sum(len(rows) for _, rows in batch)
+            self.stats['batches'] += 1
+            return
+        except Exception as exc:
+            logger.warning(f"SQLite 批量写入失败 ({len(batch)} 组)，逐组重试: {exc}")
+        for sql, rows in batch:
+            try:
+                await self._conn.run(_write_batch, [(sql, rows)])
+                self.stats['rows'] += len(rows)
+                self.stats['batches'] += 1
+            except Exception as exc:
+                self.stats['errors'] += 1
+                logger.error(f"SQLite 写入失败，丢弃 {len(rows)} 行 ({sql.split('(')[0].strip()}): {exc}")
+
+
+_writer = None
+_reader = None
+
+
+def _get_writer() -> DbWriter:
+    """当前事件循环、当前 DB_PATH 下的写入任务 (首次使用时创建)"""
+    global _writer
+    loop = asyncio.get_running_loop()
+    if _writer is None or _writer.loop is not loop or _writer.path != DB_PATH:
+        if _writer is not None:
+            # 旧事件循环已结束 (如测试之间)，只需关闭连接
+            _writer._conn.close()
+        _writer = DbWriter(DB_PATH)
+    return _writer
+
+
+def _get_reader() -> _Connection:
+    global _reader
+    if _reader is None or _reader.path != DB_PATH:
+        if _reader is not None:
+            _reader.close()
+        _reader = _Connection(DB_PATH, readonly=True)
+    return _reader
+
+
+async def _read(fn, *args):
+    """读取前先提交本进程已入队的写入，保证读到自己的写"""
+    if _writer is not None and _writer.path == DB_PATH and _writer.loop is asyncio.get_running_loop():
+        await _writer.flush()
+    return await _get_reader().run(fn, *args)
+
+
+def _get_cached_earnings_sync(conn, symbol, max_age_days):
+    row = conn.execute(
         "SELECT earnings_dates, fetched_at FROM earnings_cache WHERE symbol = ?",
         (symbol.upper(),)
-    )
-    row = cursor.fetchone()
-    conn.close()
+    ).fetchone()
 
     if not row:
         return None
@@ -108,36 +441,71 @@ def _get_cached_earnings_sync(symbol, max_age_days):
     return None
 
 
-def _cache_earnings_sync(symbol, earnings_dates):
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
-        "INSERT INTO earnings_cache (symbol, earnings_dates, fetched_at) VALUES (?, ?, ?) "
-        "ON CONFLICT(symbol) DO UPDATE SET earnings_dates=excluded.earnings_dates, fetched_at=excluded.fetched_at",
-        (
-            symbol.upper(),
-            earnings_dates,
-            datetime.utcnow().isoformat()
-        )
-    )
-    conn.commit()
-    conn.close()
+def _load_registry_sync(conn):
+    return conn.execute("SELECT cache_key, kind, payload, fetched_at FROM contract_registry").fetchall()
 
 
 async def ensure_db():
     await asyncio.to_thread(_init_db)
 
 
-async def log_trade(trade_type, symbol, action, quantity=None, price=None, delta=None, notes=None):
-    await asyncio.to_thread(_log_trade_sync, trade_type, symbol, action, quantity, price, delta, notes)
+async def close_db():
+    """提交队列中剩余的写入并关闭读写连接 (退出前调用)"""
+    global _writer, _reader
+    if _writer is not None:
+        if _writer.loop is asyncio.get_running_loop():
+            await _writer.close()
+        else:
+            _writer._conn.close()
+        _writer = None
+    if _reader is not None:
+        _reader.close()
+        _reader = None
+
+
+async def flush_db():
+    if _writer is not None and _writer.loop is asyncio.get_running_loop():
+        await _writer.flush()
+
+
+async def log_trade(trade_type, symbol, action, quantity=None, price=None, delta=None, notes=None,
+                    local_symbol=None, vix=None, mode=None):
+    _get_writer().submit(INSERT_TRADE_SQL, [(
+        datetime.utcnow().isoformat(), trade_type, symbol, action, quantity, price, delta, notes, local_symbol, vix,
+        mode
+    )])
+
+
+async def log_trades(rows):
+    """
+    同一批成交记录在一个事务中写入；
+    rows: [(trade_type, symbol, action, quantity, price, delta, notes[, local_symbol, vix, mode]), ...]
+    """
+    if rows:
+        timestamp = datetime.utcnow().isoformat()
+        _get_writer().submit(INSERT_TRADE_SQL, [(timestamp, *row, *(None,) * (10 - len(row))) for row in rows])
 
 
 async def log_market_snapshot(symbol, value, notes=None):
-    await asyncio.to_thread(_log_market_sync, symbol, value, notes)
+    _get_writer().submit(INSERT_MARKET_SQL, [(datetime.utcnow().isoformat(), symbol, value, notes)])
 
 
 async def get_cached_earnings(symbol, max_age_days=30):
-    return await asyncio.to_thread(_get_cached_earnings_sync, symbol, max_age_days)
+    return await _read(_get_cached_earnings_sync, symbol, max_age_days)
 
 
 async def cache_earnings(symbol, earnings_dates):
-    await asyncio.to_thread(_cache_earnings_sync, symbol, earnings_dates)
+    _get_writer().submit(UPSERT_EARNINGS_SQL, [(symbol.upper(), earnings_dates, datetime.utcnow().isoformat())])
+
+
+async def load_registry_entries():
+    return await _read(_load_registry_sync)
+
+
+async def save_registry_entries(entries):
+    """entries: [(cache_key, kind, payload_json, fetched_at_iso), ...]"""
+    _get_writer().submit(UPSERT_REGISTRY_SQL, entries)
+
+
+async def delete_registry_entries(keys):
+    _get_writer().submit(DELETE_REGISTRY_SQL, [(k,) for k in keys])
@@ -1,98 +1,247 @@
 import asyncio
+import csv
 import logging
-from datetime import datetime, timedelta
+import os
+import re
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 
 import yfinance as yf
+from config import EARNINGS_FILE, EARNINGS_PREFETCH_WORKERS
 from data_logger import cache_earnings, get_cached_earnings
+from utils import now
 
 logger = logging.getLogger(__name__)
 CACHE_TTL_DAYS = 30
+# 拉取失败时沿用上次的日期，并在这段时间后重试 (失败不当作"没有财报"缓存 TTL 那么久)
+FAILED_RETRY = timedelta(hours=1)
 
 
-async def _fetch_earnings_from_yfinance(symbol):
-    symbol = symbol.upper()
+def _parse_date(text: str) -> date:
+    text = text.strip()
+    return datetime.strptime(text[:10], '%Y-%m-%d').date() if '-' in text else datetime.strptime(text[:8], '%Y%m%d').date()
 
-    def _fetch():
+
+class YFinanceSource:
+    """在线数据源：yfinance 未来若干个财报日；结果写入 SQLite earnings_cache。请求失败时抛出异常"""
+    cacheable = True
+    version = None      # 无法感知数据变化，按 TTL 过期
+
+    def fetch(self, symbol: str) -> Optional[List[date]]:
         ticker = yf.Ticker(symbol)
         try:
             # 抓取未来多个财报日，通常返回 4-8 个
             df = ticker.get_earnings_dates(limit=8)
         except Exception as exc:
             logger.error(f"yfinance earnings fetch failed for {symbol}: {exc}")
-            return None
+            raise
 
         if getattr(df, 'empty', False):
             return None
 
-        # 提取所有未来的日期，存为逗号分隔字符串
-        future_dates = []
         now = datetime.now()
+        future_dates = set()
         for dt in df.index:
             # 处理时区或转换
             if hasattr(dt, 'to_pydatetime'):
                 dt_obj = dt.to_pydatetime().replace(tzinfo=None)
             else:
                 dt_obj = dt.replace(tzinfo=None)
-            
             if dt_obj >= now:
-                future_dates.append(dt_obj.strftime('%Y-%m-%d'))
-        
-        return ",".join(sorted(list(set(future_dates)))) if future_dates else None
+                future_dates.add(dt_obj.date())
+        return sorted(future_dates) or None
+
+
+class FileSource:
+    """
+    离线数据源：本地 CSV (含 symbol、date 两列) 或 ICS 日历 (SUMMARY 首个单词为代码，DTSTART 为日期)。
+    文件修改后 version 随之改变，EarningsService 据此让内存索引失效并重新加载；文件中没有的代码视为没有财报。
+    """
+    cacheable = False
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._dates: Dict[str, List[date]] = {}
+
+    @property
+    def version(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> Dict[str, List[date]]:
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime != self._mtime:
+                text = self.path.read_text()
+                pairs = self._parse_ics(text) if 'BEGIN:VCALENDAR' in text else self._parse_csv(text)
+                dates = {}
+                for symbol, d in pairs:
+                    dates.setdefault(symbol, set()).add(d)
+                self._dates = {s: sorted(ds) for s, ds in dates.items()}
+                self._mtime = mtime
+            return self._dates
+
+    @staticmethod
+    def _parse_csv(text):
+        rows = csv.DictReader(text.splitlines())
+        for row in rows:
+            row = {k.strip().lower(): v for k, v in row.items() if k}
+            if row.get('symbol') and row.get('date'):
+                yield row['symbol'].strip().upper(), _parse_date(row['date'])
+
+    @staticmethod
+    def _parse_ics(text):
+        # 折行 (RFC 5545 以空白开头的续行) 先拼回
+        lines = re.sub(r'\r?\n[ \t]', '', text).splitlines()
+        summary = start = None
+        for line in lines:
+            if line == 'BEGIN:VEVENT':
+                summary = start = None
+            elif line.startswith('SUMMARY'):
+                summary = line.split(':', 1)[1]
+            elif line.startswith('DTSTART'):
+                start = line.split(':', 1)[1]
+            elif line == 'END:VEVENT' and summary and start:
+                yield summary.split()[0].upper(), _parse_date(start)
+
+    def fetch(self, symbol: str) -> Optional[List[date]]:
+        return self._load().get(symbol, [])
+
+
+class EarningsService:
+    """
+    财报日历服务：每个标的的财报日以有序的 ordinal 列表常驻内存，is_near 用 bisect 查询 (微秒级)。
+    未命中时先查 SQLite 缓存，再经有界线程池调用数据源；prefetch 在启动/休市时并发预热整个候选池。
+    """
+
+    def __init__(self, source=None, max_workers: int = EARNINGS_PREFETCH_WORKERS, ttl_days: int = CACHE_TTL_DAYS):
+        self.source = source or YFinanceSource()
+        self.ttl = timedelta(days=ttl_days)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='earnings')
+        self._index: Dict[str, List[int]] = {}
+        self._loaded_at: Dict[str, datetime] = {}
+        self._versions: Dict[str, Optional[int]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {'hits': 0, 'loads': 0, 'fetches': 0}
+
+    def set_source(self, source):
+        self.source = source
+        self.clear()
+
+    def clear(self):
+        self._index.clear()
+        self._loaded_at.clear()
+        self._versions.clear()
+        self._inflight.clear()
+
+    def _store(self, symbol: str, dates: Iterable[date], loaded_at: datetime = None, version=None):
+        self._index[symbol] = sorted({d.toordinal() for d in dates})
+        self._loaded_at[symbol] = loaded_at or datetime.utcnow()
+        self._versions[symbol] = version
+
+    def _fresh(self, symbol: str, today: int) -> bool:
+        """已加载、数据源未变化、未过 TTL 且仍有今天或之后的财报日 (全部过期时需重新拉取)"""
+        ords = self._index.get(symbol)
+        if ords is None or datetime.utcnow() - self._loaded_at[symbol] >= self.ttl:
+            return False
+        if self._versions[symbol] != getattr(self.source, 'version', None):
+            return False
+        return not ords or ords[-1] >= today
+
+    def lookup(self, symbol: str, within_days: int = 3, today: date = None) -> Optional[bool]:
+        """纯内存查询：今天起 within_days 天内 (含今天) 有财报返回 True；未加载或已过期返回 None"""
+        symbol = symbol.upper()
+        t = (today or now().date()).toordinal()
+        if not self._fresh(symbol, t):
+            return None
+        ords = self._index[symbol]
+        i = bisect_left(ords, t)
+        return i < len(ords) and ords[i] <= t + within_days
+
+    def next_earnings(self, symbol: str, today: date = None) -> Optional[date]:
+        ords = self._index.get(symbol.upper(), [])
+        i = bisect_left(ords, (today or now().date()).toordinal())
+        return date.fromordinal(ords[i]) if i < len(ords) else None
+
+    async def is_near(self, symbol: str, within_days: int = 3) -> bool:
+        symbol = symbol.upper()
+        near = self.lookup(symbol, within_days)
+        if near is None:
+            await self.load(symbol)
+            near = bool(self.lookup(symbol, within_days))
+        else:
+            self.stats['hits'] += 1
+        if near:
+            logger.info(f"📅 {symbol} 近期财报 {self.next_earnings(symbol)}")
+        return near
+
+    async def load(self, symbol: str, force: bool = False):
+        """加载一个标的 (同一标的并发调用只加载一次)"""
+        symbol = symbol.upper()
+        if not force and self._fresh(symbol, now().date().toordinal()):
+            return
+        inflight = self._inflight.get(symbol)
+        if inflight is None:
+            inflight = self._inflight[symbol] = asyncio.ensure_future(self._load(symbol, force))
+            inflight.add_done_callback(lambda _: self._inflight.pop(symbol, None))
+        await inflight
+
+    async def _load(self, symbol: str, force: bool):
+        self.stats['loads'] += 1
+        source = self.source
+        if source.cacheable and not force:
+            try:
+                cached = await get_cached_earnings(symbol, CACHE_TTL_DAYS)
+                if cached:
+                    dates = [_parse_date(d) for d in (cached.get('earnings_dates') or '').split(',') if d]
+                    if not dates or dates[-1] >= date.today():
+                        self._store(symbol, dates, datetime.fromisoformat(cached['fetched_at']))
+                        return
+                # 缓存的日期都已过时，需要重新拉取
+            except Exception as e:
+                logger.warning(f"读取财报缓存失败: {symbol} - {e}")
+
+        logger.info(f"🔍 正在同步 {symbol} 的年度财报日历...")
+        self.stats['fetches'] += 1
+        # 先取版本再读取：读取期间文件若再次变化，下次查询会重新加载
+        version = getattr(source, 'version', None)
+        try:
+            dates = await asyncio.get_running_loop().run_in_executor(self._executor, source.fetch, symbol)
+        except Exception as exc:
+            previous = self._index.get(symbol)
+            if previous is None:
+                # 没有可沿用的日期：异常交给调用方 (本轮跳过该标的)，下次检查/预取重新拉取
+                raise
+            logger.warning(f"⚠️ {symbol} 财报日历拉取失败，沿用上次的 {len(previous)} 个日期，稍后重试: {exc}")
+            self._loaded_at[symbol] = datetime.utcnow() - self.ttl + FAILED_RETRY
+            return
+        self._store(symbol, dates or [], version=version)
+        if source.cacheable:
+            try:
+                await cache_earnings(symbol, ','.join(d.isoformat() for d in dates) if dates else None)
+            except Exception as e:
+                logger.warning(f"写入财报缓存失败: {e}")
+
+    async def prefetch(self, symbols: Iterable[str]):
+        """并发预热 (线程池大小限制同时在途的数据源请求)；已是最新的标的直接跳过"""
+        symbols = sorted({s.upper() for s in symbols})
+        results = await asyncio.gather(*(self.load(s) for s in symbols), return_exceptions=True)
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                logger.warning(f"预取 {symbol} 财报日历失败: {result}")
+        logger.info(f"📅 财报日历已预热 {len(symbols)} 个标的")
+
 
-    return await asyncio.to_thread(_fetch)
+earnings_service = EarningsService(FileSource(EARNINGS_FILE) if EARNINGS_FILE else None)
 
 
 async def is_near_earnings(symbol, within_days=3):
-    symbol = symbol.upper()
-    now = datetime.now()
-    horizon = now + timedelta(days=within_days)
-    
-    # 1. 检查缓存
-    try:
-        cached = await get_cached_earnings(symbol, CACHE_TTL_DAYS)
-        if cached:
-            dates_str = cached.get('earnings_dates')
-            if not dates_str:
-                # 记录过没财报，且缓存没过期
-                return False
-            
-            dates = dates_str.split(',')
-            any_near = False
-            has_future = False
-            for d_str in dates:
-                d_dt = datetime.strptime(d_str, '%Y-%m-%d')
-                if d_dt >= now:
-                    has_future = True
-                    if now <= d_dt <= horizon:
-                        logger.info(f"📅 缓存命中：{symbol} 近期财报 {d_str}")
-                        any_near = True
-                        break
-            
-            # 如果缓存里还有未来的日期，且没有一个是“近期”，则直接返回 False
-            if has_future:
-                return any_near
-            # 如果缓存里所有日期都过时了，说明需要重新拉取
-    except Exception as e:
-        logger.warning(f"读取财报缓存失败: {symbol} - {e}")
-
-    # 2. 缓存未命中、过期或所有日期都已过时，调用 API
-    logger.info(f"🔍 正在同步 {symbol} 的年度财报日历...")
-    dates_str = await _fetch_earnings_from_yfinance(symbol)
-    
-    # 3. 写入缓存
-    try:
-        await cache_earnings(symbol, dates_str)
-    except Exception as e:
-        logger.warning(f"写入财报缓存失败: {e}")
-
-    if not dates_str:
-        return False
-
-    # 4. 判断
-    for d_str in dates_str.split(','):
-        d_dt = datetime.strptime(d_str, '%Y-%m-%d')
-        if now <= d_dt <= horizon:
-            logger.info(f"⚠️ [Yahoo] 检测到 {symbol} 近期财报：{d_str}")
-            return True
-            
-    return False
+    return await earnings_service.is_near(symbol, within_days)
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from typing import List, NamedTuple, Optional
+
+from ib_insync import Bag, ComboLeg, MarketOrder, OrderStatus
+
+from data_logger import log_trades
+
+logger = logging.getLogger(__name__)
+
+# 单次下单等待成交的时间 (秒)，超时撤单后按剩余数量重下
+FILL_TIMEOUT = 5.0
+MAX_RETRIES = 2
+# 撤单后等待 IB 确认 (Cancelled) 的时间 (秒)；未确认前不重下，避免撤单途中成交导致重复平仓
+CANCEL_TIMEOUT = 5.0
+
+
+class ExitOrder(NamedTuple):
+    """一笔平仓指令：单腿或整组 Spread (legs 为组成它的持仓)"""
+    contract: object
+    action: str
+    quantity: float
+    legs: tuple
+
+    @property
+    def description(self):
+        return ' / '.join(p.contract.localSymbol or str(p.contract.conId) for p in self.legs)
+
+
+class ExitResult(NamedTuple):
+    order: ExitOrder
+    filled: bool
+    attempts: int
+    status: str
+
+
+def plan_exit_orders(positions) -> List[ExitOrder]:
+    """
+    期权持仓 -> 平仓指令：同一 (标的, 到期日, 方向) 下数量相同的一空一多配成 Spread，
+    以组合单整体平仓 (一次成交、不留裸腿)；其余逐腿市价平仓。
+    """
+    groups = {}
+    for p in positions:
+        if not p.position:
+            continue
+        c = p.contract
+        groups.setdefault((c.symbol, c.lastTradeDateOrContractMonth, c.right), []).append(p)
+
+    orders = []
+    for (symbol, _, _), group in groups.items():
+        shorts = sorted((p for p in group if p.position < 0), key=lambda p: p.contract.strike)
+        longs = sorted((p for p in group if p.position > 0), key=lambda p: p.contract.strike)
+        paired = set()
+        for short in shorts:
+            match = min(
+                (p for p in longs if id(p) not in paired and p.position == -short.position),
+                key=lambda p: abs(p.contract.strike - short.contract.strike),
+                default=None,
+            )
+            if match is None:
+                continue
+            paired.update((id(short), id(match)))
+            legs = [
+                ComboLeg(conId=short.contract.conId, ratio=1, action='BUY'),
+                ComboLeg(conId=match.contract.conId, ratio=1, action='SELL'),
+            ]
+            orders.append(ExitOrder(Bag(symbol=symbol, comboLegs=legs), 'BUY', abs(short.position), (short, match)))
+        for p in group:
+            if id(p) not in paired:
+                action = 'BUY' if p.position < 0 else 'SELL'
+                orders.append(ExitOrder(p.contract, action, abs(p.position), (p,)))
+    return orders
+
+
+def _settled(trade) -> bool:
+    """订单不会再成交：已完成，或被拒 (Inactive，IB 不再处理)"""
+    return trade.isDone() or trade.orderStatus.status == OrderStatus.Inactive
+
+
+async def _wait_done(trade, timeout: float) -> bool:
+    if _settled(trade):
+        return True
+    done = asyncio.Event()
+
+    def on_status(t):
+        if _settled(t):
+            done.set()
+
+    trade.statusEvent += on_status
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        trade.statusEvent -= on_status
+
+
+class ExitEngine:
+    """
+    并行平仓：所有平仓单一次性发出，逐单并发跟踪成交 (Trade.statusEvent)，
+    超时/被拒的按剩余数量重下；审计记录在订单发出后一次性批量写入。
+    """
+
+    def __init__(self, ib, fill_timeout: float = FILL_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 cancel_timeout: float = CANCEL_TIMEOUT):
+        self.ib = ib
+        self.fill_timeout = fill_timeout
+        self.max_retries = max_retries
+        self.cancel_timeout = cancel_timeout
+
+    async def liquidate(self, positions, trade_type: str = 'EMERGENCY') -> List[ExitResult]:
+        orders = plan_exit_orders(positions)
+        if not orders:
+            return []
+        trades = [self._submit(o, o.quantity) for o in orders]
+        logger.warning(f"📢 [EXIT] 已同时提交 {len(orders)} 笔平仓单 ({sum(len(o.legs) for o in orders)} 条腿)")
+
+        # 订单已全部发出，审计写入与成交跟踪并行
+        audit = asyncio.ensure_future(log_trades([
+            (trade_type, p.contract.symbol, 'EXIT', abs(p.position), None, None,
+             f"Emergency liquidation of {p.contract.localSymbol}", p.contract.localSymbol)
+            for o in orders for p in o.legs
+        ]))
+        results = await asyncio.gather(*(self._track(o, t) for o, t in zip(orders, trades)))
+        try:
+            await audit
+        except Exception as exc:
+            logger.error(f"平仓审计记录写入失败: {exc}")
+
+        unfilled = [r for r in results if not r.filled]
+        for r in unfilled:
+            logger.error(f"❌ [EXIT] {r.order.description} 未能全部成交 (状态 {r.status}, 尝试 {r.attempts} 次)")
+        logger.warning(f"📢 [EXIT] 平仓完成: {len(results) - len(unfilled)}/{len(results)} 笔全部成交")
+        return results
+
+    def _submit(self, order: ExitOrder, quantity: float):
+        return self.ib.placeOrder(order.contract, MarketOrder(order.action, quantity))
+
+    async def _track(self, order: ExitOrder, trade) -> ExitResult:
+        attempts = 1
+        while True:
+            done = await _wait_done(trade, self.fill_timeout)
+            if not done and attempts <= self.max_retries:
+                # 撤单并等待确认：确认前仍可能成交，剩余数量以确认后的状态为准
+                self.ib.cancelOrder(trade.order)
+                done = await _wait_done(trade, self.cancel_timeout)
+            status = trade.orderStatus.status
+            if status == OrderStatus.Filled:
+                logger.warning(f"✅ [EXIT] {order.description} 已成交")
+                return ExitResult(order, True, attempts, status)
+            remaining = trade.order.totalQuantity - trade.orderStatus.filled
+            if attempts > self.max_retries or remaining <= 0:
+                return ExitResult(order, False, attempts, status)
+            if not done:
+                logger.error(f"❌ [EXIT] {order.description} 撤单 {self.cancel_timeout:g}s 内未确认 (状态 {status})，不再重下")
+                return ExitResult(order, False, attempts, status)
+            attempts += 1
+            logger.warning(f"🔁 [EXIT] {order.description} 状态 {status}，按剩余 {remaining} 重新下单 (第 {attempts} 次)")
+            trade = self._submit(order, remaining)
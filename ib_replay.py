@@ -0,0 +1,311 @@
+import asyncio
+import dataclasses
+import gzip
+import json
+import logging
+import shutil
+import tempfile
+import time
+from collections import defaultdict, deque
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import ib_insync
+from eventkit import Event
+from ib_insync import IB, Contract, Order, Ticker, util
+
+import config
+import data_logger
+import utils
+
+logger = logging.getLogger(__name__)
+
+# 录制的请求方法：方法名 -> 是否为协程
+RECORDED_METHODS = {
+    'reqTickersAsync': True,
+    'qualifyContractsAsync': True,
+    'reqSecDefOptParamsAsync': True,
+    'reqContractDetailsAsync': True,
+    'accountSummaryAsync': True,
+    'reqPositionsAsync': True,
+    'reqExecutionsAsync': True,
+    'positions': False,
+    'portfolio': False,
+    'managedAccounts': False,
+    'openTrades': False,
+    'placeOrder': False,
+    'cancelOrder': False,
+    'reqGlobalCancel': False,
+    'cancelMktData': False,
+    'reqPnL': False,
+    'reqPnLSingle': False,
+    'cancelPnL': False,
+    'cancelPnLSingle': False,
+}
+
+# 没有响应的调用：回放时未录制到也不算失配
+UNANSWERED_METHODS = {'cancelMktData', 'cancelPnL', 'cancelPnLSingle', 'reqGlobalCancel'}
+
+# 流式行情每次更新只记录这些字段
+TICK_FIELDS = ('time', 'bid', 'bidSize', 'ask', 'askSize', 'last', 'lastSize', 'close', 'volume',
+               'impliedVolatility', 'modelGreeks')
+
+
+def isolate_local_state(directory=None) -> Path:
+    """
+    回放前把 SQLite 数据库与 learned_config.json 指向临时目录：回放中的调参、交易与行情记录
+    不写入实盘的 strategy_data.db，也不改写实盘参数。learned_config.json 先复制一份，回放从当前参数起步。
+    """
+    directory = Path(directory or tempfile.mkdtemp(prefix='optionsbot-replay-'))
+    directory.mkdir(parents=True, exist_ok=True)
+    learned = directory / config.LEARNED_CONFIG_PATH.name
+    if config.LEARNED_CONFIG_PATH.exists():
+        shutil.copyfile(config.LEARNED_CONFIG_PATH, learned)
+    config.LEARNED_CONFIG_PATH = learned
+    data_logger.DB_PATH = directory / data_logger.DB_PATH.name
+    logger.info(f"⏪ 回放数据写入临时目录: {directory}")
+    return directory
+
+
+class ReplayMissError(LookupError):
+    """回放文件中没有与该请求匹配的录制响应"""
+
+
+# --- 编解码：ib_insync 对象 <-> 紧凑 JSON ---
+
+def encode(obj):
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, datetime):
+        return {'__dt__': obj.isoformat()}
+    if isinstance(obj, date):
+        return {'__d__': obj.isoformat()}
+    if isinstance(obj, Event):
+        return None
+    if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+        return {'__nt__': type(obj).__name__, 'v': [encode(v) for v in obj]}
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        fields = util.dataclassNonDefaults(obj)
+        return {'__dc__': type(obj).__name__, 'v': {k: encode(v) for k, v in fields.items()}}
+    if isinstance(obj, dict):
+        return {'__map__': [[encode(k), encode(v)] for k, v in obj.items()]}
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return [encode(v) for v in obj]
+    return str(obj)
+
+
+def decode(obj):
+    if isinstance(obj, list):
+        return [decode(v) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if '__dt__' in obj:
+        return datetime.fromisoformat(obj['__dt__'])
+    if '__d__' in obj:
+        return date.fromisoformat(obj['__d__'])
+    if '__nt__' in obj:
+        return getattr(ib_insync, obj['__nt__'])(*[decode(v) for v in obj['v']])
+    if '__dc__' in obj:
+        cls = getattr(ib_insync, obj['__dc__'])
+        fields = {k: decode(v) for k, v in obj['v'].items()}
+        if issubclass(cls, Contract):
+            # 子类 (Option/Stock...) 的构造函数自带 secType
+            return Contract.create(**fields)
+        if issubclass(cls, Order):
+            # MarketOrder/LimitOrder 的构造函数自带 orderType 等字段
+            return Order(**fields)
+        # 事件 (Trade.statusEvent 等) 不录制，由构造函数重新创建
+        events = getattr(cls, 'events', ())
+        return cls(**{k: v for k, v in fields.items() if k not in events})
+    if '__map__' in obj:
+        return {decode(k): decode(v) for k, v in obj['__map__']}
+    return obj
+
+
+def _request_key(method, args, kwargs):
+    return method + '|' + json.dumps([encode(list(args)), encode(kwargs)], sort_keys=True, default=str)
+
+
+class RecordingIB:
+    """
+    包装真实 IB：透传所有调用，并把请求/响应/耗时逐行写入 gzip JSON Lines 文件；
+    reqMktData 的流式更新也按时间偏移记录，供 ReplayIB 原样回放。
+    文件首行记录会话开始时刻，回放时策略时钟冻结于此 (请求中的到期日等由时钟推算)。
+    """
+
+    def __init__(self, ib, path):
+        self._ib = ib
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        started = {'wall': encode(utils.now()), 'ts': utils.now(timezone.utc).timestamp()}
+        self._write({'m': 'session', 'k': '', 'r': started, 'lat': 0})
+
+    def _write(self, record):
+        if self._file.closed:
+            # 断开连接后的清理调用 (如退订行情) 不再录制
+            return
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def __getattr__(self, name):
+        attr = getattr(self._ib, name)
+        if name == 'reqMktData':
+            return self._record_stream(attr)
+        if name not in RECORDED_METHODS:
+            return attr
+        if RECORDED_METHODS[name]:
+            async def recorded(*args, **kwargs):
+                key = _request_key(name, args, kwargs)
+                started = time.monotonic()
+                result = await attr(*args, **kwargs)
+                self._write({'m': name, 'k': key, 'r': encode(result), 'lat': round(time.monotonic() - started, 4)})
+                return result
+            return recorded
+
+        def recorded_sync(*args, **kwargs):
+            key = _request_key(name, args, kwargs)
+            result = attr(*args, **kwargs)
+            self._write({'m': name, 'k': key, 'r': encode(result), 'lat': 0})
+            return result
+        return recorded_sync
+
+    def _record_stream(self, req_mkt_data):
+        def recorded(contract, *args, **kwargs):
+            key = _request_key('reqMktData', (contract,) + args, kwargs)
+            ticker = req_mkt_data(contract, *args, **kwargs)
+            subscribed = time.monotonic()
+
+            def on_update(t):
+                fields = {f: encode(getattr(t, f)) for f in TICK_FIELDS}
+                self._write({'m': 'tick', 'k': key, 'r': fields, 'lat': round(time.monotonic() - subscribed, 4)})
+
+            ticker.updateEvent += on_update
+            return ticker
+        return recorded
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def disconnect(self):
+        self.close()
+        return self._ib.disconnect()
+
+
+class ReplayIB:
+    """
+    与 IB 接口兼容的离线替身：按请求内容匹配录制的响应，并按录制的耗时 (乘以 speed) 返回。
+    同一请求被多次录制时按顺序回放，用尽后重复最后一次响应。
+    """
+
+    def __init__(self, path, speed: float = 1.0):
+        self.speed = speed
+        self._responses = defaultdict(deque)
+        self._last = {}
+        self._streams = defaultdict(list)
+        self._stream_tasks = []
+        self.requests = 0
+        self.misses = 0
+        self.started_at = None      # 录制开始时刻 (本地墙钟, Unix 时间戳)；旧录制文件没有
+        for name in IB.events:
+            setattr(self, name, Event(name))
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['m'] == 'session':
+                    self.started_at = (decode(record['r']['wall']), record['r']['ts'])
+                elif record['m'] == 'tick':
+                    self._streams[record['k']].append((record['lat'], record['r']))
+                else:
+                    self._responses[record['k']].append((record['lat'], record['r']))
+
+    def freeze_clock(self):
+        """把策略时钟冻结在录制开始时刻，使到期日、DTE 等与录制时一致 (请求才能匹配上)"""
+        if self.started_at is None:
+            logger.warning("录制文件没有会话开始时刻，回放使用当前时钟 (跨日回放可能无法匹配请求)")
+            return
+        utils.freeze_clock(*self.started_at)
+        logger.info(f"⏪ 策略时钟冻结于录制开始时刻 {self.started_at[0]:%Y-%m-%d %H:%M:%S}")
+
+    # --- 连接相关：离线时全部为空操作 ---
+    async def connectAsync(self, *args, **kwargs):
+        self.connectedEvent.emit()
+        return self
+
+    def connect(self, *args, **kwargs):
+        return self
+
+    def isConnected(self):
+        return True
+
+    def disconnect(self):
+        for task in self._stream_tasks:
+            task.cancel()
+
+    def _lookup(self, name, args, kwargs):
+        key = _request_key(name, args, kwargs)
+        self.requests += 1
+        queue = self._responses.get(key)
+        if queue:
+            entry = queue.popleft()
+            self._last[key] = entry
+        elif key in self._last:
+            entry = self._last[key]
+        else:
+            if name in UNANSWERED_METHODS:
+                # 退订/撤单类调用没有需要回放的响应，发出时机 (如行情线回收) 可能与录制时不同
+                return 0.0, None
+            self.misses += 1
+            raise ReplayMissError(f"回放文件中没有匹配的请求: {name}")
+        latency, payload = entry
+        return latency * self.speed, decode(payload)
+
+    def __getattr__(self, name):
+        if name not in RECORDED_METHODS:
+            raise AttributeError(name)
+        if RECORDED_METHODS[name]:
+            async def replayed(*args, **kwargs):
+                latency, result = self._lookup(name, args, kwargs)
+                if latency > 0:
+                    await asyncio.sleep(latency)
+                if name == 'qualifyContractsAsync':
+                    return self._fill_qualified(args, result)
+                return result
+            return replayed
+
+        def replayed_sync(*args, **kwargs):
+            return self._lookup(name, args, kwargs)[1]
+        return replayed_sync
+
+    @staticmethod
+    def _fill_qualified(contracts, qualified):
+        """与真实 IB 一致：原地回填调用方传入的合约对象"""
+        def spec(c):
+            return (c.secType, c.symbol, c.lastTradeDateOrContractMonth, c.strike, c.right)
+
+        by_spec = {spec(q): q for q in qualified}
+        filled = []
+        for contract in contracts:
+            source = by_spec.get(spec(contract))
+            if source is not None:
+                util.dataclassUpdate(contract, source)
+                filled.append(contract)
+        return filled
+
+    def reqMktData(self, contract, *args, **kwargs):
+        key = _request_key('reqMktData', (contract,) + args, kwargs)
+        self.requests += 1
+        ticker = Ticker(contract=contract)
+        updates = self._streams.get(key, [])
+        if updates:
+            self._stream_tasks.append(asyncio.ensure_future(self._play_stream(ticker, updates)))
+        return ticker
+
+    async def _play_stream(self, ticker, updates):
+        elapsed = 0.0
+        for offset, fields in updates:
+            delay = (offset - elapsed) * self.speed
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elapsed = offset
+            for field, value in fields.items():
+                setattr(ticker, field, decode(value))
+            ticker.updateEvent.emit(ticker)
@@ -1,37 +1,79 @@
 import argparse
 import asyncio
 import logging
+import os
 import sys
 from datetime import datetime
 from ib_insync import *
 
-from utils import get_next_friday, is_trading_hours, validate_net_credit
-from options_lookup import find_contract_by_delta, is_contract_liquid
+import utils
+from utils import days_to_expiry, get_next_friday, is_trading_hours
+from options_lookup import find_contract_by_delta
+from spread_optimizer import select_put_spread
+from roll_planner import plan_roll
 from target_list import STOCK_CANDIDATES, INDEX_CANDIDATES
-from earnings_calendar import is_near_earnings
-from config import DEFAULT_MODE, STRATEGY_MODES, load_parameters
-from data_logger import ensure_db, log_trade, log_market_snapshot
-from vix_monitor import fetch_vix
-from self_tuner import tune_parameters
-
-# 配置日志 - 增加文件输出以便审计
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('options_bot.log')
-    ]
-)
+from earnings_calendar import FileSource, earnings_service, is_near_earnings
+from config import (CANDIDATE_CONCURRENCY, DEFAULT_MODE, ELEVATED_DELTA_SCALE, ROLL_EXPIRY_WEEKS, STRATEGY_MODES,
+                    load_parameters)
+from data_logger import close_db, ensure_db, log_trade, log_market_snapshot
+from retention import retention_loop
+from vix_monitor import CALM, PANIC, VolRegimeService, fetch_vix
+from self_tuner import tune_parameters_async
+from contract_registry import registry
+import chain_store
+import market_data
+from market_data import req_tickers, ticker_cache
+from request_scheduler import PRIORITY_URGENT, PacedIB, priority_lane
+from ib_replay import RecordingIB, ReplayIB, isolate_local_state
+from roll_watcher import RollWatcher
+from position_index import PositionIndex
+from risk_engine import RiskEngine
+from exit_engine import ExitEngine
+
 logger = logging.getLogger(__name__)
 
+
+def configure_logging():
+    # 配置日志 - 增加文件输出以便审计 (仅命令行运行时，测试导入本模块不创建日志文件)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler('options_bot.log')
+        ]
+    )
+
+
 class AIOptionsMaster:
-    def __init__(self, host='127.0.0.1', port=7497, client_id=1, mode=None):
-        self.ib = IB()
+    def __init__(self, host='127.0.0.1', port=7497, client_id=1, mode=None, record_path=None, replay_path=None,
+                 event_driven=False):
+        # 离线回放时用 ReplayIB 替代真实连接；录制时透明记录所有请求/响应
+        if replay_path:
+            raw_ib = ReplayIB(replay_path)
+            raw_ib.freeze_clock()
+        elif record_path:
+            raw_ib = RecordingIB(IB(), record_path)
+        else:
+            raw_ib = IB()
+        self.replaying = bool(replay_path)
+        # 回放的调参与交易/行情记录写入临时目录，不污染实盘数据库和 learned_config.json
+        self.scratch_dir = isolate_local_state() if self.replaying else None
+        # 所有 IB 请求经限速调度器发出
+        self.ib = PacedIB(raw_ib)
+        # 持仓索引：连接后构建，由持仓/成交事件增量维护
+        self.positions = PositionIndex(self.ib)
+        self.exit_engine = ExitEngine(self.ib)
         self.host = host
         self.port = port
         self.client_id = client_id
         self.mode = mode or os.environ.get('STRATEGY_MODE', DEFAULT_MODE)
+        # 事件驱动模式：空头 Call 的 Rolling 由 RollWatcher 按行情实时触发，主循环只做例行维护
+        self.event_driven = event_driven
+        self.roll_watcher = None
+        self._roll_orders = {}      # 旧合约 conId -> 已发出的 Rolling 组合单
+        self.risk_engine = None
+        self.params = None
         
         # 初始加载参数
         self.refresh_config()
@@ -39,51 +81,90 @@ class AIOptionsMaster:
         # 运行状态
         self.initial_nav = None
         self.force_exit_flag = False
-        self.current_vix = None
+        # 波动率环境 (VIX 及期限结构) 常驻流式维护，策略直接读取 self.vol.state
+        self.vol = VolRegimeService(self.ib)
+        self.vol.regimeEvent += self._on_regime_change
+        self.market_data = None
+        self._candidate_slots = asyncio.Semaphore(CANDIDATE_CONCURRENCY)
+
+    @property
+    def current_vix(self):
+        return self.vol.state.vix
 
     def refresh_config(self):
-        """从 config.py (含已学习参数) 加载最新配置"""
+        """从 config.py (含已学习参数) 加载最新配置；learned_config.json 未变化时不做任何事"""
         params = load_parameters(self.mode)
+        # 文件任何变化 (含手工编辑、没有 _version 的旧文件) 都会得到新的 Parameters 对象
+        if params is self.params:
+            return
+        self.params = params
         self.cc_delta_target = params['CC_DELTA_TARGET']
         self.pcs_sell_delta = params['PCS_SELL_DELTA']
         self.pcs_width = params['PCS_WIDTH']
         self.roll_delta_threshold = params['ROLL_DELTA_THRESHOLD']
         self.roll_dte_threshold = params['ROLL_DTE_THRESHOLD']
         self.max_daily_drawdown = params['MAX_DAILY_DRAWDOWN']
-        logger.info(f"⚙️ 配置已刷新: Delta={self.cc_delta_target}, RollThresh={self.roll_delta_threshold}")
+        if self.roll_watcher:
+            self.roll_watcher.set_thresholds(self.roll_delta_threshold, self.roll_dte_threshold)
+        if self.risk_engine:
+            self.risk_engine.set_threshold(self.max_daily_drawdown)
+        logger.info(f"⚙️ 配置已刷新 (v{params.version}): Delta={self.cc_delta_target}, RollThresh={self.roll_delta_threshold}")
 
-    def _select_stock_candidate(self):
-        """从候选池中选择当前持有正股的标的"""
-        positions = self.ib.positions()
+    def _select_stock_candidates(self):
+        """从候选池中选出所有持有足量正股的标的，返回 [(candidate, stock_pos, opt_pos)]"""
+        selected = []
         for candidate in STOCK_CANDIDATES:
             symbol = candidate['symbol']
             min_shares = candidate.get('min_shares', 100)
-            stock_pos = next(
-                (p for p in positions if p.contract.symbol == symbol and p.contract.secType == 'STK'),
-                None
-            )
+            stock_pos = self.positions.first(symbol, 'STK', '', '')
             if not stock_pos or stock_pos.position < min_shares:
                 continue
-            opt_pos = next(
-                (p for p in positions if p.contract.symbol == symbol and p.contract.secType == 'OPT' and p.contract.right == 'C'),
-                None
-            )
-            return candidate, stock_pos, opt_pos
-        return None, None, None
+            opt_pos = self.positions.first(symbol, 'OPT', 'C')
+            selected.append((candidate, stock_pos, opt_pos))
+        return selected
 
-    def _get_index_candidate(self):
-        """获取当前配置的指数标的"""
-        return INDEX_CANDIDATES[0] if INDEX_CANDIDATES else None
+    def _get_index_candidates(self):
+        """获取当前配置的全部指数/ETF 标的"""
+        return list(INDEX_CANDIDATES)
+
+    async def _run_bounded(self, label, coros):
+        """并发运行各标的的策略，用信号量限制同时在途的标的数；单个标的失败不影响其他标的"""
+        async def _bounded(coro):
+            async with self._candidate_slots:
+                return await coro
+
+        results = await asyncio.gather(*(_bounded(c) for c in coros), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"{label} 标的处理异常: {result}")
+        return results
 
     async def connect(self):
         try:
             await self.ib.connectAsync(self.host, self.port, clientId=self.client_id)
-            self.account = self.ib.wrapper.accounts[0]
+            self.account = self.ib.managedAccounts()[0]
+            self.positions.attach()
             # 获取初始净资产
             acc_summary = await self.ib.accountSummaryAsync(self.account)
             nav_item = [item for item in acc_summary if item.tag == 'NetLiquidation']
             if nav_item:
                 self.initial_nav = float(nav_item[0].value)
+            self.market_data = market_data.install(self.ib)
+            try:
+                await self.vol.start()
+            except Exception as e:
+                # 无法流式订阅时每轮退回 VIX 快照
+                logger.warning(f"波动率环境流式订阅失败，改为每轮读取 VIX 快照: {e}")
+            # 流式 PnL 熔断独立于策略主循环，每次 PnL 推送即评估回撤
+            self.risk_engine = RiskEngine(
+                self.ib, self.account, self.initial_nav, self.max_daily_drawdown, self.emergency_exit
+            )
+            self.risk_engine.start()
+            self.risk_engine.sync_positions(self.positions.all())
+            if self.event_driven:
+                self.roll_watcher = RollWatcher(
+                    self.ib, self._on_roll_trigger, self.roll_delta_threshold, self.roll_dte_threshold
+                )
             logger.info(f"✅ 已连接账户: {self.account}, 初始 NAV: {self.initial_nav}")
         except Exception as e:
             logger.error(f"连接失败: {e}")
@@ -93,25 +174,35 @@ class AIOptionsMaster:
     async def manage_covered_calls(self):
         if self.force_exit_flag: return
         logger.info(">>> 检查股票候选池中的 Covered Call 机会...")
-        
-        candidate, stock_pos, opt_pos = self._select_stock_candidate()
-        if not candidate:
+
+        selected = self._select_stock_candidates()
+        if not selected:
             logger.info("未在候选池中找到满足持仓条件的股票，跳过 Covered Call")
             return
 
+        results = await self._run_bounded('Covered Call', [
+            self._manage_covered_call(candidate, stock_pos, opt_pos)
+            for candidate, stock_pos, opt_pos in selected
+        ])
+        if self.roll_watcher:
+            await self.roll_watcher.sync([r for r in results if r is not None and not isinstance(r, Exception)])
+
+    async def _manage_covered_call(self, candidate, stock_pos, opt_pos):
         symbol = candidate['symbol']
         if await is_near_earnings(symbol):
             logger.info(f"📅 {symbol} 即将财报，跳过 Covered Call")
             return
 
         stock = Stock(symbol, 'SMART', 'USD')
-        await self.ib.qualifyContractsAsync(stock)
+        await registry.qualify(self.ib, stock)
+        await self.market_data.hold(f'underlying:{symbol}', [stock])
 
-        # 环境感知调参：如果 VIX 很高 (如 > 30)，我们稍微降低目标 Delta 以追求更安全
+        # 环境感知调参：高波动环境 (VIX > 30 或期限结构倒挂) 稍微降低目标 Delta 以追求更安全
+        vol = self.vol.state
         effective_delta = self.cc_delta_target
-        if self.current_vix and self.current_vix > 30:
-            effective_delta *= 0.8
-            logger.info(f"📉 高波动环境 (VIX={self.current_vix:.2f})，调低目标 Delta 至 {effective_delta:.3f}")
+        if vol.regime != CALM:
+            effective_delta *= ELEVATED_DELTA_SCALE
+            logger.info(f"📉 高波动环境 ({vol.regime}, VIX={vol.vix:.2f})，{symbol} 调低目标 Delta 至 {effective_delta:.3f}")
 
         qty = int(stock_pos.position / 100)
         if not opt_pos or abs(opt_pos.position) < 1:
@@ -121,85 +212,121 @@ class AIOptionsMaster:
                 order = MarketOrder('SELL', qty)
                 self.ib.placeOrder(contract, order)
                 logger.info(f"🚀 [OPEN] {symbol} Covered Call: {contract.localSymbol} x {qty}")
-                await log_trade("COVERED_CALL", symbol, "OPEN", qty, delta=effective_delta, notes=f"Contract: {contract.localSymbol}, VIX: {self.current_vix}")
+                await log_trade("COVERED_CALL", symbol, "OPEN", qty, delta=effective_delta, notes=f"Contract: {contract.localSymbol}, VIX: {self.current_vix}",
+                                local_symbol=contract.localSymbol, vix=self.current_vix, mode=self.mode)
+        elif self.roll_watcher:
+            # 交给 RollWatcher 实时监控，返回值用于同步监控集合
+            return opt_pos
         else:
             await self.check_and_roll_call(opt_pos)
 
+    async def _on_roll_trigger(self, position):
+        if self.force_exit_flag:
+            return
+        if not (self.replaying or is_trading_hours()):
+            return
+        # RollWatcher 持有的是上次 sync 时的快照：以持仓索引的当前值为准，已平仓或数量变化则跳过
+        current = self.positions.by_con_id(position.contract.conId)
+        if current is None or current.position != position.position:
+            logger.info(f"{position.contract.localSymbol} 持仓已变化，跳过此次 Rolling 触发")
+            return
+        await self.check_and_roll_call(current)
+
     async def check_and_roll_call(self, current_pos):
         contract = current_pos.contract
         symbol = contract.symbol
-        [ticker] = await self.ib.reqTickersAsync(contract)
+        # 上一笔 Rolling 组合单仍在途或已成交 (持仓尚未更新) 时不重复下单；被撤/被拒才允许重新 Rolling
+        pending = self._roll_orders.get(contract.conId)
+        if pending is not None and pending.orderStatus.status not in (
+                OrderStatus.Cancelled, OrderStatus.ApiCancelled, OrderStatus.Inactive):
+            logger.info(f"{contract.localSymbol} 已有 Rolling 订单 ({pending.orderStatus.status})，跳过")
+            return
+        # 已持有的空头 Call 常驻订阅，后续读取为零延迟
+        await self.market_data.hold(f'short_call:{symbol}', [contract])
+        [ticker] = await req_tickers(self.ib, contract)
         
         if not ticker.modelGreeks:
             logger.warning(f"无法获取 {contract.localSymbol} Greeks，跳过此轮。")
             return
 
         delta = abs(ticker.modelGreeks.delta)
-        expiry_dt = datetime.strptime(contract.lastTradeDateOrContractMonth, '%Y%m%d')
-        dte = (expiry_dt - datetime.now()).days
+        dte = days_to_expiry(contract.lastTradeDateOrContractMonth)
 
         # 触发条件: Delta > ROLL_DELTA_THRESHOLD 或 DTE < ROLL_DTE_THRESHOLD
         if delta > self.roll_delta_threshold or dte < self.roll_dte_threshold:
             logger.info(f"⚠️ 触发 Rolling: {contract.localSymbol} (Delta={delta:.2f}, DTE={dte})")
             
-            new_expiry = get_next_friday(offset_weeks=1)
-            new_contract = await find_contract_by_delta(self.ib, Stock(symbol, 'SMART'), new_expiry, self.cc_delta_target, 'C')
-            
-            if new_contract:
-                if not await is_contract_liquid(self.ib, new_contract):
-                    logger.warning('Rolling 新合约流动性不足，跳过')
-                    return
-                [new_ticker] = await self.ib.reqTickersAsync(new_contract)
-                # 简单校验：新合约 Bid > 旧合约 Ask (买回成本)
-                if new_ticker.bid > ticker.ask:
-                    # 使用 Bag 组合单减少滑点
-                    buy_leg = ComboLeg(conId=contract.conId, ratio=1, action='BUY')
-                    sell_leg = ComboLeg(conId=new_contract.conId, ratio=1, action='SELL')
-                    roll_bag = Bag(symbol=symbol, comboLegs=[buy_leg, sell_leg])
-                    self.ib.placeOrder(roll_bag, MarketOrder('SELL', abs(current_pos.position)))
-                    logger.info(f"✅ [ROLL] {contract.localSymbol} -> {new_contract.localSymbol}")
-                    await log_trade("ROLLING", symbol, "ROLL", abs(current_pos.position), delta=delta, notes=f"From {contract.localSymbol} to {new_contract.localSymbol}")
-                else:
-                    logger.error("❌ Rolling 失败: Net Credit 验证未通过。")
+            qty = abs(current_pos.position)
+            old_cost = ticker.ask
+            if old_cost is None or util.isNan(old_cost) or old_cost <= 0:
+                logger.warning(f"{contract.localSymbol} 无有效 Ask，无法计算买回成本，跳过此轮。")
+                return
+
+            # 多个到期日 × 行权价并发评估，按扣除佣金/滑点后的净收入选出最优方案
+            stock = Stock(symbol, 'SMART', 'USD')
+            await registry.qualify(self.ib, stock)
+            expiries = [get_next_friday(offset_weeks=k) for k in ROLL_EXPIRY_WEEKS]
+            plan = await plan_roll(self.ib, stock, old_cost, qty, self.cc_delta_target, expiries)
+            if not plan:
+                logger.error("❌ Rolling 失败: 所有候选到期日均未通过 Net Credit 验证。")
+                return
+
+            new_contract = plan.contract
+            # 使用 Bag 组合单减少滑点
+            buy_leg = ComboLeg(conId=contract.conId, ratio=1, action='BUY')
+            sell_leg = ComboLeg(conId=new_contract.conId, ratio=1, action='SELL')
+            roll_bag = Bag(symbol=symbol, comboLegs=[buy_leg, sell_leg])
+            self._roll_orders[contract.conId] = self.ib.placeOrder(roll_bag, MarketOrder('SELL', qty))
+            logger.info(f"✅ [ROLL] {contract.localSymbol} -> {new_contract.localSymbol} (净收入 ${plan.net:.2f})")
+            if self.roll_watcher:
+                await self.roll_watcher.replace(
+                    contract.conId, Position(current_pos.account, new_contract, -qty, plan.credit * 100)
+                )
+            await log_trade("ROLLING", symbol, "ROLL", qty, delta=delta, notes=f"From {contract.localSymbol} to {new_contract.localSymbol}, Net: {plan.net:.2f}",
+                            local_symbol=new_contract.localSymbol, vix=self.current_vix, mode=self.mode)
 
     # --- 核心逻辑 2：指数概率收割 (Put Credit Spread) ---
     async def manage_index_spreads(self):
         if self.force_exit_flag: return
-        candidate = self._get_index_candidate()
-        if not candidate:
+        candidates = self._get_index_candidates()
+        if not candidates:
             logger.warning("没有可用的指数候选，跳过 Spread 策略")
             return
 
         # 保护性检查：如果 VIX 极高 (如 > 40)，暂停开新 Spread 仓位
-        if self.current_vix and self.current_vix > 40:
+        if self.vol.regime == PANIC:
             logger.warning(f"🚨 恐慌模式 (VIX={self.current_vix:.2f})，暂停开仓 Put Credit Spread。")
             return
 
+        await self._run_bounded('Spread', [self._manage_index_spread(c) for c in candidates])
+
+    async def _manage_index_spread(self, candidate):
         symbol = candidate['symbol']
         exchange = candidate.get('exchange', 'CBOE')
+        # 宽度随模式/自学习的 PCS_WIDTH 变化，ETF 按价位缩放
+        width = self.pcs_width * candidate.get('width_scale', 1.0)
         logger.info(f">>> 扫描 {symbol} 现金流机会...")
 
-        index = Index(symbol, exchange, 'USD')
-        await self.ib.qualifyContractsAsync(index)
+        if candidate.get('sec_type', 'IND') == 'STK':
+            underlying = Stock(symbol, exchange, 'USD')
+        else:
+            underlying = Index(symbol, exchange, 'USD')
+        await registry.qualify(self.ib, underlying)
+        await self.market_data.hold(f'underlying:{symbol}', [underlying])
 
-        positions = [p for p in self.ib.positions() if p.contract.symbol == symbol and p.contract.secType == 'OPT']
-        if positions:
+        if self.positions.get(symbol, 'OPT'):
             logger.info(f"已有 {symbol} Spread 仓位，监控中...")
             return
 
-        expiry = datetime.now().strftime('%Y%m%d') # 0DTE
-        sell_side = await find_contract_by_delta(self.ib, index, expiry, self.pcs_sell_delta, 'P')
-        if not sell_side:
+        expiry = utils.now().strftime('%Y%m%d') # 0DTE
+        # 一次链截面联合选出两腿 (宽度在 pcs_width 附近浮动，避开流动性差的行权价)
+        pick = await select_put_spread(self.ib, underlying, expiry, self.pcs_sell_delta, width)
+        if not pick:
             return
-        if not await is_contract_liquid(self.ib, sell_side):
-            logger.warning(f'{symbol} 卖出腿流动性不足，跳过本轮')
-            return
-
-        buy_strike = sell_side.strike - self.pcs_width
-        buy_side = Option(symbol, expiry, buy_strike, 'P', exchange)
-        await self.ib.qualifyContractsAsync(buy_side)
-        if not await is_contract_liquid(self.ib, buy_side):
-            logger.warning(f'{symbol} 买入腿流动性不足，跳过本轮')
+        sell_side, buy_side = pick.sell, pick.buy
+        # 扫描期间 VIX 流式更新可能已切换到恐慌模式，下单前再读一次 (无额外请求)
+        if self.vol.regime == PANIC:
+            logger.warning(f"🚨 扫描期间进入恐慌模式，放弃开仓 {symbol} Spread。")
             return
 
         legs = [
@@ -209,10 +336,14 @@ class AIOptionsMaster:
         spread_bag = Bag(symbol=symbol, comboLegs=legs)
         self.ib.placeOrder(spread_bag, MarketOrder('SELL', 1))
         logger.info(f"🚀 [OPEN] {symbol} Spread: Sell {sell_side.strike}P / Buy {buy_side.strike}P")
-        await log_trade("SPREAD", symbol, "OPEN", 1, delta=self.pcs_sell_delta, notes=f"Sell {sell_side.strike}P, Buy {buy_side.strike}P, VIX: {self.current_vix}")
+        await log_trade("SPREAD", symbol, "OPEN", 1, delta=pick.sell_delta, notes=f"Sell {sell_side.strike}P, Buy {buy_side.strike}P, Credit: {pick.credit:.2f}, VIX: {self.current_vix}",
+                        local_symbol=sell_side.localSymbol, vix=self.current_vix, mode=self.mode)
 
     # --- 风控 ---
     async def risk_monitor(self):
+        """每轮兜底检查 (流式 PnL 熔断见 RiskEngine)"""
+        if self.risk_engine:
+            self.risk_engine.sync_positions(self.positions.all())
         acc_summary = await self.ib.accountSummaryAsync(self.account)
         nav_item = [item for item in acc_summary if item.tag == 'NetLiquidation']
         if not nav_item or not self.initial_nav: return
@@ -225,59 +356,147 @@ class AIOptionsMaster:
             await self.emergency_exit()
 
     async def emergency_exit(self):
+        # 流式熔断与每轮兜底检查可能先后触发，只执行一次
+        if self.force_exit_flag:
+            return
         self.force_exit_flag = True
-        self.ib.reqGlobalCancel() # 取消所有挂单
-        
-        positions = self.ib.positions()
-        for p in positions:
-            if p.contract.secType == 'OPT':
-                action = 'BUY' if p.position < 0 else 'SELL'
-                order = MarketOrder(action, abs(p.position))
-                self.ib.placeOrder(p.contract, order)
-                logger.warning(f"📢 [EXIT] 紧急平仓期权: {p.contract.localSymbol}")
-                await log_trade("EMERGENCY", p.contract.symbol, "EXIT", abs(p.position), notes=f"Emergency liquidation of {p.contract.localSymbol}")
-
-    async def run_loop(self):
+        # 紧急通道：平仓相关请求插队，且不受全局限速影响
+        with priority_lane(PRIORITY_URGENT):
+            self.ib.reqGlobalCancel() # 取消所有挂单
+
+            # 全部平仓单同时发出 (Spread 按组合单平仓)，并发跟踪成交并重试未成交部分
+            await self.exit_engine.liquidate(self.positions.all('OPT'))
+
+    def _on_regime_change(self, old, new):
+        # 环境切换时立即落一条快照，不等下一轮
+        for name, value in (('VIX', new.vix), ('VIX9D', new.vix9d), ('VIX3M', new.vix3m)):
+            if value:
+                asyncio.ensure_future(log_market_snapshot(name, value))
+
+    def _log_request_stats(self):
+        for request_class, s in self.ib.scheduler.stats().items():
+            if s['submitted'] or s['charged']:
+                logger.info(
+                    f"📶 IB 请求 [{request_class}]: 排队 {s['submitted']} / 直发 {s['charged']}, "
+                    f"队列峰值 {s['max_queue_depth']}, 平均等待 {s['avg_wait']*1000:.0f}ms, 最长 {s['max_wait']*1000:.0f}ms"
+                )
+        cache = ticker_cache.stats
+        if cache['hits'] or cache['misses']:
+            lookups = cache['hits'] + cache['misses']
+            logger.info(f"🗃️ 行情快照缓存: 命中 {cache['hits']}/{lookups} ({cache['hits'] / lookups:.0%})")
+        if self.market_data:
+            s = self.market_data.stats
+            logger.info(
+                f"📡 流式行情: 命中 {s['hits']}, 新开 {s['opened']}, 回收 {s['evicted']}, 快照 {s['snapshots']}"
+            )
+        if self.roll_watcher:
+            s = self.roll_watcher.stats
+            logger.info(
+                f"👀 Rolling 监控: {len(self.roll_watcher.watched)} 个合约, "
+                f"行情更新 {s['updates']} / 评估 {s['evaluations']} / 触发 {s['triggers']}"
+            )
+
+    def _prefetch_earnings(self):
+        return asyncio.ensure_future(earnings_service.prefetch(c['symbol'] for c in STOCK_CANDIDATES))
+
+    async def run_loop(self, max_cycles=None):
         await ensure_db()
+        await registry.warm_start()
+        if not self.replaying:
+            # 每次拉取的期权链截面写入列式存储 (回放的是历史数据，不重复落盘)
+            chain_store.install()
         await self.connect()
-        
+        # 快照汇总/清理在后台线程执行，不占用交易主循环
+        retention_task = None if self.replaying else asyncio.ensure_future(retention_loop())
+        # 财报日历在后台并发预热，策略中的财报检查直接查内存索引
+        prefetch_task = self._prefetch_earnings()
+
         iteration = 0
-        while True:
-            try:
-                # 每轮刷新 VIX 状态
-                self.current_vix = await fetch_vix(self.ib)
-                if self.current_vix:
-                    await log_market_snapshot('VIX', self.current_vix)
-                    logger.info(f"📊 当前 VIX: {self.current_vix:.2f}")
-
-                if is_trading_hours():
-                    # 每 6 轮 (约 1 小时) 运行一次自学习调参
-                    if iteration % 6 == 0:
-                        logger.info(f"🧠 正在运行自学习调参 (Mode: {self.mode})...")
-                        tuned = tune_parameters(self.mode)
-                        if tuned:
-                            logger.info(f"✨ 发现新优化参数: {tuned}")
-                        self.refresh_config()
-
-                    await self.risk_monitor()
-                    await self.manage_covered_calls()
-                    await self.manage_index_spreads()
-                else:
-                    logger.info("非交易时段，休眠中...")
-                
-                iteration += 1
-                await asyncio.sleep(600) # 10分钟/轮
-            except Exception as e:
-                logger.error(f"异常: {e}")
-                await asyncio.sleep(60)
+        try:
+            while max_cycles is None or iteration < max_cycles:
+                try:
+                    # 每轮记录波动率环境：流式订阅时直接读取当前值，否则退回 VIX 快照
+                    if self.vol.streaming:
+                        vol = self.vol.refresh()
+                    else:
+                        vix = await fetch_vix(self.ib)
+                        vol = self.vol.update('VIX', vix) if vix else self.vol.state
+                    if vol.vix:
+                        for name, value in (('VIX', vol.vix), ('VIX9D', vol.vix9d), ('VIX3M', vol.vix3m)):
+                            if value:
+                                await log_market_snapshot(name, value)
+                        slope = f", 期限斜率 {vol.slope:+.3f}" if vol.slope is not None else ""
+                        logger.info(f"📊 当前 VIX: {vol.vix:.2f} (EWMA {vol.vix_ewma:.2f}{slope}, {vol.regime})")
+
+                    # 其他进程 (调参、回测 --adopt) 写入的新参数即时生效，未变化时只需一次 stat
+                    self.refresh_config()
+
+                    # 回放录制的盘中数据时忽略本地时钟
+                    if self.replaying or is_trading_hours():
+                        # 每 6 轮 (约 1 小时) 运行一次自学习调参
+                        if iteration % 6 == 0:
+                            logger.info(f"🧠 正在运行自学习调参 (Mode: {self.mode})...")
+                            tuned = await tune_parameters_async(self.mode)
+                            if tuned:
+                                logger.info(f"✨ 发现新优化参数: {tuned}")
+                            self.refresh_config()
+
+                        await self.risk_monitor()
+                        await self.manage_covered_calls()
+                        await self.manage_index_spreads()
+                        if self.roll_watcher:
+                            self.roll_watcher.check_all()
+                            if self.replaying:
+                                # 回放不休眠，等本轮触发的 Rolling 完成再进入下一轮
+                                await self.roll_watcher.drain()
+                    else:
+                        logger.info("非交易时段，休眠中...")
+                        if prefetch_task.done():
+                            prefetch_task = self._prefetch_earnings()
+
+                    self._log_request_stats()
+                    iteration += 1
+                    if not self.replaying:
+                        await asyncio.sleep(600) # 10分钟/轮
+                except Exception as e:
+                    if self.replaying:
+                        raise
+                    logger.error(f"异常: {e}")
+                    await asyncio.sleep(60)
+        finally:
+            if retention_task:
+                retention_task.cancel()
+            await self.vol.stop()
+            prefetch_task.cancel()
+            if self.risk_engine:
+                self.risk_engine.stop()
+            self.positions.detach()
+            if self.roll_watcher:
+                await self.roll_watcher.close()
+            self.ib.disconnect()
+            # 退出前提交写入队列中剩余的记录
+            await chain_store.flush()
+            await close_db()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the OptionsBot with optional strategy mode")
     parser.add_argument('--mode', choices=list(STRATEGY_MODES.keys()), help='Strategy mode overrides STRATEGY_MODE env var')
+    parser.add_argument('--record', metavar='PATH', help='Record every IB request/response to PATH (gzip JSON lines)')
+    parser.add_argument('--replay', metavar='PATH', help='Run offline against a recording made with --record')
+    parser.add_argument('--cycles', type=int, help='Stop after N strategy cycles (useful with --replay)')
+    parser.add_argument('--event-driven', action='store_true',
+                        help='Roll short calls as soon as streamed delta/DTE cross the thresholds')
+    parser.add_argument('--earnings-file', metavar='PATH',
+                        help='Read earnings dates from a local CSV (symbol,date) or ICS file instead of yfinance')
     args = parser.parse_args()
+    configure_logging()
+
+    if args.earnings_file:
+        earnings_service.set_source(FileSource(args.earnings_file))
 
-    bot = AIOptionsMaster(mode=args.mode)
+    bot = AIOptionsMaster(mode=args.mode, record_path=args.record, replay_path=args.replay,
+                          event_driven=args.event_driven)
     try:
-        asyncio.run(bot.run_loop())
+        asyncio.run(bot.run_loop(max_cycles=args.cycles))
     except KeyboardInterrupt:
         logger.info("人工停止。")
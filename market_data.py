@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Set
+
+from ib_insync import Ticker, util
+
+from request_scheduler import pace
+
+logger = logging.getLogger(__name__)
+
+# IB 默认账户的行情线上限为 100，留几条给 TWS 自身
+DEFAULT_MAX_LINES = 95
+DATA_TIMEOUT = 4.0
+POLL_INTERVAL = 0.05
+# 快照行情 (reqTickersAsync) 的复用窗口 (秒)；0 表示不缓存
+SNAPSHOT_TTL = 2.0
+SNAPSHOT_CACHE_SIZE = 5000
+
+
+_request_counters: ContextVar[tuple] = ContextVar('ib_request_counters', default=())
+
+
+@contextmanager
+def count_requests():
+    """统计当前任务上下文内真正发往 IB 的请求 (按请求类别计数，round_trips 为等待次数)；可嵌套"""
+    counter = Counter()
+    token = _request_counters.set(_request_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _request_counters.reset(token)
+
+
+def note_request(kind: str, n: int = 1):
+    """记录一次发往 IB 的往返，n 为其中包含的合约/消息数"""
+    if n <= 0:
+        return
+    for counter in _request_counters.get():
+        counter[kind] += n
+        counter['round_trips'] += 1
+
+
+class TickerCache:
+    """
+    按 conId 缓存 reqTickersAsync 快照：窗口期内同一合约的重复读取 (如搜索后紧接着的流动性检查、
+    Rolling 时再次读取新合约报价) 直接复用，不再发往 IB。
+    """
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL, max_entries: int = SNAPSHOT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[int, tuple] = {}
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def clear(self):
+        self._entries.clear()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, contract) -> Optional[Ticker]:
+        entry = self._entries.get(contract.conId) if contract.conId else None
+        if entry and time.monotonic() - entry[0] <= self.ttl:
+            self.stats['hits'] += 1
+            return entry[1]
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, tickers):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        for ticker in tickers:
+            if ticker.contract is not None and ticker.contract.conId:
+                self._entries[ticker.contract.conId] = (now, ticker)
+        if len(self._entries) > self.max_entries:
+            self._entries = {k: v for k, v in self._entries.items() if now - v[0] <= self.ttl}
+
+    async def fetch(self, ib, contracts) -> List[Ticker]:
+        """窗口期内命中的直接返回，其余合并为一次 reqTickersAsync"""
+        result = [self.get(c) for c in contracts]
+        missing = [i for i, t in enumerate(result) if t is None]
+        if missing:
+            note_request('market_data', len(missing))
+            fetched = await ib.reqTickersAsync(*[contracts[i] for i in missing])
+            self.put(fetched)
+            for i, ticker in zip(missing, fetched):
+                result[i] = ticker
+        return [t for t in result if t is not None]
+
+
+ticker_cache = TickerCache()
+
+
+class _Line:
+    __slots__ = ('contract', 'ticker', 'refcount', 'last_used')
+
+    def __init__(self, contract, ticker):
+        self.contract = contract
+        self.ticker = ticker
+        self.refcount = 0
+        self.last_used = time.monotonic()
+
+
+def _has_data(ticker: Ticker) -> bool:
+    quoted = any(
+        v is not None and not util.isNan(v)
+        for v in (ticker.bid, ticker.ask, ticker.last, ticker.close)
+    )
+    if ticker.contract is not None and ticker.contract.secType in ('OPT', 'FOP'):
+        return quoted and ticker.modelGreeks is not None
+    return quoted
+
+
+class MarketDataManager:
+    """
+    基于 IB.reqMktData 的共享流式行情管理器。
+
+    - subscribe/release: 引用计数订阅，refcount>0 的行情线不会被回收；
+    - hold(owner, contracts): 按持有者整体替换订阅集合 (如 VIX、已持有空头 Call、标的)；
+    - get_tickers: 已订阅直接读取当前 Ticker (零延迟)，否则新开一条空闲行情线；
+      行情线预算用尽时按 LRU 回收 refcount=0 的空闲线，仍不足则退回快照 reqTickersAsync。
+    """
+
+    def __init__(self, ib, max_lines: int = DEFAULT_MAX_LINES, data_timeout: float = DATA_TIMEOUT):
+        self.ib = ib
+        self.max_lines = max_lines
+        self.data_timeout = data_timeout
+        self._lines: "OrderedDict[int, _Line]" = OrderedDict()
+        self._holders: Dict[str, Set[int]] = {}
+        self.stats = {'hits': 0, 'opened': 0, 'evicted': 0, 'snapshots': 0}
+
+    @property
+    def lines_in_use(self) -> int:
+        return len(self._lines)
+
+    def ticker(self, contract) -> Optional[Ticker]:
+        """零延迟读取已订阅合约的当前 Ticker；未订阅返回 None"""
+        line = self._lines.get(contract.conId)
+        if not line:
+            return None
+        self._touch(line)
+        return line.ticker
+
+    def _touch(self, line):
+        line.last_used = time.monotonic()
+        self._lines.move_to_end(line.contract.conId)
+
+    def _evict_idle(self, needed: int) -> int:
+        """按 LRU 回收空闲行情线，返回实际腾出的数量"""
+        freed = 0
+        for con_id in list(self._lines):
+            if freed >= needed:
+                break
+            line = self._lines[con_id]
+            if line.refcount > 0:
+                continue
+            self.ib.cancelMktData(line.contract)
+            del self._lines[con_id]
+            self.stats['evicted'] += 1
+            freed += 1
+        return freed
+
+    def _open_lines(self, contracts) -> List[_Line]:
+        """为未订阅的合约开行情线，返回新开的线 (预算不足时可能少于请求数)"""
+        overflow = self.lines_in_use + len(contracts) - self.max_lines
+        if overflow > 0:
+            self._evict_idle(overflow)
+        room = max(self.max_lines - self.lines_in_use, 0)
+        opened = []
+        for contract in contracts[:room]:
+            ticker = self.ib.reqMktData(contract)
+            line = _Line(contract, ticker)
+            self._lines[contract.conId] = line
+            opened.append(line)
+        self.stats['opened'] += len(opened)
+        note_request('market_data', len(opened))
+        return opened
+
+    async def _wait_for_data(self, tickers):
+        deadline = time.monotonic() + self.data_timeout
+        pending = [t for t in tickers if not _has_data(t)]
+        while pending and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            pending = [t for t in pending if not _has_data(t)]
+        if pending:
+            logger.debug(f"{len(pending)} 条行情线在 {self.data_timeout}s 内未收到完整数据")
+
+    async def subscribe(self, contract) -> Ticker:
+        line = self._lines.get(contract.conId)
+        if not line:
+            await pace(self.ib, 'market_data')
+            # 限速等待期间可能已被其他调用方打开
+            line = self._lines.get(contract.conId)
+        if not line:
+            opened = self._open_lines([contract])
+            if not opened:
+                raise RuntimeError(f"行情线预算已满 ({self.max_lines})，无法订阅 {contract.localSymbol or contract.symbol}")
+            line = opened[0]
+        # 先加引用再等待首笔数据，等待期间不会被并发请求回收
+        line.refcount += 1
+        self._touch(line)
+        await self._wait_for_data([line.ticker])
+        return line.ticker
+
+    def release(self, contract):
+        """释放一次引用；行情线保留为空闲线，直到被 LRU 回收"""
+        line = self._lines.get(contract.conId)
+        if line and line.refcount > 0:
+            line.refcount -= 1
+
+    async def hold(self, owner: str, contracts):
+        """将 owner 持有的订阅集合替换为 contracts"""
+        wanted = {c.conId: c for c in contracts if c.conId}
+        held = self._holders.get(owner, set())
+        for con_id in held - set(wanted):
+            line = self._lines.get(con_id)
+            if line:
+                self.release(line.contract)
+        for con_id in set(wanted) - held:
+            await self.subscribe(wanted[con_id])
+        self._holders[owner] = set(wanted)
+
+    async def get_tickers(self, *contracts) -> List[Ticker]:
+        result: Dict[int, Ticker] = {}
+        missing = []
+        for i, contract in enumerate(contracts):
+            line = self._lines.get(contract.conId) if contract.conId else None
+            if line:
+                self._touch(line)
+                self.stats['hits'] += 1
+                result[i] = line.ticker
+            else:
+                missing.append(i)
+
+        streamable = [i for i in missing if contracts[i].conId]
+        unique = list({contracts[i].conId: contracts[i] for i in streamable}.values())
+        if unique:
+            await pace(self.ib, 'market_data', len(unique))
+            # 限速等待期间其他调用方可能已打开部分合约
+            unique = [c for c in unique if c.conId not in self._lines]
+        self._open_lines(unique)
+        for i in streamable:
+            line = self._lines.get(contracts[i].conId)
+            if line:
+                result[i] = line.ticker
+
+        # 等待首笔数据期间临时加引用，避免并发请求腾预算时回收这些线 (预算不足的部分已走快照)
+        pending = {}
+        for i, ticker in result.items():
+            line = self._lines.get(contracts[i].conId)
+            if line and not _has_data(ticker):
+                pending[line.contract.conId] = line
+        for line in pending.values():
+            line.refcount += 1
+        try:
+            if pending:
+                await self._wait_for_data([line.ticker for line in pending.values()])
+        finally:
+            for line in pending.values():
+                line.refcount -= 1
+
+        leftover = [i for i in missing if i not in result]
+        if leftover:
+            self.stats['snapshots'] += len(leftover)
+            snapshots = await ticker_cache.fetch(self.ib, [contracts[i] for i in leftover])
+            for i, ticker in zip(leftover, snapshots):
+                result[i] = ticker
+        return [result[i] for i in range(len(contracts)) if i in result]
+
+    def close(self):
+        for line in self._lines.values():
+            self.ib.cancelMktData(line.contract)
+        self._lines.clear()
+        self._holders.clear()
+
+
+_manager: Optional[MarketDataManager] = None
+
+
+def install(ib, max_lines: int = DEFAULT_MAX_LINES) -> MarketDataManager:
+    """为该 IB 连接安装共享行情管理器，之后 req_tickers(ib, ...) 都从它读取"""
+    global _manager
+    if _manager is not None:
+        _manager.close()
+    _manager = MarketDataManager(ib, max_lines=max_lines)
+    return _manager
+
+
+def uninstall():
+    global _manager
+    if _manager is not None:
+        _manager.close()
+    _manager = None
+
+
+def get_manager(ib=None) -> Optional[MarketDataManager]:
+    if _manager is not None and (ib is None or _manager.ib is ib):
+        return _manager
+    return None
+
+
+async def req_tickers(ib, *contracts) -> List[Ticker]:
+    """reqTickersAsync 的替代：已安装管理器时读流式行情，否则读 (短时缓存的) 快照"""
+    manager = get_manager(ib)
+    if manager is None:
+        return await ticker_cache.fetch(ib, contracts)
+    return await manager.get_tickers(*contracts)
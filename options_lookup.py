@@ -1,10 +1,49 @@
 import asyncio
 import logging
-from typing import List, Optional, Tuple
-from ib_insync import Option, IB, Ticker
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from ib_insync import Option, IB, Ticker, util
+
+import chain_store
+from contract_registry import registry
+from market_data import count_requests, req_tickers
+from pricing import approximate_deltas
 
 logger = logging.getLogger(__name__)
 
+SEARCH_MODES = ('scan', 'model', 'bisect')
+IV_SAMPLE_ATTEMPTS = 2
+
+# 当前搜索已拉取过行情的行权价 (DeltaSearchResult.strikes_probed)
+_probed_strikes: ContextVar[Optional[set]] = ContextVar('probed_strikes', default=None)
+
+
+class ChainSnapshot(NamedTuple):
+    """一次批量行情拉取得到的期权链截面，各列按行权价升序排列；缺失报价/Greeks 为 NaN"""
+    symbol: str
+    expiry: str
+    right: str
+    underlying_price: float
+    taken_at: datetime
+    strikes: np.ndarray
+    bids: np.ndarray
+    asks: np.ndarray
+    deltas: np.ndarray     # |Delta|
+    ivs: np.ndarray
+    contracts: tuple
+
+
+class DeltaSearchResult(NamedTuple):
+    contract: Optional[Option]
+    mode: str
+    ib_requests: int       # 发往 IB 的合约级请求数 (合约确认 + 行情)
+    round_trips: int       # 等待 IB 响应的次数
+    strikes_probed: int    # 实际拉取了行情的行权价数量 (含没有返回 Greeks 的)
+
+
 async def find_contract_by_delta(
     ib: IB,
     underlying,
@@ -15,14 +54,73 @@ async def find_contract_by_delta(
     price_padding: Tuple[float, float] = (0.85, 1.15),
     chunk_size: int = 50,
     early_exit_diff: float = 0.02,
+    mode: str = 'scan',
+    iv_samples: int = 3,
+    confirm_count: int = 5,
+    probe_count: int = 3,
 ) -> Optional[Option]:
     """
     在期权链中查找与目标 Delta 最接近的合约。
+
+    mode='scan'   : 逐批拉取实时 Greeks，线性扫描。
+    mode='model'  : 先用少量 IV 样本 + Black-Scholes/Black-76 向量化估算整条链 Delta，
+                    只对最接近目标的 confirm_count 个行权价做实时确认。
+    mode='bisect' : 利用 Delta 对行权价单调，每轮探测 probe_count 个行权价夹逼目标，O(log n) 轮收敛。
     """
-    logger.info(f"找合约中: {underlying.symbol} {expiry} {right} 目标 Delta {target_delta}")
+    result = await search_contract_by_delta(
+        ib, underlying, expiry, target_delta, right, exchange=exchange, price_padding=price_padding,
+        chunk_size=chunk_size, early_exit_diff=early_exit_diff, mode=mode, iv_samples=iv_samples,
+        confirm_count=confirm_count, probe_count=probe_count,
+    )
+    return result.contract
+
+
+async def search_contract_by_delta(
+    ib: IB,
+    underlying,
+    expiry: str,
+    target_delta: float,
+    right: str,
+    exchange: str = 'SMART',
+    price_padding: Tuple[float, float] = (0.85, 1.15),
+    chunk_size: int = 50,
+    early_exit_diff: float = 0.02,
+    mode: str = 'scan',
+    iv_samples: int = 3,
+    confirm_count: int = 5,
+    probe_count: int = 3,
+) -> DeltaSearchResult:
+    """与 find_contract_by_delta 相同，但同时返回本次搜索消耗的 IB 请求数，便于比较各模式"""
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"未知的搜索模式: {mode}")
+    logger.info(f"找合约中: {underlying.symbol} {expiry} {right} 目标 Delta {target_delta} (mode={mode})")
+
+    probed = set()
+    token = _probed_strikes.set(probed)
+    try:
+        with count_requests() as counter:
+            candidates = await _search_candidates(
+                ib, underlying, expiry, target_delta, right, exchange, price_padding, chunk_size,
+                early_exit_diff, mode, iv_samples, confirm_count, probe_count,
+            )
+            contract = _pick_liquid_candidate(candidates) if candidates is not None else None
+    finally:
+        _probed_strikes.reset(token)
+
+    round_trips = counter.pop('round_trips', 0)
+    result = DeltaSearchResult(contract, mode, sum(counter.values()), round_trips, len(probed))
+    logger.info(
+        f"搜索完成 (mode={mode}): IB 请求 {result.ib_requests} 个, 往返 {result.round_trips} 次, "
+        f"探测 {result.strikes_probed} 个行权价"
+    )
+    return result
+
 
-    # 1. 获取期权参数
-    chains = await ib.reqSecDefOptParamsAsync(underlying.symbol, '', underlying.secType, underlying.conId)
+async def _search_candidates(ib, underlying, expiry, target_delta, right, exchange, price_padding, chunk_size,
+                             early_exit_diff, mode, iv_samples, confirm_count, probe_count):
+    """返回 [(delta 误差, ticker)]；链/价格不可用时返回 None"""
+    # 1. 获取期权参数 (命中注册表缓存时不产生 IB 请求)
+    chains = await registry.get_option_chains(ib, underlying)
     chain = next((c for c in chains if c.exchange == exchange), None)
     if not chain:
         logger.error(f"未找到适合的期权链 (Exchange: {exchange})")
@@ -33,58 +131,267 @@ async def find_contract_by_delta(
         return None
 
     # 2. 价格过滤
-    [underlying_ticker] = await ib.reqTickersAsync(underlying)
+    [underlying_ticker] = await req_tickers(ib, underlying)
     curr_price = underlying_ticker.marketPrice()
     if curr_price <= 0:
         logger.error(f"无法获取有效标的价格: {curr_price}")
         return None
 
+    # 3. 筛选行权价
+    potential_strikes = _filter_strikes(chain.strikes, curr_price, right, price_padding)[:120]
+    if not potential_strikes:
+        logger.warning("没有找到合适行权价范围内的合约")
+        return None
+
+    candidates = None
+    if mode == 'bisect':
+        candidates = await _bisect_candidates(
+            ib, underlying, expiry, right, exchange, potential_strikes, target_delta, probe_count,
+        )
+    elif mode == 'model':
+        candidates = await _model_candidates(
+            ib, underlying, expiry, right, exchange, curr_price, potential_strikes,
+            target_delta, iv_samples, confirm_count,
+        )
+        if candidates is None:
+            logger.warning("IV 样本不足，回退到线性扫描模式")
+    if candidates is None:
+        candidates = await _scan_candidates(
+            ib, underlying, expiry, right, exchange, potential_strikes,
+            target_delta, chunk_size, early_exit_diff,
+        )
+
+    # 搜索中拉到的报价落盘供回测使用
+    if candidates and chain_store.get_store() is not None:
+        chain_store.record(snapshot_from_tickers(
+            underlying.symbol, expiry, right, curr_price, [t for _, t in candidates]
+        ))
+    return candidates
+
+
+async def fetch_chain_snapshot(
+    ib: IB,
+    underlying,
+    expiry: str,
+    right: str,
+    exchange: str = 'SMART',
+    price_padding: Tuple[float, float] = (0.80, 1.20),
+    max_strikes: int = 120,
+) -> Optional[ChainSnapshot]:
+    """价外一侧最多 max_strikes 个行权价：一次批量确认 + 一次批量行情，返回整条链截面"""
+    chains = await registry.get_option_chains(ib, underlying)
+    chain = next((c for c in chains if c.exchange == exchange), None)
+    if not chain or expiry not in chain.expirations:
+        logger.error(f"{underlying.symbol} 没有 {expiry} 的期权链 (Exchange: {exchange})")
+        return None
+
+    [underlying_ticker] = await req_tickers(ib, underlying)
+    curr_price = underlying_ticker.marketPrice()
+    if util.isNan(curr_price) or curr_price <= 0:
+        logger.error(f"无法获取有效标的价格: {curr_price}")
+        return None
+
+    strikes = sorted(_filter_strikes(chain.strikes, curr_price, right, price_padding)[:max_strikes])
+    if not strikes:
+        logger.warning("没有找到合适行权价范围内的合约")
+        return None
+    qualified = await registry.qualify(
+        ib, *[Option(underlying.symbol, expiry, s, right, exchange) for s in strikes]
+    )
+    tickers = await req_tickers(ib, *qualified) if qualified else []
+    snapshot = snapshot_from_tickers(underlying.symbol, expiry, right, curr_price, tickers)
+    chain_store.record(snapshot)
+    return snapshot
+
+
+def snapshot_from_tickers(symbol, expiry, right, underlying_price, tickers) -> ChainSnapshot:
+    tickers = sorted(tickers, key=lambda t: t.contract.strike)
+
+    def column(values):
+        return np.array([np.nan if v is None or v == -1 else v for v in values], dtype=float)
+
+    return ChainSnapshot(
+        symbol=symbol,
+        expiry=expiry,
+        right=right,
+        underlying_price=float(underlying_price),
+        taken_at=datetime.now(),
+        strikes=column(t.contract.strike for t in tickers),
+        bids=column(t.bid for t in tickers),
+        asks=column(t.ask for t in tickers),
+        deltas=column(_ticker_delta(t) for t in tickers),
+        ivs=column(_ticker_iv(t) for t in tickers),
+        contracts=tuple(t.contract for t in tickers),
+    )
+
+
+def _filter_strikes(strikes, curr_price, right, price_padding) -> List[float]:
+    """价外且在价格带内的行权价，按离现价由近到远排序"""
     lower_bound = curr_price * price_padding[0]
     upper_bound = curr_price * price_padding[1]
-
-    # 3. 筛选行权价
     if right == 'C':
-        potential_strikes = [s for s in chain.strikes if lower_bound <= s <= upper_bound and s > curr_price]
-    else:
-        potential_strikes = [s for s in chain.strikes if lower_bound <= s <= upper_bound and s < curr_price]
-        potential_strikes.sort(reverse=True)
+        return sorted(s for s in strikes if lower_bound <= s <= upper_bound and s > curr_price)
+    return sorted((s for s in strikes if lower_bound <= s <= upper_bound and s < curr_price), reverse=True)
 
-    contracts = [Option(underlying.symbol, expiry, s, right, exchange) for s in potential_strikes[:120]]
-    if not contracts:
-        logger.warning("没有找到合适行权价范围内的合约")
+
+def _ticker_delta(ticker: Ticker) -> Optional[float]:
+    greeks = ticker.modelGreeks or ticker.lastGreeks
+    if not greeks or greeks.delta is None or util.isNan(greeks.delta):
         return None
+    return abs(greeks.delta)
+
+
+def _ticker_iv(ticker: Ticker) -> Optional[float]:
+    greeks = ticker.modelGreeks or ticker.lastGreeks
+    iv = greeks.impliedVol if greeks else None
+    if iv is None or util.isNan(iv) or iv <= 0:
+        iv = ticker.impliedVolatility
+    if iv is None or util.isNan(iv) or iv <= 0:
+        return None
+    return iv
+
+
+async def _probe_tickers(ib, *contracts) -> List[Ticker]:
+    """拉取期权行情，并把行权价记入当前搜索的 strikes_probed"""
+    probed = _probed_strikes.get()
+    if probed is not None:
+        probed.update(c.strike for c in contracts)
+    return await req_tickers(ib, *contracts)
+
+
+async def _scan_candidates(ib, underlying, expiry, right, exchange, strikes, target_delta, chunk_size, early_exit_diff):
+    contracts = [Option(underlying.symbol, expiry, s, right, exchange) for s in strikes]
 
     # 4. 资格确认
-    qualified = await ib.qualifyContractsAsync(*contracts)
+    qualified = await registry.qualify(ib, *contracts)
 
     candidates = []  # store tuples (diff, ticker)
 
     # 5. 分批拉取 Greeks
     for i in range(0, len(qualified), chunk_size):
         chunk = qualified[i:i + chunk_size]
-        tickers = await ib.reqTickersAsync(*chunk)
-        
+        tickers = await _probe_tickers(ib, *chunk)
+
         for t in tickers:
-            greeks = t.modelGreeks or t.marketGreeks
-            if not greeks or greeks.delta is None:
+            current_delta = _ticker_delta(t)
+            if current_delta is None:
                 continue
-            
-            current_delta = abs(greeks.delta)
             diff = abs(current_delta - target_delta)
             candidates.append((diff, t))
-            
+
         # 满足提前退出条件
         if candidates and min(c[0] for c in candidates) < early_exit_diff:
             break
-            
+
         await asyncio.sleep(0.1)
+    return candidates
+
+
+async def _model_candidates(ib, underlying, expiry, right, exchange, curr_price, strikes,
+                            target_delta, iv_samples, confirm_count):
+    """IV 抽样 → 向量化估算 Delta → 仅确认最接近目标的几个行权价；样本不足时返回 None"""
+    strike_arr = np.asarray(strikes, dtype=float)
+    sample_idx = np.unique(np.linspace(0, len(strikes) - 1, num=min(iv_samples, len(strikes))).round().astype(int))
 
+    candidates = []
+    sample_strikes, sample_ivs = [], []
+    sample_tickers = []
+    # 缺 Greeks 的样本点向相邻行权价补采一次，避免整体回退到线性扫描
+    for _ in range(IV_SAMPLE_ATTEMPTS):
+        pending = [i for i in sample_idx.tolist() if 0 <= i < len(strikes)]
+        if not pending:
+            break
+        samples = await registry.qualify(
+            ib,
+            *[Option(underlying.symbol, expiry, strikes[i], right, exchange) for i in pending]
+        )
+        tickers = await _probe_tickers(ib, *samples) if samples else []
+        sample_tickers.extend(tickers)
+        sampled = {t.contract.strike for t in tickers if _ticker_iv(t) is not None}
+        for t in tickers:
+            iv = _ticker_iv(t)
+            if iv is not None:
+                sample_strikes.append(t.contract.strike)
+                sample_ivs.append(iv)
+            current_delta = _ticker_delta(t)
+            if current_delta is not None:
+                candidates.append((abs(current_delta - target_delta), t))
+        sample_idx = np.array([i + 1 for i in pending if strikes[i] not in sampled], dtype=int)
+    if not sample_ivs:
+        return None
+
+    deltas = np.abs(approximate_deltas(
+        curr_price, strike_arr, expiry, sample_strikes, sample_ivs, right, sec_type=underlying.secType
+    ))
+    order = np.argsort(np.abs(deltas - target_delta), kind='stable')
+    sampled = {t.contract.strike for t in sample_tickers}
+    confirm = [strikes[i] for i in order if strikes[i] not in sampled][:confirm_count]
+    logger.info(
+        f"模型预选 {len(confirm)}/{len(strikes)} 个行权价 "
+        f"(IV 样本 {len(sample_ivs)} 个, 估算 Delta {deltas[order[0]]:.3f} @ {strikes[order[0]]})"
+    )
+    if confirm:
+        qualified = await registry.qualify(
+            ib,
+            *[Option(underlying.symbol, expiry, s, right, exchange) for s in confirm]
+        )
+        for t in await _probe_tickers(ib, *qualified):
+            current_delta = _ticker_delta(t)
+            if current_delta is not None:
+                candidates.append((abs(current_delta - target_delta), t))
+    return candidates
+
+
+async def _bisect_candidates(ib, underlying, expiry, right, exchange, strikes, target_delta, probe_count):
+    """
+    strikes 按离现价由近到远排列，|Delta| 沿该方向单调递减。
+    每轮在当前区间 (lo, hi) 内等距探测 probe_count 个行权价，收缩到夹住目标的最小区间。
+    """
+    probed = {}  # index -> (abs delta, ticker)；拿不到 Greeks 的记为 None
+
+    async def probe(indices):
+        indices = [i for i in dict.fromkeys(indices) if i not in probed]
+        if not indices:
+            return
+        qualified = await registry.qualify(
+            ib, *[Option(underlying.symbol, expiry, strikes[i], right, exchange) for i in indices]
+        )
+        by_strike = {c.strike: c for c in qualified}
+        tickers = await _probe_tickers(ib, *by_strike.values()) if by_strike else []
+        by_strike = {t.contract.strike: t for t in tickers}
+        for i in indices:
+            t = by_strike.get(strikes[i])
+            delta = _ticker_delta(t) if t is not None else None
+            probed[i] = (delta, t) if delta is not None else None
+
+    lo, hi = 0, len(strikes) - 1
+    first = np.linspace(lo, hi, num=min(probe_count + 2, len(strikes))).round().astype(int)
+    await probe(first.tolist())
+    while True:
+        valid = sorted((i, v[0]) for i, v in probed.items() if v is not None)
+        # 夹逼：lo 取最远的 |Delta|>=目标 的点，hi 取最近的 |Delta|<=目标 的点
+        above = [i for i, d in valid if d >= target_delta]
+        below = [i for i, d in valid if d <= target_delta]
+        lo = max(above) if above else 0
+        hi = min((i for i in below if i >= lo), default=len(strikes) - 1)
+        interior = [i for i in range(lo + 1, hi) if i not in probed]
+        if not interior or not valid:
+            break
+        if len(interior) <= probe_count:
+            picks = interior
+        else:
+            picks = [interior[(k + 1) * len(interior) // (probe_count + 1)] for k in range(probe_count)]
+        await probe(picks)
+
+    return [(abs(v[0] - target_delta), v[1]) for v in probed.values() if v is not None]
+
+
+def _pick_liquid_candidate(candidates, spread_threshold=0.1) -> Optional[Option]:
     if not candidates:
         logger.warning("未找到满足 Delta 要求的合约")
         return None
 
     candidates.sort(key=lambda x: x[0])
-    spread_threshold = 0.1
     best_contract = None
     best_diff = candidates[0][0]
 
@@ -105,7 +412,7 @@ async def find_contract_by_delta(
         logger.info(f"🎯 找到最优合约: {best_contract.localSymbol} (Delta 误差 {best_diff:.4f})")
     else:
         logger.warning("所有候选合约流动性不足，未选定合约")
-    
+
     return best_contract
 
 
@@ -113,7 +420,7 @@ async def is_contract_liquid(ib, contract, spread_threshold=0.1):
     """检查合约的 Bid-Ask spread/price 是否在合理范围内"""
     if not contract:
         return False
-    [ticker] = await ib.reqTickersAsync(contract)
+    [ticker] = await req_tickers(ib, contract)
     price = ticker.marketPrice()
     if price <= 0 or ticker.bid is None or ticker.ask is None:
         logger.warning(f"合约 {contract.localSymbol} 无效价格/报价，视为流动性不足")
@@ -125,3 +432,23 @@ async def is_contract_liquid(ib, contract, spread_threshold=0.1):
         )
         return False
     return True
+
+
+async def select_put_spread_legs(ib, underlying, expiry, sell_delta, width, leg_exchange='SMART', mode='scan'):
+    """
+    按 Delta 选卖出腿，再在 strike - width 处构建买入腿；任一腿流动性不足返回 (None, None)。
+    """
+    symbol = underlying.symbol
+    sell_side = await find_contract_by_delta(ib, underlying, expiry, sell_delta, 'P', mode=mode)
+    if not sell_side:
+        return None, None
+    if not await is_contract_liquid(ib, sell_side):
+        logger.warning(f'{symbol} 卖出腿流动性不足，跳过本轮')
+        return None, None
+
+    buy_side = Option(symbol, expiry, sell_side.strike - width, 'P', leg_exchange)
+    await registry.qualify(ib, buy_side)
+    if not await is_contract_liquid(ib, buy_side):
+        logger.warning(f'{symbol} 买入腿流动性不足，跳过本轮')
+        return None, None
+    return sell_side, buy_side
@@ -0,0 +1,145 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from ib_insync import Position
+
+logger = logging.getLogger(__name__)
+
+
+def position_key(contract):
+    """索引键 (symbol, secType, right, expiry)；正股/指数的 right/expiry 为空串"""
+    return (contract.symbol, contract.secType, contract.right or '', contract.lastTradeDateOrContractMonth or '')
+
+
+class PositionIndex:
+    """
+    内存持仓索引：启动时从 ib.positions() 构建一次，之后由 positionEvent (权威值)
+    与 execDetailsEvent (成交即时增量) 增量维护，按 (symbol, secType, right, expiry) O(1) 查询。
+    成交增量只是临时值：按 execId 记在权威持仓之上，下一次 positionEvent 到达时清空；
+    成交时间早于该合约最近一次权威持仓的 execDetails (已包含在内) 直接忽略。
+    """
+
+    def __init__(self, ib):
+        self.ib = ib
+        self._by_con_id: Dict[int, Position] = {}
+        self._by_key: Dict[tuple, Dict[int, Position]] = defaultdict(dict)
+        self._by_symbol: Dict[tuple, Dict[int, Position]] = defaultdict(dict)
+        self._applied_exec_ids = set()
+        self._reported: Dict[int, Position] = {}            # conId -> 最近一次权威持仓
+        self._synced_at: Dict[int, datetime] = {}           # conId -> 权威持仓到达时间 (UTC)
+        self._provisional: Dict[int, Dict[str, tuple]] = defaultdict(dict)   # conId -> execId -> (数量, 成本)
+        self._attached = False
+
+    def attach(self):
+        """全量构建索引并订阅持仓/成交事件 (重复调用只重建索引)"""
+        self.rebuild(self.ib.positions())
+        if not self._attached:
+            self.ib.positionEvent += self.on_position
+            self.ib.execDetailsEvent += self.on_exec_details
+            self._attached = True
+
+    def detach(self):
+        if self._attached:
+            self.ib.positionEvent -= self.on_position
+            self.ib.execDetailsEvent -= self.on_exec_details
+            self._attached = False
+
+    def rebuild(self, positions):
+        self._by_con_id.clear()
+        self._by_key.clear()
+        self._by_symbol.clear()
+        self._reported.clear()
+        self._synced_at.clear()
+        self._provisional.clear()
+        for p in positions:
+            self._sync(p)
+        logger.info(f"📒 持仓索引已构建: {len(self._by_con_id)} 个合约")
+
+    def _store(self, position: Position):
+        contract = position.contract
+        con_id = contract.conId
+        old = self._by_con_id.pop(con_id, None)
+        if old is not None:
+            self._discard(old)
+        if not position.position:
+            return
+        self._by_con_id[con_id] = position
+        self._by_key[position_key(contract)][con_id] = position
+        self._by_symbol[(contract.symbol, contract.secType)][con_id] = position
+
+    def _discard(self, position: Position):
+        contract = position.contract
+        for index, key in ((self._by_key, position_key(contract)),
+                           (self._by_symbol, (contract.symbol, contract.secType))):
+            bucket = index.get(key)
+            if bucket is None:
+                continue
+            bucket.pop(contract.conId, None)
+            if not bucket:
+                del index[key]
+
+    def _sync(self, position: Position):
+        con_id = position.contract.conId
+        self._reported[con_id] = position
+        self._synced_at[con_id] = datetime.now(timezone.utc)
+        self._provisional.pop(con_id, None)
+        self._store(position)
+
+    # --- 事件处理 ---
+    def on_position(self, position: Position):
+        """IB 推送的权威持仓，替换该合约此前所有成交增量"""
+        self._sync(position)
+
+    def on_exec_details(self, trade, fill):
+        """成交立即计入持仓，不必等到下一次 positionEvent"""
+        execution = fill.execution
+        contract = fill.contract
+        con_id = contract.conId
+        if contract.secType == 'BAG' or not con_id or execution.execId in self._applied_exec_ids:
+            return
+        self._applied_exec_ids.add(execution.execId)
+        executed = execution.time
+        if executed and executed.tzinfo is None:
+            executed = executed.replace(tzinfo=timezone.utc)
+        synced_at = self._synced_at.get(con_id)
+        if synced_at is not None and executed and executed <= synced_at:
+            return
+        signed = execution.shares if execution.side == 'BOT' else -execution.shares
+        multiplier = float(contract.multiplier or 1)
+        self._provisional[con_id][execution.execId] = (signed, execution.price * multiplier)
+
+        pending = self._provisional[con_id].values()
+        delta = sum(shares for shares, _ in pending)
+        base = self._reported.get(con_id)
+        if base is not None:
+            updated = base._replace(position=base.position + delta)
+        else:
+            updated = Position(execution.acctNumber, contract, delta, next(iter(pending))[1])
+        self._store(updated)
+
+    # --- 查询 ---
+    def get(self, symbol: str, sec_type: str, right: str = None, expiry: str = None) -> List[Position]:
+        """right/expiry 为 None 时匹配任意值"""
+        if right is not None and expiry is not None:
+            return list(self._by_key.get((symbol, sec_type, right, expiry), {}).values())
+        positions = self._by_symbol.get((symbol, sec_type), {}).values()
+        return [
+            p for p in positions
+            if (right is None or (p.contract.right or '') == right)
+            and (expiry is None or (p.contract.lastTradeDateOrContractMonth or '') == expiry)
+        ]
+
+    def first(self, symbol: str, sec_type: str, right: str = None, expiry: str = None) -> Optional[Position]:
+        found = self.get(symbol, sec_type, right, expiry)
+        return found[0] if found else None
+
+    def by_con_id(self, con_id: int) -> Optional[Position]:
+        return self._by_con_id.get(con_id)
+
+    def all(self, sec_type: str = None) -> List[Position]:
+        return [p for p in self._by_con_id.values() if sec_type is None or p.contract.secType == sec_type]
+
+    def __len__(self):
+        return len(self._by_con_id)
@@ -0,0 +1,137 @@
+import math
+from datetime import datetime, time
+
+import numpy as np
+import pytz
+
+import utils
+
+RISK_FREE_RATE = 0.04
+# 0DTE 收盘前也保留一小时的时间价值，避免 T→0 时 d1 发散
+MIN_YEAR_FRACTION = 1.0 / (365 * 24)
+MARKET_CLOSE = time(16, 0)
+
+_SQRT2 = math.sqrt(2.0)
+
+
+def year_fraction(expiry: str, now: datetime = None) -> float:
+    """到期日 (YYYYMMDD, 美东 16:00 收盘) 距今的年化时间"""
+    est = pytz.timezone('US/Eastern')
+    now = now or utils.now(est)
+    if now.tzinfo is None:
+        now = est.localize(now)
+    expiry_dt = est.localize(datetime.combine(datetime.strptime(expiry, '%Y%m%d').date(), MARKET_CLOSE))
+    seconds = (expiry_dt - now).total_seconds()
+    return max(seconds / (365 * 24 * 3600), MIN_YEAR_FRACTION)
+
+
+def norm_cdf(x):
+    """向量化标准正态 CDF (Abramowitz-Stegun 7.1.26, 误差 < 1.5e-7)"""
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x) / _SQRT2
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+# Acklam 逆正态 CDF 有理逼近系数 (相对误差 < 1.2e-9)
+_PPF_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+          1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_PPF_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+          6.680131188771972e+01, -1.328068155288572e+01)
+_PPF_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+          -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_PPF_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+_PPF_LOW = 0.02425
+
+
+def norm_ppf(p):
+    """向量化标准正态逆 CDF，p 须在 (0, 1) 内"""
+    p = np.asarray(p, dtype=float)
+    a, b, c, d = _PPF_A, _PPF_B, _PPF_C, _PPF_D
+    q = p - 0.5
+    r = q * q
+    central = (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+              (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+    tail_p = np.minimum(p, 1 - p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.sqrt(-2 * np.log(tail_p))
+    tail = (((((c[0] * t + c[1]) * t + c[2]) * t + c[3]) * t + c[4]) * t + c[5]) / \
+           ((((d[0] * t + d[1]) * t + d[2]) * t + d[3]) * t + 1)
+    tail = np.where(p < 0.5, tail, -tail)
+    return np.where(tail_p < _PPF_LOW, tail, central)
+
+
+def norm_pdf(x):
+    x = np.asarray(x, dtype=float)
+    return np.exp(-0.5 * x * x) / math.sqrt(2.0 * math.pi)
+
+
+def _d1(forward, strikes, t, iv):
+    strikes = np.asarray(strikes, dtype=float)
+    iv = np.maximum(np.asarray(iv, dtype=float), 1e-6)
+    vol_sqrt_t = iv * np.sqrt(t)
+    return (np.log(forward / strikes) + 0.5 * vol_sqrt_t ** 2) / vol_sqrt_t
+
+
+def black76_delta(forward, strikes, t, iv, right, rate=RISK_FREE_RATE):
+    """Black-76 远期 Delta，整条链一次向量化计算"""
+    d1 = _d1(forward, strikes, t, iv)
+    discount = math.exp(-rate * t)
+    if right == 'C':
+        return discount * norm_cdf(d1)
+    return discount * (norm_cdf(d1) - 1.0)
+
+
+def bs_delta(spot, strikes, t, iv, right, rate=RISK_FREE_RATE, dividend_yield=0.0):
+    """Black-Scholes 现货 Delta (连续股息率)，整条链一次向量化计算"""
+    forward = spot * np.exp((rate - dividend_yield) * np.asarray(t, dtype=float))
+    d1 = _d1(forward, strikes, t, iv)
+    carry = np.exp(-dividend_yield * np.asarray(t, dtype=float))
+    if right == 'C':
+        return carry * norm_cdf(d1)
+    return carry * (norm_cdf(d1) - 1.0)
+
+
+def bs_price(spot, strikes, t, iv, right, rate=RISK_FREE_RATE, dividend_yield=0.0):
+    """Black-Scholes 理论价，整条链一次向量化计算"""
+    strikes = np.asarray(strikes, dtype=float)
+    forward = spot * np.exp((rate - dividend_yield) * np.asarray(t, dtype=float))
+    d1 = _d1(forward, strikes, t, iv)
+    d2 = d1 - np.maximum(np.asarray(iv, dtype=float), 1e-6) * np.sqrt(t)
+    discount = np.exp(-rate * np.asarray(t, dtype=float))
+    if right == 'C':
+        return discount * (forward * norm_cdf(d1) - strikes * norm_cdf(d2))
+    return discount * (strikes * norm_cdf(-d2) - forward * norm_cdf(-d1))
+
+
+def strike_for_delta(spot, t, iv, delta, right, rate=RISK_FREE_RATE):
+    """bs_delta 的反函数：|Delta| 恰为 delta 的 (连续) 行权价，支持数组广播"""
+    iv = np.maximum(np.asarray(iv, dtype=float), 1e-6)
+    t = np.asarray(t, dtype=float)
+    vol_sqrt_t = iv * np.sqrt(t)
+    d1 = norm_ppf(delta) if right == 'C' else -norm_ppf(delta)
+    forward = np.asarray(spot, dtype=float) * np.exp(rate * t)
+    return forward * np.exp(0.5 * vol_sqrt_t ** 2 - d1 * vol_sqrt_t)
+
+
+def interpolate_iv(strikes, sample_strikes, sample_ivs):
+    """用少量 IV 样本线性插值出整条链的 IV (两端平推)"""
+    sample_strikes = np.asarray(sample_strikes, dtype=float)
+    sample_ivs = np.asarray(sample_ivs, dtype=float)
+    order = np.argsort(sample_strikes)
+    return np.interp(np.asarray(strikes, dtype=float), sample_strikes[order], sample_ivs[order])
+
+
+def approximate_deltas(spot, strikes, expiry, sample_strikes, sample_ivs, right, sec_type='STK', now=None):
+    """
+    根据标的价格与若干 IV 样本，估算整条链的 Delta。
+    指数 (IND) 使用 Black-76，个股/ETF 使用 Black-Scholes。
+    """
+    t = year_fraction(expiry, now)
+    iv = interpolate_iv(strikes, sample_strikes, sample_ivs)
+    if sec_type == 'IND':
+        forward = spot * math.exp(RISK_FREE_RATE * t)
+        return black76_delta(forward, strikes, t, iv, right)
+    return bs_delta(spot, strikes, t, iv, right)
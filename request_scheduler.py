@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_URGENT = 0   # 紧急平仓/撤单
+PRIORITY_HIGH = 1     # 下单相关
+PRIORITY_NORMAL = 2   # 常规扫描
+PRIORITY_LOW = 3      # 后台/预取
+
+# 每类请求的 (每秒速率, 突发容量)。IB 对单个客户端的总消息速率约为 50 条/秒。
+DEFAULT_LIMITS = {
+    'market_data': (20.0, 40.0),
+    'contract_details': (10.0, 20.0),
+    'orders': (10.0, 10.0),
+    'account': (2.0, 5.0),
+}
+GLOBAL_RATE = 45.0
+
+_priority_lane: ContextVar[Optional[int]] = ContextVar('ib_priority_lane', default=None)
+
+
+@contextmanager
+def priority_lane(priority: int):
+    """在该上下文 (及其派生的任务) 中发出的 IB 请求使用指定优先级"""
+    token = _priority_lane.set(priority)
+    try:
+        yield
+    finally:
+        _priority_lane.reset(token)
+
+
+def current_priority() -> int:
+    lane = _priority_lane.get()
+    return PRIORITY_NORMAL if lane is None else lane
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self, cost: float) -> float:
+        """距可支出 cost 个令牌还需等待的秒数 (超过容量的大批量只需攒满容量)"""
+        self._refill()
+        need = min(cost, self.capacity)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        """扣除令牌，允许透支 (透支部分会延后后续请求)"""
+        self._refill()
+        self.tokens -= cost
+
+
+class RequestScheduler:
+    """
+    IB API 请求调度器：每类请求一个令牌桶 + 全局令牌桶，
+    同类请求按优先级排队 (PRIORITY_URGENT 最先，且不受全局桶限制)。
+    """
+
+    def __init__(self, limits: Dict[str, tuple] = None, global_rate: float = GLOBAL_RATE):
+        limits = limits or DEFAULT_LIMITS
+        self._buckets = {cls: TokenBucket(rate, burst) for cls, (rate, burst) in limits.items()}
+        self._global = TokenBucket(global_rate, global_rate)
+        self._queues = {cls: [] for cls in limits}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+        self._seq = itertools.count()
+        self._stats = {
+            cls: {'submitted': 0, 'granted': 0, 'charged': 0, 'queue_depth': 0, 'max_queue_depth': 0,
+                  'total_wait': 0.0, 'max_wait': 0.0}
+            for cls in limits
+        }
+
+    def _bucket(self, request_class):
+        if request_class not in self._buckets:
+            raise ValueError(f"未知的请求类别: {request_class}")
+        return self._buckets[request_class]
+
+    async def acquire(self, request_class: str, cost: float = 1, priority: int = None, take: bool = True):
+        """排队等待令牌；take=False 时只等到令牌充足而不扣除 (由随后的同步调用 charge)"""
+        self._bucket(request_class)
+        priority = current_priority() if priority is None else priority
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues[request_class]
+        heapq.heappush(queue, (priority, next(self._seq), cost, take, future))
+        stats = self._stats[request_class]
+        stats['submitted'] += 1
+        stats['queue_depth'] = len(queue)
+        stats['max_queue_depth'] = max(stats['max_queue_depth'], len(queue))
+        self._ensure_dispatcher(request_class)
+
+        started = time.monotonic()
+        await future
+        waited = time.monotonic() - started
+        stats['total_wait'] += waited
+        stats['max_wait'] = max(stats['max_wait'], waited)
+
+    def charge(self, request_class: str, cost: float = 1):
+        """同步请求 (下单/开行情线) 不排队，直接扣令牌，透支会让后续排队请求让路"""
+        self._bucket(request_class).take(cost)
+        if current_priority() != PRIORITY_URGENT:
+            self._global.take(cost)
+        self._stats[request_class]['charged'] += 1
+
+    def _ensure_dispatcher(self, request_class):
+        task = self._dispatchers.get(request_class)
+        if task is None or task.done():
+            self._dispatchers[request_class] = asyncio.ensure_future(self._dispatch(request_class))
+
+    async def _dispatch(self, request_class):
+        queue = self._queues[request_class]
+        bucket = self._buckets[request_class]
+        stats = self._stats[request_class]
+        while queue:
+            priority, _, cost, take, future = queue[0]
+            if future.cancelled():
+                heapq.heappop(queue)
+                continue
+            wait = bucket.wait_time(cost)
+            if priority != PRIORITY_URGENT:
+                wait = max(wait, self._global.wait_time(cost))
+            if wait > 0:
+                # 等待期间可能有更高优先级的请求入队，醒来后重新取队首
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(queue)
+            if take:
+                bucket.take(cost)
+                if priority != PRIORITY_URGENT:
+                    self._global.take(cost)
+            stats['granted'] += 1
+            stats['queue_depth'] = len(queue)
+            future.set_result(None)
+        stats['queue_depth'] = 0
+
+    async def run(self, request_class: str, fn, *args, cost: float = 1, priority: int = None, **kwargs):
+        await self.acquire(request_class, cost, priority)
+        result = fn(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def stats(self) -> Dict[str, dict]:
+        snapshot = {}
+        for cls, s in self._stats.items():
+            s = dict(s)
+            s['avg_wait'] = s['total_wait'] / s['granted'] if s['granted'] else 0.0
+            snapshot[cls] = s
+        return snapshot
+
+
+# 异步请求：方法名 -> (请求类别, 是否按参数个数计费)
+_QUEUED = {
+    'reqTickersAsync': ('market_data', True),
+    'qualifyContractsAsync': ('contract_details', True),
+    'reqSecDefOptParamsAsync': ('contract_details', False),
+    'reqContractDetailsAsync': ('contract_details', False),
+    'accountSummaryAsync': ('account', False),
+    'reqPositionsAsync': ('account', False),
+    'reqExecutionsAsync': ('account', False),
+}
+
+# 同步请求：立即发出，只扣令牌
+_IMMEDIATE = {
+    'placeOrder': 'orders',
+    'cancelOrder': 'orders',
+    'reqGlobalCancel': 'orders',
+    'reqMktData': 'market_data',
+    'cancelMktData': 'market_data',
+    'reqPnL': 'account',
+    'reqPnLSingle': 'account',
+    'cancelPnL': 'account',
+    'cancelPnLSingle': 'account',
+}
+
+
+class PacedIB:
+    """
+    IB 的限速代理：与 IB 接口兼容，所有请求经 RequestScheduler 调度，其余属性/事件直接透传。
+    """
+
+    def __init__(self, ib, scheduler: RequestScheduler = None):
+        self._ib = ib
+        self.scheduler = scheduler or RequestScheduler()
+
+    def __getattr__(self, name):
+        attr = getattr(self._ib, name)
+        if name in _QUEUED:
+            request_class, per_arg = _QUEUED[name]
+
+            async def queued(*args, **kwargs):
+                cost = max(len(args), 1) if per_arg else 1
+                return await self.scheduler.run(request_class, attr, *args, cost=cost, **kwargs)
+
+            return queued
+        if name in _IMMEDIATE:
+            request_class = _IMMEDIATE[name]
+
+            def immediate(*args, **kwargs):
+                self.scheduler.charge(request_class)
+                return attr(*args, **kwargs)
+
+            return immediate
+        return attr
+
+
+async def pace(ib, request_class: str, cost: float = 1):
+    """在发出 cost 条同步请求前等待令牌就绪 (未使用 PacedIB 时直接返回)"""
+    if isinstance(ib, PacedIB):
+        await ib.scheduler.acquire(request_class, cost, take=False)
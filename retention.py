@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import data_logger
+from config import RETENTION_HOURLY_DAYS, RETENTION_INTERVAL, RETENTION_RAW_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy(NamedTuple):
+    raw_days: int = RETENTION_RAW_DAYS          # 原始快照保留天数
+    hourly_days: int = RETENTION_HOURLY_DAYS    # 小时 OHLC 保留天数 (日 OHLC 永久保留)
+    batch_hours: int = 48                       # 单次最多汇总的小时数，保证每轮耗时有界
+    batch_days: int = 7
+    delete_chunk: int = 5000                    # 每个删除事务的行数上限
+    # 整点过后再等待的秒数才汇总上一小时：时间戳早于整点的快照可能仍在 DbWriter 的批次中
+    # (FLUSH_INTERVAL 内)，提前推进水位线会让它们既不进入小时线、之后又被清理
+    settle_seconds: float = 60.0
+
+
+UPSERT_ROLLUP_SQL = """
+INSERT INTO market_rollups (symbol, resolution, bucket_start, open, high, low, close, samples)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(symbol, resolution, bucket_start) DO UPDATE SET
+    high = MAX(high, excluded.high),
+    low = MIN(low, excluded.low),
+    close = excluded.close,
+    samples = samples + excluded.samples
+"""
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat(timespec='seconds')
+
+
+def _hour_floor(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _day_floor(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _get_state(conn, name):
+    row = conn.execute("SELECT value FROM retention_state WHERE name = ?", (name,)).fetchone()
+    return datetime.fromisoformat(row[0]) if row else None
+
+
+def _set_state(conn, name, value: datetime):
+    conn.execute(
+        "INSERT INTO retention_state (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+        (name, _iso(value))
+    )
+
+
+def _ohlc(rows, bucket_of):
+    """rows 按 (symbol, 时间) 排序：[(symbol, ts, open, high, low, close, samples)] -> 每个桶一行"""
+    buckets = {}
+    for symbol, ts, o, h, l, c, n in rows:
+        key = (symbol, bucket_of(ts))
+        b = buckets.get(key)
+        if b is None:
+            buckets[key] = [o, h, l, c, n]
+        else:
+            b[1] = max(b[1], h)
+            b[2] = min(b[2], l)
+            b[3] = c
+            b[4] += n
+    return [(symbol, bucket, *values) for (symbol, bucket), values in buckets.items()]
+
+
+def _rollup_raw(conn, now, policy) -> int:
+    """已结束的整点小时：market_snapshots -> 1h OHLC"""
+    watermark = _get_state(conn, 'rollup_1h')
+    if watermark is None:
+        first = conn.execute("SELECT MIN(timestamp) FROM market_snapshots").fetchone()[0]
+        if first is None:
+            return 0
+        watermark = _hour_floor(datetime.fromisoformat(first))
+    end = min(_hour_floor(now - timedelta(seconds=policy.settle_seconds)), watermark + timedelta(hours=policy.batch_hours))
+    if end <= watermark:
+        return 0
+    rows = conn.execute(
+        "SELECT symbol, timestamp, value, value, value, value, 1 FROM market_snapshots "
+        "WHERE timestamp >= ? AND timestamp < ? AND value IS NOT NULL ORDER BY symbol, timestamp",
+        (_iso(watermark), _iso(end))
+    ).fetchall()
+    buckets = _ohlc(rows, lambda ts: ts[:13] + ':00:00')
+    with conn:
+        conn.executemany(UPSERT_ROLLUP_SQL, [(s, '1h', b, o, h, l, c, n) for s, b, o, h, l, c, n in buckets])
+        _set_state(conn, 'rollup_1h', end)
+    return len(buckets)
+
+
+def _rollup_hourly(conn, now, policy) -> int:
+    """小时线已汇总完整的自然日 (UTC)：1h -> 1d OHLC"""
+    hourly_mark = _get_state(conn, 'rollup_1h')
+    if hourly_mark is None:
+        return 0
+    watermark = _get_state(conn, 'rollup_1d')
+    if watermark is None:
+        first = conn.execute("SELECT MIN(bucket_start) FROM market_rollups WHERE resolution = '1h'").fetchone()[0]
+        if first is None:
+            return 0
+        watermark = _day_floor(datetime.fromisoformat(first))
+    end = min(_day_floor(now), _day_floor(hourly_mark), watermark + timedelta(days=policy.batch_days))
+    if end <= watermark:
+        return 0
+    rows = conn.execute(
+        "SELECT symbol, bucket_start, open, high, low, close, samples FROM market_rollups "
+        "WHERE resolution = '1h' AND bucket_start >= ? AND bucket_start < ? ORDER BY symbol, bucket_start",
+        (_iso(watermark), _iso(end))
+    ).fetchall()
+    buckets = _ohlc(rows, lambda ts: ts[:10] + 'T00:00:00')
+    with conn:
+        conn.executemany(UPSERT_ROLLUP_SQL, [(s, '1d', b, o, h, l, c, n) for s, b, o, h, l, c, n in buckets])
+        _set_state(conn, 'rollup_1d', end)
+    return len(buckets)
+
+
+def _prune(conn, table, where, params, chunk) -> int:
+    """分块删除，每块一个短事务，避免长时间持有写锁"""
+    deleted = 0
+    while True:
+        with conn:
+            cur = conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+                (*params, chunk)
+            )
+        deleted += cur.rowcount
+        if cur.rowcount < chunk:
+            return deleted
+
+
+def run_retention(path=None, policy: RetentionPolicy = None, now: datetime = None) -> dict:
+    """执行一轮增量汇总与清理 (同步；在后台线程中调用)"""
+    policy = policy or RetentionPolicy()
+    now = now or datetime.utcnow()
+    conn = sqlite3.connect(path or data_logger.DB_PATH)
+    try:
+        conn.execute("PRAGMA busy_timeout=5000")
+        stats = {
+            'hourly_buckets': _rollup_raw(conn, now, policy),
+            'daily_buckets': _rollup_hourly(conn, now, policy),
+        }
+        # 只删除已经汇总过的数据
+        raw_cutoff = min(now - timedelta(days=policy.raw_days), _get_state(conn, 'rollup_1h') or datetime.min)
+        stats['raw_deleted'] = _prune(
+            conn, 'market_snapshots', 'timestamp < ?', (_iso(raw_cutoff),), policy.delete_chunk
+        )
+        hourly_cutoff = min(now - timedelta(days=policy.hourly_days), _get_state(conn, 'rollup_1d') or datetime.min)
+        stats['hourly_deleted'] = _prune(
+            conn, 'market_rollups', "resolution = '1h' AND bucket_start < ?", (_iso(hourly_cutoff),),
+            policy.delete_chunk
+        )
+        stats['pages_freed'] = 0
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free:
+                conn.execute(f"PRAGMA incremental_vacuum({free})").fetchall()
+                stats['pages_freed'] = free
+        return stats
+    finally:
+        conn.close()
+
+
+async def run_retention_async(policy: RetentionPolicy = None) -> dict:
+    # 先提交本进程写入队列中的快照，再在后台线程汇总
+    await data_logger.flush_db()
+    return await asyncio.to_thread(run_retention, data_logger.DB_PATH, policy)
+
+
+async def retention_loop(interval: float = RETENTION_INTERVAL, policy: RetentionPolicy = None):
+    """后台任务：定期执行保留策略，不阻塞交易主循环"""
+    while True:
+        try:
+            stats = await run_retention_async(policy)
+            if any(stats.values()):
+                logger.info(
+                    f"🧹 快照保留: 新增小时线 {stats['hourly_buckets']} / 日线 {stats['daily_buckets']}, "
+                    f"删除原始 {stats['raw_deleted']} / 小时线 {stats['hourly_deleted']}, 释放 {stats['pages_freed']} 页"
+                )
+        except Exception as exc:
+            logger.warning(f"快照保留任务失败: {exc}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+import pytz
+from ib_insync import util
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+# 超过该秒数没有收到账户 PnL 推送时告警 (IB 正常约每秒推送一次)
+STALE_AFTER = 5.0
+
+
+def _valid(value) -> bool:
+    return value is not None and not util.isNan(value)
+
+
+def _trading_date():
+    return utils.now(pytz.timezone('US/Eastern')).date()
+
+
+class RiskEngine:
+    """
+    基于 IB 流式 PnL 的回撤熔断：订阅账户 PnL (reqPnL) 与逐仓 PnL (reqPnLSingle)，
+    每次推送即计算当日 (自启动或美东日期切换以来) 的亏损占初始 NAV 的比例，超过 max_drawdown 立即调用 on_breach，
+    不依赖策略主循环。IB 每个交易日重置 dailyPnL，基准随美东日期切换重新取。检测与处置耗时写入日志与 stats。
+    """
+
+    def __init__(self, ib, account: str, initial_nav: float, max_drawdown: float,
+                 on_breach: Callable[[], Awaitable]):
+        self.ib = ib
+        self.account = account
+        self.initial_nav = initial_nav
+        self.max_drawdown = max_drawdown
+        self.on_breach = on_breach
+        self.tripped = False
+        self._pnl = None
+        self._singles: Dict[int, object] = {}
+        self._baseline_daily: Optional[float] = None
+        self._single_baselines: Dict[int, float] = {}
+        self._baseline_date = None
+        self._last_update = None
+        self._task = None
+        self.stats = {'updates': 0, 'max_drawdown_seen': 0.0, 'detect_ms': None, 'react_ms': None}
+
+    def start(self):
+        if self._pnl is not None:
+            return
+        self.ib.pnlEvent += self._on_pnl
+        self.ib.pnlSingleEvent += self._on_pnl_single
+        self._pnl = self.ib.reqPnL(self.account)
+        logger.info(f"🛡️ 流式回撤监控已启动: 账户 {self.account}, 熔断线 {self.max_drawdown:.2%}")
+
+    def stop(self):
+        if self._pnl is None:
+            return
+        self.ib.pnlEvent -= self._on_pnl
+        self.ib.pnlSingleEvent -= self._on_pnl_single
+        self.ib.cancelPnL(self.account)
+        for con_id in list(self._singles):
+            self.ib.cancelPnLSingle(self.account, '', con_id)
+        self._singles.clear()
+        self._pnl = None
+
+    def sync_positions(self, positions):
+        """逐仓 PnL 订阅与当前持仓保持一致"""
+        if self._pnl is None:
+            return
+        wanted = {p.contract.conId for p in positions if p.contract.conId}
+        for con_id in set(self._singles) - wanted:
+            self.ib.cancelPnLSingle(self.account, '', con_id)
+            del self._singles[con_id]
+            self._single_baselines.pop(con_id, None)
+        for con_id in wanted - set(self._singles):
+            self._singles[con_id] = self.ib.reqPnLSingle(self.account, '', con_id)
+
+    def set_threshold(self, max_drawdown: float):
+        self.max_drawdown = max_drawdown
+
+    # --- 回撤计算 ---
+    def drawdown(self) -> Optional[float]:
+        """当日基准以来的亏损 / 初始 NAV；账户 PnL 尚未推送时用逐仓 PnL 之和估算"""
+        if not self.initial_nav:
+            return None
+        if self._pnl is not None and _valid(self._pnl.dailyPnL) and self._baseline_daily is not None:
+            loss = self._baseline_daily - self._pnl.dailyPnL
+        elif self._single_baselines:
+            loss = sum(
+                self._single_baselines[con_id] - s.dailyPnL
+                for con_id, s in self._singles.items()
+                if con_id in self._single_baselines and _valid(s.dailyPnL)
+            )
+        else:
+            return None
+        return loss / self.initial_nav
+
+    def _received_at(self) -> datetime:
+        """触发本次回调的 IB 消息到达时间 (离线回放等无 wrapper 时取当前时间)"""
+        wrapper = getattr(self.ib, 'wrapper', None)
+        received = getattr(wrapper, 'lastTime', None)
+        if not isinstance(received, datetime) or received == datetime.min:
+            return datetime.now(timezone.utc)
+        return received
+
+    def _roll_trading_day(self):
+        """美东日期切换后 IB 已重置 dailyPnL，前一日的基准不再适用"""
+        today = _trading_date()
+        if self._baseline_date == today:
+            return
+        if self._baseline_date is not None:
+            logger.info(f"🛡️ 新交易日 {today}，回撤基准重新计算")
+        self._baseline_date = today
+        self._baseline_daily = None
+        self._single_baselines.clear()
+
+    def _on_pnl(self, pnl):
+        if pnl.account != self.account:
+            return
+        self._roll_trading_day()
+        if self._baseline_daily is None and _valid(pnl.dailyPnL):
+            self._baseline_daily = pnl.dailyPnL
+        self._evaluate()
+
+    def _on_pnl_single(self, pnl_single):
+        if pnl_single.conId not in self._singles:
+            return
+        self._roll_trading_day()
+        if pnl_single.conId not in self._single_baselines and _valid(pnl_single.dailyPnL):
+            self._single_baselines[pnl_single.conId] = pnl_single.dailyPnL
+        self._evaluate()
+
+    def _evaluate(self):
+        received = self._received_at()
+        now = time.monotonic()
+        if self._last_update is not None and now - self._last_update > STALE_AFTER:
+            logger.warning(f"⚠️ PnL 推送间隔 {now - self._last_update:.1f}s，回撤监控可能滞后")
+        self._last_update = now
+        self.stats['updates'] += 1
+
+        drawdown = self.drawdown()
+        if drawdown is None:
+            return
+        self.stats['max_drawdown_seen'] = max(self.stats['max_drawdown_seen'], drawdown)
+        if self.tripped or drawdown <= self.max_drawdown:
+            return
+
+        self.tripped = True
+        detect_ms = (datetime.now(timezone.utc) - received).total_seconds() * 1000
+        self.stats['detect_ms'] = detect_ms
+        logger.error(
+            f"🚨 [FATAL] 流式 PnL 触发日回撤熔断 ({drawdown:.2%} > {self.max_drawdown:.2%})，"
+            f"检测耗时 {detect_ms:.0f}ms，执行紧急避险..."
+        )
+        self._log_worst_positions()
+        self._task = asyncio.ensure_future(self._react(now))
+
+    async def _react(self, detected_at):
+        try:
+            await self.on_breach()
+        except Exception as exc:
+            logger.error(f"紧急避险执行异常: {exc}")
+        react_ms = (time.monotonic() - detected_at) * 1000
+        self.stats['react_ms'] = react_ms
+        logger.error(f"🛑 紧急避险已提交，处置耗时 {react_ms:.0f}ms")
+
+    def _log_worst_positions(self, top: int = 3):
+        losses = sorted(
+            (
+                (self._single_baselines[con_id] - s.dailyPnL, con_id)
+                for con_id, s in self._singles.items()
+                if con_id in self._single_baselines and _valid(s.dailyPnL)
+            ),
+            reverse=True,
+        )
+        for loss, con_id in losses[:top]:
+            if loss > 0:
+                logger.error(f"   亏损贡献 conId={con_id}: ${loss:,.2f}")
+
+    async def wait(self):
+        """等待已触发的紧急避险完成"""
+        if self._task:
+            await self._task
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from ib_insync import IB, Option
+
+from market_data import get_manager
+from options_lookup import ChainSnapshot, fetch_chain_snapshot
+from utils import days_to_expiry, validate_net_credit
+
+logger = logging.getLogger(__name__)
+
+# 新合约 |Delta| 与目标的最大偏差
+DELTA_TOLERANCE = 0.05
+# 每个到期日只看离现价最近的这些价外行权价
+MAX_STRIKES = 40
+
+
+def fetch_concurrency(ib, expiries: int) -> int:
+    """同时拉取的到期日数：每个截面最多占 MAX_STRIKES 条行情线，合计不超出行情线预算"""
+    manager = get_manager(ib)
+    if manager is None:
+        return max(expiries, 1)
+    return max(min(manager.max_lines // MAX_STRIKES, expiries), 1)
+
+
+class RollPlan(NamedTuple):
+    contract: Option
+    expiry: str
+    credit: float        # 新合约 Bid
+    net: float           # validate_net_credit 计算的整单净收入 (美元)
+    delta: float
+    dte: int
+    score: float         # 每剩余自然日的净收入
+
+
+def score_roll_candidates(snapshot: ChainSnapshot, old_cost: float, qty: int, target_delta: float,
+                          delta_tolerance: float = DELTA_TOLERANCE, spread_threshold: float = 0.1):
+    """
+    对一个到期日截面的所有行权价打分，返回 (净收入数组, 得分数组)；不可行的为 -inf。
+    可行：Delta 接近目标、报价流动性达标、扣除佣金与滑点后净收入为正 (validate_net_credit)。
+    """
+    bids, asks = snapshot.bids, snapshot.asks
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mid = (bids + asks) / 2
+        liquid = (bids > 0) & ((asks - bids) / mid <= spread_threshold)
+        near_target = np.abs(snapshot.deltas - target_delta) <= delta_tolerance
+        ok, net = validate_net_credit(bids, old_cost, qty)
+        feasible = liquid & near_target & ok
+    dte = max(days_to_expiry(snapshot.expiry), 1)
+    score = np.where(feasible, net / dte, -np.inf)
+    return np.where(feasible, net, -np.inf), score
+
+
+async def plan_roll(
+    ib: IB,
+    underlying,
+    old_cost: float,
+    qty: int,
+    target_delta: float,
+    expiries: List[str],
+    right: str = 'C',
+    delta_tolerance: float = DELTA_TOLERANCE,
+) -> Optional[RollPlan]:
+    """
+    拉取各候选到期日的链截面 (并发数受行情线预算限制，见 fetch_concurrency)，
+    对所有 (到期日, 行权价) 用 validate_net_credit 评估，返回每剩余自然日净收入最高的方案；全部不可行时返回 None。
+    """
+    slots = asyncio.Semaphore(fetch_concurrency(ib, len(expiries)))
+
+    async def fetch(expiry):
+        async with slots:
+            return await fetch_chain_snapshot(ib, underlying, expiry, right, max_strikes=MAX_STRIKES)
+
+    snapshots = await asyncio.gather(*(fetch(expiry) for expiry in expiries), return_exceptions=True)
+
+    best = None
+    for expiry, snapshot in zip(expiries, snapshots):
+        if isinstance(snapshot, Exception):
+            logger.warning(f"{underlying.symbol} {expiry} 链截面获取失败: {snapshot}")
+            continue
+        if snapshot is None or not len(snapshot.strikes):
+            continue
+        net, score = score_roll_candidates(snapshot, old_cost, qty, target_delta, delta_tolerance)
+        i = int(np.argmax(score))
+        if not np.isfinite(score[i]):
+            logger.info(f"{underlying.symbol} {expiry}: 无满足 Delta/流动性/净收入要求的行权价")
+            continue
+        plan = RollPlan(
+            contract=snapshot.contracts[i],
+            expiry=expiry,
+            credit=float(snapshot.bids[i]),
+            net=float(net[i]),
+            delta=float(snapshot.deltas[i]),
+            dte=days_to_expiry(expiry),
+            score=float(score[i]),
+        )
+        if best is None or plan.score > best.score:
+            best = plan
+
+    if best:
+        logger.info(
+            f"🧭 {underlying.symbol} 最优 Rolling: {best.contract.localSymbol or best.contract.strike} "
+            f"({best.expiry}, Delta {best.delta:.3f}), 净收入 ${best.net:.2f} (DTE {best.dte})"
+        )
+    return best
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict
+
+from ib_insync import util
+
+from market_data import get_manager
+from utils import days_to_expiry
+
+logger = logging.getLogger(__name__)
+
+# 同一合约两次评估之间的最小间隔 (秒)；期间的行情更新合并为一次尾部评估
+DEBOUNCE_SECONDS = 1.0
+# 触发 Rolling 后的冷却期，避免订单成交前同一持仓被反复触发
+COOLDOWN_SECONDS = 300.0
+
+
+class _Watch:
+    __slots__ = ('position', 'ticker', 'last_eval', 'last_fired', 'pending')
+
+    def __init__(self, position, ticker):
+        self.position = position
+        self.ticker = ticker
+        self.last_eval = 0.0
+        self.last_fired = float('-inf')
+        self.pending = None
+
+
+class RollWatcher:
+    """
+    事件驱动的 Rolling 触发器：已持有空头 Call 的行情线常驻订阅，
+    每次 Greeks 更新 (按合约去抖) 检查 Delta/DTE，越过阈值即调用 on_trigger(position)。
+    """
+
+    def __init__(self, ib, on_trigger: Callable[[object], Awaitable], delta_threshold: float, dte_threshold: int,
+                 debounce: float = DEBOUNCE_SECONDS, cooldown: float = COOLDOWN_SECONDS):
+        self.ib = ib
+        self.on_trigger = on_trigger
+        self.delta_threshold = delta_threshold
+        self.dte_threshold = dte_threshold
+        self.debounce = debounce
+        self.cooldown = cooldown
+        self._watches: Dict[int, _Watch] = {}
+        self._inflight = set()
+        self._tasks = set()
+        self.stats = {'updates': 0, 'evaluations': 0, 'triggers': 0}
+
+    def set_thresholds(self, delta_threshold: float, dte_threshold: int):
+        self.delta_threshold = delta_threshold
+        self.dte_threshold = dte_threshold
+
+    @property
+    def watched(self):
+        return [w.position for w in self._watches.values()]
+
+    async def sync(self, positions):
+        """将监控集合替换为 positions (当前持有的空头 Call)"""
+        wanted = {p.contract.conId: p for p in positions if p.contract.conId}
+        for con_id in set(self._watches) - set(wanted):
+            await self._unwatch(con_id)
+        for con_id, position in wanted.items():
+            if con_id in self._watches:
+                self._watches[con_id].position = position
+            else:
+                await self.watch(position)
+
+    async def watch(self, position):
+        contract = position.contract
+        watch = self._watches.get(contract.conId)
+        if watch:
+            watch.position = position
+            return
+        manager = get_manager(self.ib)
+        if manager is None:
+            raise RuntimeError("RollWatcher 需要先 market_data.install(ib)")
+        await manager.hold(f'roll_watch:{contract.conId}', [contract])
+        ticker = manager.ticker(contract)
+        watch = _Watch(position, ticker)
+        self._watches[contract.conId] = watch
+        ticker.updateEvent += self._on_update
+        logger.info(f"👀 开始监控 {contract.localSymbol} (Delta>{self.delta_threshold} 或 DTE<{self.dte_threshold} 触发 Rolling)")
+        # 订阅时已有的 Greeks 立即评估一次
+        self._evaluate(contract.conId)
+
+    async def replace(self, old_con_id: int, position):
+        """Rolling 下单后立即停止监控旧合约并改为监控新合约，不等下一轮 sync"""
+        await self._unwatch(old_con_id)
+        await self.watch(position)
+
+    async def _unwatch(self, con_id):
+        watch = self._watches.pop(con_id, None)
+        if not watch:
+            return
+        watch.ticker.updateEvent -= self._on_update
+        if watch.pending:
+            watch.pending.cancel()
+        manager = get_manager(self.ib)
+        if manager:
+            await manager.hold(f'roll_watch:{con_id}', [])
+
+    def _on_update(self, ticker):
+        con_id = ticker.contract.conId if ticker.contract else None
+        watch = self._watches.get(con_id)
+        if not watch:
+            return
+        self.stats['updates'] += 1
+        if watch.pending:
+            return
+        wait = watch.last_eval + self.debounce - time.monotonic()
+        if wait <= 0:
+            self._evaluate(con_id)
+        else:
+            watch.pending = asyncio.get_event_loop().call_later(wait, self._evaluate, con_id)
+
+    def _evaluate(self, con_id):
+        watch = self._watches.get(con_id)
+        if not watch:
+            return
+        if watch.pending:
+            watch.pending.cancel()
+            watch.pending = None
+        watch.last_eval = time.monotonic()
+        self.stats['evaluations'] += 1
+        if con_id in self._inflight or watch.last_eval - watch.last_fired < self.cooldown:
+            return
+        if self._crossed(watch):
+            watch.last_fired = watch.last_eval
+            self._fire(con_id, watch.position)
+
+    def _crossed(self, watch) -> bool:
+        contract = watch.position.contract
+        if days_to_expiry(contract.lastTradeDateOrContractMonth) < self.dte_threshold:
+            return True
+        greeks = watch.ticker.modelGreeks
+        if greeks is None or greeks.delta is None or util.isNan(greeks.delta):
+            return False
+        return abs(greeks.delta) > self.delta_threshold
+
+    def _fire(self, con_id, position):
+        self.stats['triggers'] += 1
+        self._inflight.add(con_id)
+
+        async def run():
+            try:
+                await self.on_trigger(position)
+            except Exception as exc:
+                logger.error(f"Rolling 触发处理异常 ({position.contract.localSymbol}): {exc}")
+            finally:
+                self._inflight.discard(con_id)
+
+        task = asyncio.ensure_future(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def check_all(self):
+        """周期性兜底检查 (DTE 随日期跨越阈值时可能没有行情更新)"""
+        for con_id in list(self._watches):
+            self._evaluate(con_id)
+
+    async def drain(self):
+        """等待已触发的 Rolling 全部完成"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self):
+        for con_id in list(self._watches):
+            await self._unwatch(con_id)
+        for task in self._tasks:
+            task.cancel()
@@ -1,28 +1,80 @@
+import asyncio
 import json
+import math
 import sqlite3
-from statistics import mean
-from typing import Optional
+from typing import NamedTuple, Optional
 
-from config import DB_PATH, LEARNED_CONFIG_PATH, load_parameters, save_learned_config
+import data_logger
+from config import load_parameters, parameter_store, save_learned_config
 
 
-def _average_delta_for_type(cursor, trade_type):
-    cursor.execute(
-        "SELECT delta FROM trades WHERE trade_type = ? AND delta IS NOT NULL",
-        (trade_type,)
-    )
-    rows = [row[0] for row in cursor.fetchall() if row[0] is not None]
-    return mean(rows) if rows else None
+class DeltaStats(NamedTuple):
+    """某类成交 Delta 的运行汇总 (由 trade_stats 触发器随成交写入维护)"""
+    count: int
+    mean: float
+    m2: float
+    ewma: float
+
+    @property
+    def variance(self) -> Optional[float]:
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def stdev(self) -> Optional[float]:
+        var = self.variance
+        return math.sqrt(var) if var is not None else None
+
+
+def merge_stats(parts) -> Optional[DeltaStats]:
+    """合并多个分组的汇总 (Chan 并行算法)；EWMA 按样本数加权"""
+    total = None
+    for s in parts:
+        if total is None:
+            total = s
+            continue
+        count = total.count + s.count
+        diff = s.mean - total.mean
+        total = DeltaStats(
+            count,
+            total.mean + diff * s.count / count,
+            total.m2 + s.m2 + diff * diff * total.count * s.count / count,
+            (total.ewma * total.count + s.ewma * s.count) / count,
+        )
+    return total
+
+
+def load_trade_stats(conn, mode: str) -> dict:
+    """
+    trade_type -> DeltaStats：优先使用该 mode 自己的汇总，
+    该 mode 尚无样本时合并所有 mode (含无 mode 的历史记录) 的汇总。
+    """
+    rows = conn.execute("SELECT trade_type, mode, count, mean, m2, ewma FROM trade_stats").fetchall()
+    by_type = {}
+    for trade_type, row_mode, *values in rows:
+        by_type.setdefault(trade_type, {})[row_mode] = DeltaStats(*values)
+    return {
+        trade_type: modes[mode] if mode in modes else merge_stats(modes.values())
+        for trade_type, modes in by_type.items()
+    }
 
 
 def tune_parameters(mode: str = 'base') -> dict:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    """读取 trade_stats 汇总 (每类成交一行，耗时与成交历史长度无关) 并写入 learned_config"""
+    # 单独运行 (python self_tuner.py) 时数据库可能尚未迁移，与其他入口一样先建表/升级
+    data_logger._init_db()
+    conn = sqlite3.connect(data_logger.DB_PATH)
+    try:
+        stats = load_trade_stats(conn, mode)
+    finally:
+        conn.close()
+
+    def mean_of(trade_type):
+        s = stats.get(trade_type)
+        return s.mean if s and s.count else None
 
-    covered_delta = _average_delta_for_type(cursor, 'COVERED_CALL')
-    roll_delta = _average_delta_for_type(cursor, 'ROLLING')
-    spread_delta = _average_delta_for_type(cursor, 'SPREAD')
-    conn.close()
+    covered_delta = mean_of('COVERED_CALL')
+    roll_delta = mean_of('ROLLING')
+    spread_delta = mean_of('SPREAD')
 
     tuned = {}
     base_params = load_parameters(mode)
@@ -38,13 +90,14 @@ def tune_parameters(mode: str = 'base') -> dict:
     return tuned
 
 
+async def tune_parameters_async(mode: str = 'base') -> dict:
+    """在工作线程中调参，不阻塞事件循环；先提交写入队列，保证统计包含刚记录的成交"""
+    await data_logger.flush_db()
+    return await asyncio.to_thread(tune_parameters, mode)
+
+
 def summarize(mode: str = 'base') -> dict:
-    try:
-        with LEARNED_CONFIG_PATH.open() as f:
-            tuned = json.load(f)
-        return tuned.get(mode, {})
-    except Exception:
-        return {}
+    return parameter_store.learned(mode)
 
 
 if __name__ == '__main__':
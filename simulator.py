@@ -0,0 +1,301 @@
+import argparse
+import json
+import time
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from config import ELEVATED_DELTA_SCALE, ROLL_EXPIRY_WEEKS, STRATEGY_MODES, load_parameters
+from pricing import MIN_YEAR_FRACTION, bs_delta, bs_price, strike_for_delta
+from spread_optimizer import MIN_CREDIT
+from utils import validate_net_credit
+from vix_monitor import ELEVATED, PANIC, REGIMES, regime_paths
+
+MULTIPLIER = 100
+# 与 is_near_earnings 的默认窗口一致
+EARNINGS_WINDOW = 3
+
+
+class MarketPaths(NamedTuple):
+    """(路径 × 交易日) 的行情矩阵；历史回放即 1 条路径"""
+    dates: np.ndarray           # (days,) datetime64[D]
+    spot: np.ndarray            # (paths, days) 收盘价
+    iv: np.ndarray              # (paths, days) 年化隐含波动率
+    vix: np.ndarray             # (paths, days)
+    near_earnings: np.ndarray   # (days,) bool，财报前 EARNINGS_WINDOW 天内
+    term_slope: Optional[np.ndarray] = None    # (paths, days) (VIX3M - VIX9D) / VIX；None 为未知
+
+    @property
+    def paths(self) -> int:
+        return self.spot.shape[0]
+
+    def regimes(self) -> np.ndarray:
+        """逐日收盘的波动率环境 (vix_monitor.REGIMES 下标)，与实盘 VolRegimeService 同一套升降级规则"""
+        return regime_paths(self.vix, self.term_slope, np.diff(_days(self.dates)) * 86400.0)
+
+
+class SimulationResult(NamedTuple):
+    equity: np.ndarray      # (paths, days) 逐日盯市累计盈亏 ($)
+    trades: np.ndarray      # (paths,) 下单次数 (开仓、Rolling 组合单各算一次)
+
+    @property
+    def pnl(self) -> np.ndarray:
+        return self.equity[:, -1]
+
+    @property
+    def max_drawdown(self) -> np.ndarray:
+        peak = np.maximum.accumulate(np.maximum(self.equity, 0.0), axis=1)
+        return np.max(peak - self.equity, axis=1)
+
+    def summary(self) -> dict:
+        pnl = self.pnl
+        return {
+            'paths': int(len(pnl)),
+            'mean': float(np.mean(pnl)),
+            'median': float(np.median(pnl)),
+            'p05': float(np.percentile(pnl, 5)),
+            'p95': float(np.percentile(pnl, 95)),
+            'win_rate': float(np.mean(pnl > 0)),
+            'mean_max_drawdown': float(np.mean(self.max_drawdown)),
+            'trades': float(np.mean(self.trades)),
+        }
+
+    def __add__(self, other):
+        return SimulationResult(self.equity + other.equity, self.trades + other.trades)
+
+
+def _days(dates) -> np.ndarray:
+    """datetime64[D] -> 距 1970-01-01 的天数 (int64)，便于向量化日期运算"""
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def next_friday(days, offset_weeks: int = 0):
+    """get_next_friday 的向量化版本：周五及周末取下周五 (输入输出均为 epoch 天数)"""
+    weekday = (days + 3) % 7        # 1970-01-01 是周四
+    ahead = 4 - weekday
+    ahead = np.where(ahead <= 0, ahead + 7, ahead)
+    return days + ahead + 7 * offset_weeks
+
+
+def near_earnings_mask(dates, earnings_dates, within_days: int = EARNINGS_WINDOW) -> np.ndarray:
+    days = _days(dates)
+    earnings = np.sort(_days(earnings_dates)) if len(earnings_dates) else np.empty(0, np.int64)
+    if not len(earnings):
+        return np.zeros(len(days), dtype=bool)
+    i = np.searchsorted(earnings, days)
+    upcoming = earnings[np.minimum(i, len(earnings) - 1)]
+    return (i < len(earnings)) & (upcoming - days <= within_days)
+
+
+def trading_days(start, count: int) -> np.ndarray:
+    return np.busday_offset(np.datetime64(start, 'D'), np.arange(count), roll='forward')
+
+
+def _broadcast(values, shape, default=None):
+    if values is None:
+        return default
+    return np.broadcast_to(np.asarray(values, dtype=float), shape).copy()
+
+
+def from_history(dates, close, iv, vix=None, earnings_dates=(), term_slope=None) -> MarketPaths:
+    """历史序列 -> 单路径 MarketPaths；未给 VIX 时以 IV×100 代替"""
+    spot = np.atleast_2d(np.asarray(close, dtype=float))
+    iv = _broadcast(iv, spot.shape)
+    return MarketPaths(
+        dates=np.asarray(dates, dtype='datetime64[D]'),
+        spot=spot,
+        iv=iv,
+        vix=_broadcast(vix, spot.shape, iv * 100),
+        near_earnings=near_earnings_mask(dates, earnings_dates),
+        term_slope=_broadcast(term_slope, spot.shape),
+    )
+
+
+def monte_carlo(spot: float, dates, paths: int, iv, vix=None, realized_vol=None, drift: float = 0.0,
+                earnings_dates=(), term_slope=None, seed: Optional[int] = None) -> MarketPaths:
+    """
+    几何布朗运动路径，所有路径与交易日一次生成。realized_vol 为路径的实际波动率 (默认等于 IV)；
+    低于 IV 即模拟波动率风险溢价，否则期权按公允价成交，期望盈亏约为零。
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    shape = (paths, len(dates))
+    iv = _broadcast(iv, shape)
+    vol = iv if realized_vol is None else _broadcast(realized_vol, shape)
+    dt = np.diff(_days(dates), prepend=_days(dates)[:1]) / 365.0
+    z = np.random.default_rng(seed).standard_normal(shape)
+    log_returns = (drift - 0.5 * vol ** 2) * dt + vol * np.sqrt(dt) * z
+    return MarketPaths(
+        dates=dates,
+        spot=spot * np.exp(np.cumsum(log_returns, axis=1)),
+        iv=iv,
+        vix=_broadcast(vix, shape, iv * 100),
+        near_earnings=near_earnings_mask(dates, earnings_dates),
+        term_slope=_broadcast(term_slope, shape),
+    )
+
+
+def _round_strike(strikes, step):
+    return np.round(np.asarray(strikes) / step) * step
+
+
+def _years(expiry_days, today):
+    return np.maximum((expiry_days - today) / 365.0, MIN_YEAR_FRACTION)
+
+
+def simulate_covered_calls(market: MarketPaths, params: dict, strike_step: float = 1.0) -> SimulationResult:
+    """
+    每条路径 1 张 Covered Call (只计期权腿盈亏)，按 _manage_covered_call / check_and_roll_call 的规则：
+    - 财报前 EARNINGS_WINDOW 天内整轮跳过 (不开仓也不 Rolling)
+    - 无仓位时卖出下一个周五到期、Delta≈CC_DELTA_TARGET 的 Call，波动率环境非 CALM (VIX > VIX_ELEVATED
+      或期限结构倒挂，降级带回差) 时目标乘 ELEVATED_DELTA_SCALE
+    - Delta > ROLL_DELTA_THRESHOLD 或 DTE < ROLL_DTE_THRESHOLD 时，在 ROLL_EXPIRY_WEEKS 中选
+      通过 validate_net_credit 且 净收入/DTE 最高的到期日滚动；都不通过则继续持有
+    - 到期日与实盘相同先做 Rolling 检查 (DTE 为 -1)，当日未 Rolling 的仓位再按收盘价结算内在价值
+    持仓有路径依赖 (是否持仓、行权价、到期日都取决于前一日的决策)，无法用累积运算展开，按交易日推进；
+    每一步对全部路径做数组运算，耗时与路径数基本无关。
+    """
+    target = params['CC_DELTA_TARGET']
+    roll_delta, roll_dte = params['ROLL_DELTA_THRESHOLD'], params['ROLL_DTE_THRESHOLD']
+    n_paths, n_days = market.spot.shape
+    days = _days(market.dates)
+
+    has = np.zeros(n_paths, dtype=bool)
+    strike = np.zeros(n_paths)
+    expiry = np.zeros(n_paths, dtype=np.int64)
+    cash = np.zeros(n_paths)
+    trades = np.zeros(n_paths, dtype=np.int64)
+    equity = np.empty((n_paths, n_days))
+    prev_spot = market.spot[:, 0]
+    elevated = market.regimes() >= REGIMES.index(ELEVATED)
+
+    for d in range(n_days):
+        today, spot, iv = days[d], market.spot[:, d], market.iv[:, d]
+
+        # 到期日休市：按之前最后一个收盘价结算
+        lapsed = has & (expiry < today)
+        if lapsed.any():
+            cash -= np.where(lapsed, np.maximum(prev_spot - strike, 0.0), 0.0)
+            has &= ~lapsed
+
+        skip = market.near_earnings[d]
+        if not skip:
+            t = _years(expiry, today)
+            # 与 days_to_expiry 的盘中口径一致 (到期日零点 - 当前时刻)
+            dte = expiry - today - 1
+            delta = bs_delta(spot, np.where(has, strike, spot), t, iv, 'C')
+            trigger = has & ((delta > roll_delta) | (dte < roll_dte))
+            if trigger.any():
+                old_cost = bs_price(spot, strike, t, iv, 'C')
+                best_score = np.full(n_paths, -np.inf)
+                new_strike, new_expiry, new_credit = strike.copy(), expiry.copy(), np.zeros(n_paths)
+                for weeks in ROLL_EXPIRY_WEEKS:
+                    exp_k = next_friday(today, weeks)
+                    t_k = _years(exp_k, today)
+                    k = _round_strike(strike_for_delta(spot, t_k, iv, target, 'C'), strike_step)
+                    credit = bs_price(spot, k, t_k, iv, 'C')
+                    ok, net = validate_net_credit(credit, old_cost, 1)
+                    score = np.where(ok, net / max(exp_k - today - 1, 1), -np.inf)
+                    better = trigger & (score > best_score)
+                    best_score = np.where(better, score, best_score)
+                    new_strike = np.where(better, k, new_strike)
+                    new_expiry = np.where(better, exp_k, new_expiry)
+                    new_credit = np.where(better, credit, new_credit)
+                rolled = trigger & np.isfinite(best_score)
+                cash += np.where(rolled, new_credit - old_cost, 0.0)
+                strike, expiry = np.where(rolled, new_strike, strike), np.where(rolled, new_expiry, expiry)
+                trades += rolled
+
+        # 到期结算：当日未 Rolling 的仓位按收盘价结算
+        expired = has & (expiry == today)
+        if expired.any():
+            cash -= np.where(expired, np.maximum(spot - strike, 0.0), 0.0)
+            has &= ~expired
+
+        if not skip:
+            opening = ~has
+            if opening.any():
+                effective = np.where(elevated[:, d], target * ELEVATED_DELTA_SCALE, target)
+                exp0 = next_friday(today)
+                t0 = _years(exp0, today)
+                k = _round_strike(strike_for_delta(spot, t0, iv, effective, 'C'), strike_step)
+                cash += np.where(opening, bs_price(spot, k, t0, iv, 'C'), 0.0)
+                strike = np.where(opening, k, strike)
+                expiry = np.where(opening, exp0, expiry)
+                trades += opening
+                has |= opening
+
+        mark = np.where(has, bs_price(spot, np.where(has, strike, spot), _years(expiry, today), iv, 'C'), 0.0)
+        equity[:, d] = (cash - mark) * MULTIPLIER
+        prev_spot = spot
+
+    return SimulationResult(equity, trades)
+
+
+def simulate_put_spreads(market: MarketPaths, params: dict, strike_step: float = 5.0) -> SimulationResult:
+    """
+    每个交易日开 1 组当日到期的 Put Credit Spread，按 manage_index_spreads 的规则：
+    卖出 |Delta|≈PCS_SELL_DELTA，买入腿低 PCS_WIDTH，净收入低于 MIN_CREDIT 不开；波动率环境为 PANIC 时暂停开仓。
+    环境按日收盘推进 (实盘为逐笔推进，盘中的升降级在此只体现在收盘值上)。
+    日线数据没有盘中价格，以前一交易日收盘价建仓、当日收盘结算，定价时间取两根日线的间隔。
+    各日互相独立，全部 (路径 × 交易日) 一次向量化计算。宽度固定为 PCS_WIDTH (不模拟实盘按流动性浮动宽度)。
+    """
+    sell_delta, width = params['PCS_SELL_DELTA'], params['PCS_WIDTH']
+    entry, close = market.spot[:, :-1], market.spot[:, 1:]
+    iv = market.iv[:, :-1]
+    panic = market.regimes()[:, :-1] >= REGIMES.index(PANIC)
+    t = np.maximum(np.diff(_days(market.dates)) / 365.0, MIN_YEAR_FRACTION)
+
+    sell = _round_strike(strike_for_delta(entry, t, iv, sell_delta, 'P'), strike_step)
+    buy = sell - width
+    credit = bs_price(entry, sell, t, iv, 'P') - bs_price(entry, buy, t, iv, 'P')
+    active = ~panic & (credit >= MIN_CREDIT)
+    pnl = np.where(active, credit - np.clip(sell - close, 0.0, width), 0.0) * MULTIPLIER
+
+    equity = np.concatenate((np.zeros((market.paths, 1)), np.cumsum(pnl, axis=1)), axis=1)
+    return SimulationResult(equity, active.sum(axis=1))
+
+
+def simulate_mode(mode: str, cc_market: Optional[MarketPaths] = None, pcs_market: Optional[MarketPaths] = None,
+                  params: dict = None) -> dict:
+    params = params or load_parameters(mode)
+    results = {}
+    if cc_market is not None:
+        results['covered_call'] = simulate_covered_calls(cc_market, params)
+    if pcs_market is not None:
+        results['put_spread'] = simulate_put_spreads(pcs_market, params)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Monte Carlo P&L of a strategy mode (covered calls + 0DTE put spreads)')
+    parser.add_argument('--mode', choices=list(STRATEGY_MODES.keys()), default='base')
+    parser.add_argument('--paths', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=252, help='Trading days to simulate')
+    parser.add_argument('--start', default=str(np.datetime64('today', 'D')))
+    parser.add_argument('--index-spot', type=float, default=5000.0)
+    parser.add_argument('--index-iv', type=float, default=0.16)
+    parser.add_argument('--index-rv', type=float, default=0.13, help='Realized volatility of the index paths')
+    parser.add_argument('--stock-spot', type=float, default=200.0)
+    parser.add_argument('--stock-iv', type=float, default=0.30)
+    parser.add_argument('--stock-rv', type=float, default=0.26, help='Realized volatility of the stock paths')
+    parser.add_argument('--earnings-every', type=int, default=63, help='Trading days between stock earnings (0: none)')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    dates = trading_days(args.start, args.days)
+    earnings = dates[args.earnings_every // 2::args.earnings_every] if args.earnings_every else ()
+    started = time.perf_counter()
+    index = monte_carlo(args.index_spot, dates, args.paths, args.index_iv, realized_vol=args.index_rv, seed=args.seed)
+    stock = monte_carlo(args.stock_spot, dates, args.paths, args.stock_iv, vix=index.vix, realized_vol=args.stock_rv,
+                        earnings_dates=earnings, seed=None if args.seed is None else args.seed + 1)
+    results = simulate_mode(args.mode, stock, index)
+    elapsed = time.perf_counter() - started
+
+    report = {name: r.summary() for name, r in results.items()}
+    report['combined'] = (results['covered_call'] + results['put_spread']).summary()
+    print(json.dumps(report, indent=2))
+    print(f"{args.paths} paths × {args.days} days in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
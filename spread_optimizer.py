@@ -0,0 +1,126 @@
+import logging
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from ib_insync import IB, Option
+
+from market_data import count_requests
+from options_lookup import ChainSnapshot, fetch_chain_snapshot
+
+logger = logging.getLogger(__name__)
+
+# 卖出腿 |Delta| 与目标的最大偏差
+DELTA_TOLERANCE = 0.03
+# 宽度搜索范围 (相对配置的 pcs_width)
+WIDTH_RANGE = (0.5, 1.5)
+# 每张最低净收入 (卖出腿 Bid - 买入腿 Ask)
+MIN_CREDIT = 0.05
+# 流动性惩罚权重：两腿 Spread/Mid 恰好等于阈值时，得分打 (1 - LIQUIDITY_WEIGHT) 折
+LIQUIDITY_WEIGHT = 0.5
+# 宽度偏离惩罚权重：宽度落在搜索范围边缘时，得分打 (1 - WIDTH_WEIGHT) 折
+WIDTH_WEIGHT = 0.5
+
+
+class SpreadPick(NamedTuple):
+    sell: Option
+    buy: Option
+    credit: float       # 按对手价成交的净收入 (sell.bid - buy.ask)
+    width: float
+    sell_delta: float
+    score: float
+
+
+def score_put_spreads(
+    snapshot: ChainSnapshot,
+    sell_delta: float,
+    min_width: float,
+    max_width: float,
+    delta_tolerance: float = DELTA_TOLERANCE,
+    spread_threshold: float = 0.1,
+    min_credit: float = MIN_CREDIT,
+    target_width: Optional[float] = None,
+) -> np.ndarray:
+    """
+    对截面内所有 (卖出腿 i, 买入腿 j) 组合一次性打分，返回 n×n 矩阵；不可行的组合为 -inf。
+    卖出腿先取有可行组合中 |Delta| 最接近 sell_delta 的行权价，再在其组合中按
+    净收入/宽度 × 流动性系数 × 宽度偏离系数 排序；两腿的 Spread/Mid 都须不超过 spread_threshold。
+    target_width 默认取 [min_width, max_width] 的中点。
+    """
+    strikes, bids, asks = snapshot.strikes, snapshot.bids, snapshot.asks
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mid = (bids + asks) / 2
+        spread_ratio = (asks - bids) / mid
+        liquid = np.isfinite(spread_ratio) & (mid > 0) & (spread_ratio <= spread_threshold)
+        short_ok = liquid & (bids > 0) & (np.abs(snapshot.deltas - sell_delta) <= delta_tolerance)
+
+        width = strikes[:, None] - strikes[None, :]
+        credit = bids[:, None] - asks[None, :]
+        feasible = (
+            short_ok[:, None] & liquid[None, :]
+            & (width >= min_width) & (width <= max_width)
+            & (credit >= min_credit)
+        )
+        # 只保留 Delta 偏差最小的卖出腿 (否则得分总是偏向 Delta 更高、权利金更厚的行权价)
+        deviation = np.abs(snapshot.deltas - sell_delta)
+        has_pair = feasible.any(axis=1)
+        if has_pair.any():
+            feasible &= (deviation <= deviation[has_pair].min() + 1e-9)[:, None]
+
+        if target_width is None:
+            target_width = (min_width + max_width) / 2
+        half_range = max(max_width - target_width, target_width - min_width, 1e-9)
+        width_fit = 1 - WIDTH_WEIGHT * np.abs(width - target_width) / half_range
+        liquidity = 1 - LIQUIDITY_WEIGHT * (spread_ratio[:, None] + spread_ratio[None, :]) / (2 * spread_threshold)
+        score = credit / width * liquidity * width_fit
+    return np.where(feasible, score, -np.inf)
+
+
+def best_put_spread(snapshot: ChainSnapshot, sell_delta: float, width: float,
+                    width_range: Tuple[float, float] = WIDTH_RANGE, **kwargs) -> Optional[SpreadPick]:
+    if snapshot is None or len(snapshot.strikes) < 2:
+        return None
+    scores = score_put_spreads(snapshot, sell_delta, width * width_range[0], width * width_range[1],
+                               target_width=width, **kwargs)
+    i, j = np.unravel_index(np.argmax(scores), scores.shape)
+    if not np.isfinite(scores[i, j]):
+        return None
+    return SpreadPick(
+        sell=snapshot.contracts[i],
+        buy=snapshot.contracts[j],
+        credit=float(snapshot.bids[i] - snapshot.asks[j]),
+        width=float(snapshot.strikes[i] - snapshot.strikes[j]),
+        sell_delta=float(snapshot.deltas[i]),
+        score=float(scores[i, j]),
+    )
+
+
+async def select_put_spread(
+    ib: IB,
+    underlying,
+    expiry: str,
+    sell_delta: float,
+    width: float,
+    exchange: str = 'SMART',
+    width_range: Tuple[float, float] = WIDTH_RANGE,
+    **kwargs,
+) -> Optional[SpreadPick]:
+    """
+    拉取一次 Put 链截面，联合选出最优的 (卖出腿, 买入腿)；
+    固定宽度处的买入腿流动性不足时，会自动选用范围内其他宽度。
+    """
+    with count_requests() as counter:
+        snapshot = await fetch_chain_snapshot(ib, underlying, expiry, 'P', exchange=exchange)
+    pick = best_put_spread(snapshot, sell_delta, width, width_range, **kwargs)
+    round_trips = counter.pop('round_trips', 0)
+    if pick is None:
+        logger.warning(
+            f"{underlying.symbol} 未找到满足 Delta≈{sell_delta}、宽度 {width * width_range[0]:g}-{width * width_range[1]:g} "
+            f"且两腿流动性达标的 Spread"
+        )
+        return None
+    logger.info(
+        f"🎯 {underlying.symbol} 最优 Spread: Sell {pick.sell.strike}P (Delta {pick.sell_delta:.3f}) / "
+        f"Buy {pick.buy.strike}P, 宽度 {pick.width:g}, 净收入 {pick.credit:.2f}, 得分 {pick.score:.4f} "
+        f"(IB 请求 {sum(counter.values())} 个, 往返 {round_trips} 次)"
+    )
+    return pick
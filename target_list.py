@@ -1,6 +1,6 @@
 # OptionsBot: 可配置的标的列表
 
-# 股票候选池：按优先级排序。
+# 股票候选池：每个满足持仓条件的标的都会并发管理 Covered Call。
 # 机器人会检查账户中是否有满足 min_shares 的持仓。
 STOCK_CANDIDATES = [
     {"symbol": "GOOG", "min_shares": 100},
@@ -8,9 +8,11 @@ STOCK_CANDIDATES = [
     {"symbol": "MSFT", "min_shares": 100},
 ]
 
-# 指数候选池：策略会从中选择标的进行 Spread 操作。
+# 指数候选池：策略会对每个标的并发进行 Spread 操作。
+# sec_type 默认为 IND；ETF 需标记为 STK (期权经 SMART 路由)。
+# width_scale：Spread 宽度 = 模式 (含自学习) 的 PCS_WIDTH × width_scale，按标的价位相对 SPX 缩放 (ETF 约为 1/10)。
 INDEX_CANDIDATES = [
     {"symbol": "SPX", "exchange": "CBOE"},
-    {"symbol": "QQQ", "exchange": "NASDAQ"},
-    {"symbol": "SPY", "exchange": "SMART"},
+    {"symbol": "QQQ", "exchange": "SMART", "sec_type": "STK", "width_scale": 0.1},
+    {"symbol": "SPY", "exchange": "SMART", "sec_type": "STK", "width_scale": 0.1},
 ]
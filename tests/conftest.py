@@ -10,3 +10,21 @@ except RuntimeError:
 
 # Add repo root to sys.path so tests can import project modules even when under tests/ package.
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _reset_shared_caches():
+    """模块级缓存在测试之间不共享状态"""
+    from contract_registry import registry
+    from market_data import ticker_cache
+    from earnings_calendar import earnings_service
+    registry.clear()
+    ticker_cache.clear()
+    earnings_service.clear()
+    yield
+    registry.clear()
+    ticker_cache.clear()
+    earnings_service.clear()
@@ -0,0 +1,98 @@
+import json
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+import pytz
+from ib_insync import Option
+
+import backtest
+from backtest import Snapshot, evaluate, param_grid, run_sweep, simulate_covered_calls, simulate_put_spreads
+from chain_store import ChainStore
+from config import load_parameters
+from options_lookup import ChainSnapshot
+
+EASTERN = pytz.timezone('US/Eastern')
+PARAMS = {'CC_DELTA_TARGET': 0.15, 'PCS_SELL_DELTA': 0.07, 'PCS_WIDTH': 30,
+          'ROLL_DELTA_THRESHOLD': 0.45, 'ROLL_DTE_THRESHOLD': 1}
+
+
+def _snap(day, hour, expiry, right, price, strikes, bids, asks, deltas):
+    ts = EASTERN.localize(datetime(day.year, day.month, day.day, hour)).timestamp()
+    return Snapshot(ts, day, expiry, (expiry - day).days, right, price,
+                    np.asarray(strikes, dtype=float), np.asarray(bids, dtype=float),
+                    np.asarray(asks, dtype=float), np.asarray(deltas, dtype=float))
+
+
+def _puts(day, hour, price):
+    strikes = [4900, 4910, 4920, 4930, 4940, 4950]
+    bids = [0.50, 0.70, 0.95, 1.25, 1.60, 2.10]
+    return _snap(day, hour, day, 'P', price, strikes, bids, [b + 0.05 for b in bids],
+                 [0.03, 0.04, 0.05, 0.06, 0.07, 0.09])
+
+
+def test_put_spread_held_to_expiry_and_settled_at_last_price():
+    d1, d2 = date(2026, 10, 15), date(2026, 10, 16)
+    # 10-15 收盘跌穿两腿，10-16 收盘在两腿之上
+    snaps = [_puts(d1, 10, 5000), _puts(d1, 15, 4925), _puts(d2, 10, 5000), _puts(d2, 15, 5010),
+             _puts(date(2026, 10, 19), 10, 5000)]
+
+    events = simulate_put_spreads(snaps, PARAMS)
+
+    # 卖出腿取 Delta 最接近 0.07 的 4940 (Bid 1.60)，宽度 30 最接近目标：Buy 4910 (Ask 0.75)，净收入 0.85
+    assert [n for _, _, n in events] == [1, 0, 1, 0, 1, 0]
+    assert [round(pnl, 2) for _, pnl, _ in events] == [0.0, -14.15, 0.0, 0.85, 0.0, 0.0]
+
+
+def test_covered_call_rolls_when_delta_breaches_threshold():
+    d1, d2 = date(2026, 10, 12), date(2026, 10, 14)
+    expiry, next_expiry = date(2026, 10, 16), date(2026, 10, 23)
+    strikes = [210, 215, 220]
+    snaps = [
+        _snap(d1, 10, expiry, 'C', 200, strikes, [1.00, 0.60, 0.30], [1.05, 0.63, 0.32], [0.30, 0.16, 0.08]),
+        _snap(d2, 10, expiry, 'C', 214, strikes, [4.50, 2.00, 0.90], [4.60, 2.10, 0.95], [0.70, 0.50, 0.25]),
+        _snap(d2, 10, next_expiry, 'C', 214, [225, 230], [1.20, 0.80], [1.25, 0.84], [0.20, 0.14]),
+    ]
+
+    events = simulate_covered_calls(snaps, PARAMS)
+
+    # 卖出 215C (0.60)，Delta 升到 0.50 > 0.45 时以 2.10 买回，再卖出 230C (0.80)，数据结束按 Ask 0.84 计价
+    assert [(round(pnl, 2), n) for _, pnl, n in events] == [(0.0, 1), (-1.5, 1), (0.0, 1), (-0.04, 0)]
+    result = evaluate(PARAMS, {'GOOG': {'C': snaps, 'P': []}})
+    assert result.cc_pnl == pytest.approx(-154) and result.trades == 3
+    assert result.max_drawdown == pytest.approx(154)
+
+
+def _chain_snapshot(taken_at, expiry, right, price, strikes, bids, deltas):
+    n = len(strikes)
+    return ChainSnapshot(
+        'SPX', expiry, right, price, taken_at, np.asarray(strikes, dtype=float),
+        np.asarray(bids, dtype=float), np.asarray(bids, dtype=float) + 0.05, np.asarray(deltas, dtype=float),
+        np.full(n, 0.2), tuple(Option('SPX', expiry, s, right, 'SMART') for s in strikes),
+    )
+
+
+def test_sweep_runs_in_process_pool_and_best_params_can_be_adopted(tmp_path, monkeypatch):
+    store = ChainStore(tmp_path / 'chains')
+    for day, close in ((16, 4990), (19, 5020)):
+        for hour, price in ((10, 5000), (15, close)):
+            taken_at = EASTERN.localize(datetime(2026, 10, day, hour))
+            store.append(_chain_snapshot(taken_at, f'202610{day}', 'P', price,
+                                         [4900, 4910, 4920, 4930, 4940, 4950], [0.5, 0.7, 0.95, 1.25, 1.6, 2.1],
+                                         [0.03, 0.04, 0.05, 0.06, 0.07, 0.09]))
+    store.append(_chain_snapshot(EASTERN.localize(datetime(2026, 10, 20, 10)), '20261020', 'P', 5000,
+                                 [4900], [0.5], [0.03]))
+    grid = dict({k: [v] for k, v in PARAMS.items()}, PCS_SELL_DELTA=[0.05, 0.07, 0.09], PCS_WIDTH=[10, 30])
+    monkeypatch.setattr('config.LEARNED_CONFIG_PATH', tmp_path / 'learned.json')
+    output = tmp_path / 'results.json'
+
+    results = run_sweep(param_grid(grid), root=store.root, workers=2)
+    backtest.save_results(results, output)
+    params = backtest.adopt('aggressive', output)
+
+    assert len(results) == 6
+    assert [r.pnl for r in results] == sorted((r.pnl for r in results), reverse=True)
+    assert results[0].pnl > 0 and results[0].trades == 2
+    assert json.loads(output.read_text())['results'][0]['rank'] == 1
+    assert params == results[0].params
+    assert load_parameters('aggressive')['PCS_SELL_DELTA'] == params['PCS_SELL_DELTA']
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+import pytz
+from ib_insync import Option
+
+import chain_store
+from chain_store import ChainStore
+from options_lookup import ChainSnapshot
+
+EASTERN = pytz.timezone('US/Eastern')
+
+
+def _snapshot(taken_at, strikes, right='P', price=5000.0):
+    n = len(strikes)
+    return ChainSnapshot(
+        'SPX', '20261023', right, price, taken_at,
+        np.asarray(strikes, dtype=float), np.linspace(1.0, 2.0, n), np.linspace(1.1, 2.1, n),
+        np.linspace(0.05, 0.10, n), np.full(n, 0.2), tuple(Option('SPX', '20261023', s, right, 'SMART') for s in strikes),
+    )
+
+
+def test_append_and_load_day_as_memmap(tmp_path):
+    store = ChainStore(tmp_path)
+    morning = EASTERN.localize(datetime(2026, 10, 16, 10, 0))
+    afternoon = EASTERN.localize(datetime(2026, 10, 16, 15, 0))
+    store.append(_snapshot(morning, [4900, 4910, 4920]))
+    store.append(_snapshot(afternoon, [5100, 5110], right='C', price=5050.0))
+
+    day = store.load_day('spx', '20261016')
+
+    assert store.days('SPX') == ['20261016']
+    assert len(day) == 5
+    assert isinstance(day.strike, np.memmap)
+    assert day.strike.tolist() == [4900, 4910, 4920, 5100, 5110]
+    assert bytes(day.right).decode() == 'PPPCC'
+    assert day.underlying[-1] == 5050.0 and day.expiry[0] == 20261023
+    assert day.ts[0] == pytest.approx(morning.timestamp())
+    assert day.bid.dtype == np.float32
+
+
+def test_partition_by_eastern_day_and_torn_write_is_truncated(tmp_path):
+    store = ChainStore(tmp_path)
+    # 美东 10/16 20:30 = UTC 10/17 00:30，仍归入 10/16
+    store.append(_snapshot(EASTERN.localize(datetime(2026, 10, 16, 20, 30)), [4900, 4910]))
+    with open(tmp_path / 'SPX' / '20261016' / 'strike.bin', 'ab') as f:
+        f.write(np.array([4920.0]).tobytes())
+
+    day = store.load_day('SPX', datetime(2026, 10, 16))
+
+    assert len(day) == 2 and len(day.strike) == 2
+    assert store.load_day('SPX', '20261017') is None
+
+    # 之后的追加从共同行数接着写，各列仍对齐
+    store.append(_snapshot(EASTERN.localize(datetime(2026, 10, 16, 20, 40)), [4930, 4940]))
+    day = store.load_day('SPX', '20261016')
+    assert day.strike.tolist() == [4900, 4910, 4930, 4940]
+    assert day.ts.tolist()[2:] == [EASTERN.localize(datetime(2026, 10, 16, 20, 40)).timestamp()] * 2
+
+
+@pytest.mark.asyncio
+async def test_record_writes_in_background_only_when_installed(tmp_path):
+    snapshot = _snapshot(EASTERN.localize(datetime(2026, 10, 16, 11, 0)), [4900])
+    chain_store.record(snapshot)
+    await chain_store.flush()
+    assert not any(tmp_path.iterdir())
+
+    chain_store.install(ChainStore(tmp_path))
+    try:
+        chain_store.record(snapshot)
+        await chain_store.flush()
+    finally:
+        chain_store.uninstall()
+    assert len(ChainStore(tmp_path).load_day('SPX', '20261016')) == 1
@@ -34,3 +34,64 @@ def test_aggressive_mode():
     assert params['STRATEGY_MODE'] == 'aggressive'
     assert params['CC_DELTA_TARGET'] == 0.25 # Aggressive target
     assert params['PCS_WIDTH'] == 50
+
+
+def test_parameters_are_immutable_and_versioned(tmp_path):
+    from config import ParameterStore
+    store = ParameterStore(tmp_path / "learned.json")
+
+    params = store.get('base')
+    assert params.version == 0
+    with pytest.raises(TypeError):
+        params['CC_DELTA_TARGET'] = 0.5
+
+    assert store.save('base', {'CC_DELTA_TARGET': 0.12}) == 1
+    assert store.save('aggressive', {'PCS_WIDTH': 40}) == 2
+    assert params['CC_DELTA_TARGET'] == DEFAULTS['CC_DELTA_TARGET']   # 旧视图不受影响
+    assert store.get('base')['CC_DELTA_TARGET'] == 0.12 and store.get('base').version == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['learned.json', 'learned.json.lock']
+
+
+def test_store_caches_until_file_changes_and_hot_reloads(tmp_path, monkeypatch):
+    import config
+    from config import ParameterStore
+    path = tmp_path / "learned.json"
+    reader, writer = ParameterStore(path), ParameterStore(path)   # 模拟两个进程
+    writer.save('base', {'ROLL_DELTA_THRESHOLD': 0.5})
+
+    parses = []
+    real_load = json.load
+    monkeypatch.setattr(config.json, 'load', lambda f: parses.append(1) or real_load(f))
+    first = reader.get('base')
+    assert reader.get('base') is first and len(parses) == 1
+
+    writer.save('base', {'ROLL_DELTA_THRESHOLD': 0.6})
+    reloaded = reader.get('base')
+    assert reloaded['ROLL_DELTA_THRESHOLD'] == 0.6 and reloaded.version == first.version + 1
+
+
+def test_corrupt_file_keeps_last_good_version(tmp_path):
+    from config import ParameterStore
+    path = tmp_path / "learned.json"
+    store = ParameterStore(path)
+    store.save('base', {'PCS_SELL_DELTA': 0.09})
+    assert store.get('base')['PCS_SELL_DELTA'] == 0.09
+
+    path.write_text('{"base": {"PCS_SELL_DELTA": 0.')
+
+    params = store.get('base')
+    assert params['PCS_SELL_DELTA'] == 0.09 and params.version == 1
+
+
+def test_hand_edit_without_version_yields_new_parameters(tmp_path):
+    from config import ParameterStore
+    path = tmp_path / "learned.json"
+    path.write_text(json.dumps({'base': {'CC_DELTA_TARGET': 0.12}}))
+    store = ParameterStore(path)
+    first = store.get('base')
+
+    path.write_text(json.dumps({'base': {'CC_DELTA_TARGET': 0.18}}))
+    edited = store.get('base')
+
+    assert edited is not first and edited['CC_DELTA_TARGET'] == 0.18
+    assert edited.version == first.version == 0
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from ib_insync import Option, OptionChain, Stock
+
+import data_logger
+from contract_registry import ContractRegistry
+
+
+def _future(days):
+    return (datetime.now() + timedelta(days=days)).strftime('%Y%m%d')
+
+
+def _fake_ib(expirations):
+    ib = MagicMock()
+    ib.reqSecDefOptParamsAsync = AsyncMock(return_value=[
+        OptionChain('SMART', 1, 'GOOG', '100', set(expirations), {150.0, 160.0})
+    ])
+
+    async def qualify(*contracts):
+        for i, c in enumerate(contracts):
+            c.conId = 1000 + int(c.strike or 0)
+            c.localSymbol = f"{c.symbol} {c.strike}"
+        return list(contracts)
+
+    ib.qualifyContractsAsync = AsyncMock(side_effect=qualify)
+    return ib
+
+
+@pytest.mark.asyncio
+async def test_chain_and_contract_cached_in_memory():
+    ib = _fake_ib([_future(3), _future(10)])
+    reg = ContractRegistry()
+    underlying = Stock('GOOG', 'SMART', 'USD')
+    underlying.conId = 1
+
+    first = await reg.get_option_chains(ib, underlying)
+    second = await reg.get_option_chains(ib, underlying)
+    assert first == second
+    assert first[0].strikes == [150.0, 160.0]
+    assert ib.reqSecDefOptParamsAsync.await_count == 1
+
+    await reg.qualify(ib, Option('GOOG', _future(3), 150.0, 'C', 'SMART'))
+    again = Option('GOOG', _future(3), 150.0, 'C', 'SMART')
+    [hit] = await reg.qualify(ib, again)
+    assert hit is again and hit.conId == 1150 and hit.localSymbol == 'GOOG 150.0'
+    assert ib.qualifyContractsAsync.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_expiry_rollover_and_ttl_invalidate():
+    ib = _fake_ib([_future(-1), _future(6)])
+    reg = ContractRegistry()
+    underlying = Stock('GOOG', 'SMART', 'USD')
+    await reg.get_option_chains(ib, underlying)
+    # 链中最早的到期日已过，视为滚动，需要重新拉取
+    await reg.get_option_chains(ib, underlying)
+    assert ib.reqSecDefOptParamsAsync.await_count == 2
+
+    reg = ContractRegistry(contract_ttl=timedelta(0))
+    await reg.qualify(ib, Option('GOOG', _future(3), 150.0, 'C', 'SMART'))
+    await reg.qualify(ib, Option('GOOG', _future(3), 150.0, 'C', 'SMART'))
+    assert ib.qualifyContractsAsync.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_warm_start_skips_round_trips(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_logger, 'DB_PATH', tmp_path / 'strategy.db')
+    await data_logger.ensure_db()
+    ib = _fake_ib([_future(3)])
+    underlying = Stock('GOOG', 'SMART', 'USD')
+
+    reg = ContractRegistry()
+    await reg.warm_start()
+    await reg.get_option_chains(ib, underlying)
+    await reg.qualify(ib, Option('GOOG', _future(3), 160.0, 'C', 'SMART'))
+
+    restarted = ContractRegistry()
+    await restarted.warm_start()
+    cold_ib = _fake_ib([])
+    chains = await restarted.get_option_chains(cold_ib, underlying)
+    [contract] = await restarted.qualify(cold_ib, Option('GOOG', _future(3), 160.0, 'C', 'SMART'))
+    assert chains[0].expirations == [_future(3)]
+    assert contract.conId == 1160
+    cold_ib.reqSecDefOptParamsAsync.assert_not_awaited()
+    cold_ib.qualifyContractsAsync.assert_not_awaited()
@@ -0,0 +1,136 @@
+import asyncio
+import sqlite3
+
+import pytest
+import pytest_asyncio
+
+import data_logger
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch):
+    path = tmp_path / 'strategy.db'
+    monkeypatch.setattr(data_logger, 'DB_PATH', path)
+    await data_logger.ensure_db()
+    yield path
+    await data_logger.close_db()
+
+
+def _count(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_writes_are_batched_into_few_transactions(db):
+    data_logger._get_writer().batch_size = 50
+    for i in range(120):
+        await data_logger.log_market_snapshot('VIX', 15 + i * 0.01)
+    await data_logger.log_trade('SPREAD', 'SPX', 'OPEN', 1, delta=0.07)
+
+    await data_logger.flush_db()
+
+    writer = data_logger._writer
+    assert _count(db, 'market_snapshots') == 120 and _count(db, 'trades') == 1
+    assert writer.stats['rows'] == 121
+    assert writer.stats['batches'] == 3
+
+
+@pytest.mark.asyncio
+async def test_reads_see_queued_writes_and_database_uses_wal(db):
+    await data_logger.cache_earnings('goog', '2026-10-28')
+
+    cached = await data_logger.get_cached_earnings('GOOG')
+
+    assert cached['earnings_dates'] == '2026-10-28'
+    conn = sqlite3.connect(db)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_pending_rows(db):
+    for i in range(10):
+        await data_logger.log_trade('ROLLING', 'GOOG', 'ROLL', 1, notes=f'#{i}')
+    assert data_logger._writer.pending > 0
+
+    await data_logger.close_db()
+
+    assert _count(db, 'trades') == 10
+    assert data_logger._writer is None
+
+
+def _legacy_db(path):
+    """迁移框架之前的库：无 schema_version、无索引、无 local_symbol/vix 列"""
+    conn = sqlite3.connect(path)
+    conn.execute(data_logger.TRADES_TABLE_SQL)
+    conn.execute(data_logger.MARKET_TABLE_SQL)
+    conn.executemany(
+        "INSERT INTO trades (timestamp, trade_type, symbol, action, quantity, delta, notes) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            ('2026-02-11T15:00:00', 'COVERED_CALL', 'GOOG', 'OPEN', 1, 0.15, 'Contract: GOOG  260220C00210000, VIX: 18.25'),
+            ('2026-02-12T15:00:00', 'ROLLING', 'GOOG', 'ROLL', 1, 0.5, 'From GOOG  260220C00210000 to GOOG  260227C00215000'),
+            ('2026-02-12T16:00:00', 'SPREAD', 'SPX', 'OPEN', 1, 0.07, 'Sell 4940.0P, Buy 4910.0P, VIX: None'),
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_legacy_database_upgrades_in_place(tmp_path, monkeypatch):
+    path = tmp_path / 'legacy.db'
+    _legacy_db(path)
+    monkeypatch.setattr(data_logger, 'DB_PATH', path)
+
+    await data_logger.ensure_db()
+    await data_logger.ensure_db()   # 再次执行不重复迁移
+
+    conn = sqlite3.connect(path)
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    rows = conn.execute("SELECT trade_type, local_symbol, vix FROM trades ORDER BY id").fetchall()
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT delta FROM trades WHERE trade_type = ? AND delta IS NOT NULL", ('ROLLING',)
+    ).fetchall()
+    conn.close()
+
+    assert versions == [v for v, _, _ in data_logger.MIGRATIONS]
+    assert rows == [
+        ('COVERED_CALL', 'GOOG  260220C00210000', 18.25),
+        ('ROLLING', 'GOOG  260227C00215000', None),
+        ('SPREAD', None, None),
+    ]
+    assert 'idx_trades_type_ts' in ' '.join(str(r) for r in plan)
+
+
+@pytest.mark.asyncio
+async def test_typed_columns_are_written_directly(db):
+    await data_logger.log_trade('COVERED_CALL', 'GOOG', 'OPEN', 1, local_symbol='GOOG C210', vix=17.5)
+    await data_logger.log_trades([('EMERGENCY', 'SPX', 'EXIT', 1, None, None, 'x', 'SPX P4940')])
+    await data_logger.flush_db()
+
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT local_symbol, vix FROM trades ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [('GOOG C210', 17.5), ('SPX P4940', None)]
+
+
+@pytest.mark.asyncio
+async def test_failing_group_is_dropped_alone(db):
+    await data_logger.log_trade('SPREAD', 'SPX', 'OPEN', 1, delta=0.07)
+    data_logger._get_writer().submit("INSERT INTO missing_table (x) VALUES (?)", [(1,)])
+    await data_logger.log_market_snapshot('VIX', 18.5)
+
+    await data_logger.flush_db()
+
+    assert _count(db, 'trades') == 1 and _count(db, 'market_snapshots') == 1
+    assert data_logger._writer.stats['errors'] == 1
+
+    # 关闭时剩余队列中的坏数据同样只丢弃自身，close_db 不抛异常
+    await data_logger.log_trade('ROLLING', 'GOOG', 'ROLL', 1)
+    data_logger._get_writer().submit("INSERT INTO missing_table (x) VALUES (?)", [(2,)])
+    await data_logger.close_db()
+    assert _count(db, 'trades') == 2
@@ -55,3 +55,131 @@ async def test_is_near_earnings_no_cache_and_empty():
         with patch("earnings_calendar.get_cached_earnings", return_value=None):
             with patch("earnings_calendar.cache_earnings"):
                 assert await is_near_earnings("GOOG") is False
+
+
+@pytest.mark.asyncio
+async def test_service_answers_from_bisect_index_without_reloading():
+    from datetime import date
+    from earnings_calendar import EarningsService
+
+    class CountingSource:
+        cacheable = False
+        calls = 0
+
+        def fetch(self, symbol):
+            self.calls += 1
+            return [date(2026, 10, 20), date(2027, 1, 25)]
+
+    source = CountingSource()
+    service = EarningsService(source)
+    assert service.lookup('NVDA', today=date(2026, 10, 18)) is None
+    await service.load('nvda')
+    await service.load('NVDA')
+
+    assert source.calls == 1
+    assert service.lookup('NVDA', 3, today=date(2026, 10, 17)) is True
+    assert service.lookup('NVDA', 1, today=date(2026, 10, 18)) is False
+    assert service.lookup('NVDA', 0, today=date(2026, 10, 20)) is True
+    assert service.next_earnings('NVDA', today=date(2026, 10, 21)) == date(2027, 1, 25)
+
+
+def test_file_source_reads_csv_and_ics(tmp_path):
+    from datetime import date
+    from earnings_calendar import FileSource
+
+    csv_path = tmp_path / 'earnings.csv'
+    csv_path.write_text("symbol,date\nnvda,2026-11-19\nNVDA,2026-08-27\nAAPL,2026-10-30\n")
+    assert FileSource(csv_path).fetch('NVDA') == [date(2026, 8, 27), date(2026, 11, 19)]
+    assert FileSource(csv_path).fetch('TSLA') == []
+
+    ics_path = tmp_path / 'earnings.ics'
+    ics_path.write_text(
+        "BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nSUMMARY:AAPL Q4 Earnings\r\nDTSTART;VALUE=DATE:20261030\r\n"
+        "END:VEVENT\r\nBEGIN:VEVENT\r\nSUMMARY:MSFT\r\n  Earnings\r\nDTSTART:20261028T200000Z\r\n"
+        "END:VEVENT\r\nEND:VCALENDAR\r\n"
+    )
+    source = FileSource(ics_path)
+    assert source.fetch('AAPL') == [date(2026, 10, 30)]
+    assert source.fetch('MSFT') == [date(2026, 10, 28)]
+
+
+@pytest.mark.asyncio
+async def test_prefetch_loads_all_symbols_through_bounded_pool():
+    import threading
+    import time
+    from earnings_calendar import EarningsService
+
+    lock = threading.Lock()
+    active = {'now': 0, 'peak': 0}
+
+    class SlowSource:
+        cacheable = False
+
+        def fetch(self, symbol):
+            with lock:
+                active['now'] += 1
+                active['peak'] = max(active['peak'], active['now'])
+            time.sleep(0.02)
+            with lock:
+                active['now'] -= 1
+            return []
+
+    service = EarningsService(SlowSource(), max_workers=2)
+    symbols = ['S%d' % i for i in range(6)]
+    await service.prefetch(symbols)
+
+    assert active['peak'] == 2
+    assert service.stats['fetches'] == 6
+    assert all(service.lookup(s) is False for s in symbols)
+
+
+@pytest.mark.asyncio
+async def test_file_source_edits_invalidate_the_in_memory_index(tmp_path):
+    import os
+    from datetime import date
+    from earnings_calendar import EarningsService, FileSource
+
+    path = tmp_path / 'earnings.csv'
+    path.write_text("symbol,date\nAAPL,2099-01-30\n")
+    service = EarningsService(FileSource(path))
+    assert await service.is_near('AAPL') is False
+
+    tomorrow = date.fromordinal(date.today().toordinal() + 1)
+    path.write_text(f"symbol,date\nAAPL,{tomorrow.isoformat()}\nAAPL,2099-01-30\n")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    assert service.lookup('AAPL') is None
+    await service.prefetch(['AAPL'])
+    assert service.lookup('AAPL') is True
+    assert await service.is_near('AAPL') is True
+
+
+@pytest.mark.asyncio
+async def test_failed_fetch_is_not_cached_as_no_earnings():
+    from datetime import date
+    from earnings_calendar import EarningsService, FAILED_RETRY
+
+    class FlakySource:
+        cacheable = False
+        fail = True
+
+        def fetch(self, symbol):
+            if self.fail:
+                raise ConnectionError('rate limited')
+            return [date.fromordinal(date.today().toordinal() + 1)]
+
+    source = FlakySource()
+    service = EarningsService(source)
+    # 第一次失败且没有旧数据：不缓存空结果，调用方收到异常，下次检查重新拉取
+    with pytest.raises(ConnectionError):
+        await service.is_near('AAPL')
+    assert service.lookup('AAPL') is None
+    source.fail = False
+    assert await service.is_near('AAPL') is True
+
+    # 之后再失败：沿用上次的日期 (财报保护不关闭)，并在 FAILED_RETRY 后重试
+    source.fail = True
+    await service.load('AAPL', force=True)
+    assert service.lookup('AAPL') is True
+    assert service._loaded_at['AAPL'] < datetime.utcnow() - service.ttl + FAILED_RETRY + timedelta(seconds=1)
@@ -0,0 +1,117 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from ib_insync import Option, OrderStatus, Position, Trade
+
+from exit_engine import ExitEngine, plan_exit_orders
+
+
+def _option(con_id, strike, right='P', symbol='SPX'):
+    c = Option(symbol, '20261023', strike, right, 'SMART')
+    c.conId = con_id
+    c.localSymbol = f'{symbol} {strike}{right}'
+    return c
+
+
+def _book():
+    return [
+        Position('DU1', _option(1, 4950), -2, 300.0),
+        Position('DU1', _option(2, 4920), 2, 150.0),
+        Position('DU1', _option(3, 210, 'C', 'GOOG'), -1, 120.0),
+    ]
+
+
+def test_spreads_are_closed_as_combos_and_singles_per_leg():
+    orders = plan_exit_orders(_book())
+
+    combo, single = orders
+    assert combo.contract.secType == 'BAG' and combo.action == 'BUY' and combo.quantity == 2
+    assert [(leg.conId, leg.action) for leg in combo.contract.comboLegs] == [(1, 'BUY'), (2, 'SELL')]
+    assert single.contract.conId == 3 and single.action == 'BUY' and single.quantity == 1
+
+
+def _trade(contract, order, status):
+    trade = Trade(contract=contract, order=order)
+    trade.orderStatus.status = status
+    return trade
+
+
+@pytest.mark.asyncio
+async def test_all_orders_go_out_before_fills_and_unfilled_legs_are_retried():
+    ib = MagicMock()
+    placed = []
+
+    def place_order(contract, order):
+        # 第一笔单腿平仓第一次被拒，重下后成交；组合单直接成交
+        status = OrderStatus.Inactive if contract.secType == 'OPT' and not placed.count(contract.conId) else OrderStatus.Filled
+        placed.append(contract.conId)
+        return _trade(contract, order, status)
+
+    ib.placeOrder = MagicMock(side_effect=place_order)
+    log_trades = AsyncMock()
+
+    with patch('exit_engine.log_trades', log_trades):
+        results = await ExitEngine(ib, fill_timeout=0.01).liquidate(_book())
+
+    assert [r.filled for r in results] == [True, True]
+    assert [r.attempts for r in results] == [1, 2]
+    assert ib.placeOrder.call_count == 3
+    log_trades.assert_awaited_once()
+    [rows] = log_trades.await_args.args
+    assert [row[1] for row in rows] == ['SPX', 'SPX', 'GOOG']
+
+
+def _cancelling_ib(filled_during_cancel=0):
+    """下单后一直挂着；撤单时 (可选地先成交一部分) 推送 Cancelled"""
+    ib = MagicMock()
+    trades = {}
+
+    def place_order(contract, order):
+        trade = trades[id(order)] = _trade(contract, order, OrderStatus.Submitted)
+        return trade
+
+    def cancel_order(order):
+        trade = trades[id(order)]
+        trade.orderStatus.filled = min(filled_during_cancel, order.totalQuantity)
+        trade.orderStatus.status = OrderStatus.Cancelled
+        asyncio.get_running_loop().call_soon(trade.statusEvent.emit, trade)
+
+    ib.placeOrder = MagicMock(side_effect=place_order)
+    ib.cancelOrder = MagicMock(side_effect=cancel_order)
+    return ib
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries_and_cancels_working_orders():
+    ib = _cancelling_ib()
+
+    with patch('exit_engine.log_trades', AsyncMock()):
+        [result] = await ExitEngine(ib, fill_timeout=0.01, max_retries=1).liquidate(_book()[2:])
+
+    assert not result.filled and result.attempts == 2
+    assert ib.cancelOrder.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_resubmits_only_what_is_left_after_cancel_is_confirmed():
+    ib = _cancelling_ib(filled_during_cancel=3)
+    book = [Position('DU1', _option(3, 210, 'C', 'GOOG'), -5, 120.0)]
+
+    with patch('exit_engine.log_trades', AsyncMock()):
+        [result] = await ExitEngine(ib, fill_timeout=0.01, max_retries=1).liquidate(book)
+
+    # 撤单确认前成交 3 张，只按剩余 2 张重下
+    assert [call.args[1].totalQuantity for call in ib.placeOrder.call_args_list] == [5, 2]
+
+
+@pytest.mark.asyncio
+async def test_no_resubmit_while_cancel_is_unconfirmed():
+    ib = MagicMock()
+    ib.placeOrder = MagicMock(side_effect=lambda c, o: _trade(c, o, OrderStatus.Submitted))
+
+    with patch('exit_engine.log_trades', AsyncMock()):
+        [result] = await ExitEngine(ib, fill_timeout=0.01, cancel_timeout=0.01).liquidate(_book()[2:])
+
+    assert not result.filled and result.attempts == 1
+    assert ib.placeOrder.call_count == 1 and ib.cancelOrder.call_count == 1
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import pytest
+from eventkit import Event
+from ib_insync import (AccountValue, MarketOrder, Option, OptionChain, OptionComputation, OrderStatus, Stock, Ticker,
+                       Trade)
+
+import config
+import data_logger
+from ib_replay import RecordingIB, ReplayIB, ReplayMissError, decode, encode, isolate_local_state
+
+
+class FakeIB:
+    """只实现录制所需接口的假 IB"""
+
+    def __init__(self):
+        self.tickers = []
+
+    async def reqSecDefOptParamsAsync(self, symbol, exchange, sec_type, con_id):
+        await asyncio.sleep(0.05)
+        return [OptionChain('SMART', con_id, symbol, '100', ['20260220'], [150.0, 160.0])]
+
+    async def qualifyContractsAsync(self, *contracts):
+        for c in contracts:
+            c.conId = 42
+            c.localSymbol = 'GOOG  260220C00160000'
+        return list(contracts)
+
+    async def reqTickersAsync(self, *contracts):
+        return [Ticker(contract=c, bid=1.0, ask=1.1, modelGreeks=OptionComputation(0, 0.3, 0.15, 1.05, 0, 0, 0, 0, 150.0))
+                for c in contracts]
+
+    def accountSummaryAsync(self, account):
+        async def _summary():
+            return [AccountValue(account, 'NetLiquidation', '100000', 'USD', '')]
+        return _summary()
+
+    def reqMktData(self, contract, *args, **kwargs):
+        ticker = Ticker(contract=contract)
+        self.tickers.append(ticker)
+        return ticker
+
+    def disconnect(self):
+        pass
+
+
+def test_codec_round_trips_ib_objects():
+    ticker = Ticker(contract=Option('SPX', '20260220', 5000.0, 'P', 'SMART'), bid=1.5,
+                    modelGreeks=OptionComputation(0, 0.2, -0.07, 1.6, 0, 0, 0, 0, 5100.0))
+    restored = decode(encode(ticker))
+    assert restored.contract == ticker.contract
+    assert restored.bid == 1.5
+    assert restored.modelGreeks.delta == -0.07
+
+
+def test_decoded_trade_has_live_events_and_order_fields():
+    trade = Trade(contract=Stock('GOOG', 'SMART', 'USD'), order=MarketOrder('SELL', 2),
+                  orderStatus=OrderStatus(status=OrderStatus.Submitted))
+    restored = decode(encode(trade))
+    assert restored.order.orderType == 'MKT' and restored.order.totalQuantity == 2
+    assert restored.orderStatus.status == OrderStatus.Submitted
+    assert isinstance(restored.statusEvent, Event)
+    # 旧录制文件里事件字段被编码成 None
+    legacy = encode(trade)
+    legacy['v']['statusEvent'] = None
+    assert isinstance(decode(legacy).statusEvent, Event)
+
+
+@pytest.mark.asyncio
+async def test_record_then_replay_serves_same_responses(tmp_path):
+    path = tmp_path / 'session.jsonl.gz'
+    fake = FakeIB()
+    recorder = RecordingIB(fake, path)
+
+    stock = Stock('GOOG', 'SMART', 'USD')
+    chains = await recorder.reqSecDefOptParamsAsync('GOOG', '', 'STK', 7)
+    option = Option('GOOG', '20260220', 160.0, 'C', 'SMART')
+    await recorder.qualifyContractsAsync(option)
+    [ticker] = await recorder.reqTickersAsync(option)
+    summary = await recorder.accountSummaryAsync('DU1')
+    streamed = recorder.reqMktData(stock)
+    streamed.bid = 99.5
+    streamed.updateEvent.emit(streamed)
+    recorder.disconnect()
+
+    replay = ReplayIB(path)
+    await replay.connectAsync('127.0.0.1', 7497, clientId=1)
+    started = time.monotonic()
+    assert await replay.reqSecDefOptParamsAsync('GOOG', '', 'STK', 7) == chains
+    assert time.monotonic() - started >= 0.04  # 按录制耗时回放
+
+    fresh = Option('GOOG', '20260220', 160.0, 'C', 'SMART')
+    [qualified] = await replay.qualifyContractsAsync(fresh)
+    assert qualified is fresh and fresh.conId == 42
+    [replayed] = await replay.reqTickersAsync(fresh)
+    assert replayed.modelGreeks.delta == ticker.modelGreeks.delta
+    assert (await replay.accountSummaryAsync('DU1'))[0].value == summary[0].value
+
+    live = replay.reqMktData(Stock('GOOG', 'SMART', 'USD'))
+    await asyncio.sleep(0.01)
+    assert live.bid == 99.5
+
+    with pytest.raises(ReplayMissError):
+        await replay.reqTickersAsync(Option('GOOG', '20260220', 170.0, 'C', 'SMART'))
+    replay.disconnect()
+
+
+def test_isolate_local_state_leaves_live_files_untouched(tmp_path, monkeypatch):
+    live = tmp_path / 'live'
+    live.mkdir()
+    (live / 'learned_config.json').write_text('{"_version": 3, "balanced": {"PCS_WIDTH": 25}}')
+    monkeypatch.setattr(config, 'LEARNED_CONFIG_PATH', live / 'learned_config.json')
+    monkeypatch.setattr(data_logger, 'DB_PATH', live / 'strategy_data.db')
+
+    scratch = isolate_local_state(tmp_path / 'replay')
+
+    assert data_logger.DB_PATH == scratch / 'strategy_data.db'
+    # 回放从当前参数起步，调参写入的是副本
+    assert config.load_parameters('balanced')['PCS_WIDTH'] == 25
+    config.parameter_store.save('balanced', {'PCS_WIDTH': 40})
+    assert (live / 'learned_config.json').read_text() == '{"_version": 3, "balanced": {"PCS_WIDTH": 25}}'
+    assert config.load_parameters('balanced')['PCS_WIDTH'] == 40
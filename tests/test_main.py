@@ -0,0 +1,255 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytz
+from eventkit import Event
+from ib_insync import (IB, AccountValue, Option, OptionChain, OptionComputation, OrderStatus, PnL, PnLSingle, Position,
+                       Stock, Ticker, Trade)
+
+import main
+import market_data
+import utils
+from contract_registry import registry
+from earnings_calendar import FileSource, earnings_service
+from main import AIOptionsMaster
+from market_data import ticker_cache
+from position_index import PositionIndex
+from roll_planner import RollPlan
+from roll_watcher import RollWatcher
+
+
+def _call(con_id, days):
+    expiry = (datetime.now() + timedelta(days=days)).strftime('%Y%m%d')
+    contract = Option('GOOG', expiry, 200 + con_id, 'C', 'SMART')
+    contract.conId = con_id
+    contract.localSymbol = f'GOOG C{con_id}'
+    return contract
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    monkeypatch.setattr('config.LEARNED_CONFIG_PATH', tmp_path / 'learned.json')
+    ib = MagicMock()
+    ib.reqMktData = MagicMock(side_effect=lambda c, *a, **k: Ticker(
+        contract=c, bid=1.0, ask=1.1, modelGreeks=OptionComputation(0, 0.2, 0.60, 1.0, 0.0, 0.0, 0.0, 0.0, 200.0)
+    ))
+    ib.qualifyContractsAsync = AsyncMock(side_effect=lambda *cs: list(cs))
+    ib.placeOrder = MagicMock(side_effect=lambda contract, order: Trade(contract=contract, order=order))
+    bot = AIOptionsMaster(mode='balanced')
+    bot.ib = ib
+    bot.replaying = True
+    bot.market_data = market_data.install(ib)
+    yield bot
+    market_data.uninstall()
+
+
+@pytest.mark.asyncio
+async def test_watcher_does_not_roll_the_same_call_twice(bot, monkeypatch):
+    old, new = _call(11, 5), _call(12, 12)
+    position = Position('DU1', old, -1, 100.0)
+    bot.ib.positions.return_value = [position]
+    bot.positions = PositionIndex(bot.ib)
+    bot.positions.rebuild([position])
+    monkeypatch.setattr('main.plan_roll', AsyncMock(return_value=RollPlan(new, new.lastTradeDateOrContractMonth,
+                                                                          1.5, 38.0, 0.15, 12, 3.2)))
+    monkeypatch.setattr('main.log_trade', AsyncMock())
+    # 冷却期为 0：第二次行情更新时已过冷却期
+    bot.roll_watcher = RollWatcher(bot.ib, bot._on_roll_trigger, 0.45, 1, debounce=0, cooldown=0)
+
+    await bot.roll_watcher.sync([position])
+    await bot.roll_watcher.drain()
+    assert bot.ib.placeOrder.call_count == 1
+    # 下单后立即改为监控新合约
+    assert [p.contract.conId for p in bot.roll_watcher.watched] == [12]
+
+    # 旧合约仍有行情推送、持仓索引尚未更新，再次触发也不会重复下单
+    old_ticker = bot.market_data.ticker(old)
+    old_ticker.updateEvent.emit(old_ticker)
+    await bot._on_roll_trigger(position)
+    await bot.roll_watcher.sync([position])
+    await bot.roll_watcher.drain()
+    assert bot.ib.placeOrder.call_count == 1
+
+    # 旧合约已平仓后，过期的 Position 快照也不会触发
+    bot.positions.on_position(Position('DU1', old, 0, 0.0))
+    bot._roll_orders.clear()
+    await bot._on_roll_trigger(position)
+    assert bot.ib.placeOrder.call_count == 1
+
+    # Rolling 订单被拒后允许重新 Rolling
+    bot.positions.on_position(position)
+    bot._roll_orders[11] = Trade(orderStatus=OrderStatus(status=OrderStatus.Inactive))
+    await bot._on_roll_trigger(position)
+    assert bot.ib.placeOrder.call_count == 2
+    await bot.roll_watcher.close()
+
+
+@pytest.mark.asyncio
+async def test_etf_spread_width_scales_the_tuned_pcs_width(bot, monkeypatch):
+    bot.positions = PositionIndex(bot.ib)
+    bot.positions.rebuild([])
+    select = AsyncMock(return_value=None)
+    monkeypatch.setattr('main.select_put_spread', select)
+    bot.pcs_width = 40          # 自学习得到的宽度
+
+    await bot._manage_index_spread({"symbol": "SPX", "exchange": "CBOE"})
+    await bot._manage_index_spread({"symbol": "SPY", "exchange": "SMART", "sec_type": "STK", "width_scale": 0.1})
+
+    assert [call.args[4] for call in select.await_args_list] == [40, pytest.approx(4.0)]
+
+
+class FakeIB:
+    """录制用的假 IB：一个持有 100 股 GOOG 的账户，报价/Greeks 按行权价线性生成，到期日由策略时钟推算"""
+    PRICES = {'GOOG': 200.0, 'SPX': 5000.0, 'VIX': 18.0, 'VIX9D': 17.0, 'VIX3M': 19.0}
+
+    def __init__(self):
+        for name in IB.events:
+            setattr(self, name, Event(name))
+        self.con_ids = {}
+        self.orders = []
+        self.goog = Stock('GOOG', 'SMART', 'USD')
+        self.goog.conId = self._con_id(self.goog)
+
+    def _con_id(self, c):
+        spec = (c.secType, c.symbol, c.lastTradeDateOrContractMonth, c.strike, c.right)
+        return self.con_ids.setdefault(spec, 1000 + len(self.con_ids))
+
+    async def connectAsync(self, *args, **kwargs):
+        return self
+
+    def managedAccounts(self):
+        return ['DU1']
+
+    def positions(self):
+        return [Position('DU1', self.goog, 100, 150.0)]
+
+    async def accountSummaryAsync(self, account=''):
+        return [AccountValue('DU1', 'NetLiquidation', '100000', 'USD', '')]
+
+    def reqPnL(self, account, modelCode=''):
+        return PnL(account=account)
+
+    def cancelPnL(self, account, modelCode=''):
+        pass
+
+    def reqPnLSingle(self, account, modelCode, con_id):
+        return PnLSingle(account=account, conId=con_id)
+
+    def cancelPnLSingle(self, account, modelCode, con_id):
+        pass
+
+    async def qualifyContractsAsync(self, *contracts):
+        for c in contracts:
+            c.conId = self._con_id(c)
+            c.localSymbol = f"{c.symbol} {c.lastTradeDateOrContractMonth}{c.right}{c.strike:g}"
+        return list(contracts)
+
+    async def reqSecDefOptParamsAsync(self, symbol, exchange, sec_type, con_id):
+        today = utils.now()
+        expiries = [today.strftime('%Y%m%d')] + [utils.get_next_friday(k) for k in range(3)]
+        spot = self.PRICES[symbol]
+        strikes = [spot * (0.85 + 0.0075 * i) for i in range(41)]
+        return [OptionChain('SMART', con_id, symbol, '100', expiries, strikes)]
+
+    def _quote(self, ticker):
+        c = ticker.contract
+        if c.secType != 'OPT':
+            ticker.last = ticker.close = self.PRICES[c.symbol]
+            return ticker
+        spot = self.PRICES[c.symbol]
+        moneyness = (c.strike - spot) / spot if c.right == 'C' else (spot - c.strike) / spot
+        delta = min(max(0.5 - 4 * moneyness, 0.01), 0.99)
+        price = round(spot * 0.02 * delta + 0.05, 2)
+        ticker.bid, ticker.ask = price, round(price * 1.02, 2)
+        ticker.bidSize = ticker.askSize = 10
+        ticker.modelGreeks = OptionComputation(0, 0.2, delta if c.right == 'C' else -delta, price,
+                                               0.0, 0.0, 0.0, 0.0, spot)
+        return ticker
+
+    def reqMktData(self, contract, *args, **kwargs):
+        ticker = Ticker(contract=contract)
+
+        def push():
+            self._quote(ticker)
+            ticker.updateEvent.emit(ticker)
+
+        asyncio.get_running_loop().call_soon(push)
+        return ticker
+
+    def cancelMktData(self, contract):
+        pass
+
+    async def reqTickersAsync(self, *contracts):
+        return [self._quote(Ticker(contract=c)) for c in contracts]
+
+    def placeOrder(self, contract, order):
+        self.orders.append(contract)
+        return Trade(contract=contract, order=order, orderStatus=OrderStatus(status=OrderStatus.Submitted))
+
+    def disconnect(self):
+        pass
+
+
+async def _run_one_cycle(bot):
+    """跑完一轮策略即停止 (实盘模式一轮后会休眠 10 分钟)"""
+    done = asyncio.Event()
+    log_stats = bot._log_request_stats
+
+    def finished():
+        log_stats()
+        done.set()
+
+    bot._log_request_stats = finished
+    task = asyncio.ensure_future(bot.run_loop(max_cycles=1))
+    await asyncio.wait_for(done.wait(), 30)
+    if not task.done():
+        task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def _reset_caches():
+    registry.clear()
+    ticker_cache.clear()
+    earnings_service.clear()
+    market_data.uninstall()
+
+
+@pytest.mark.asyncio
+async def test_recorded_cycle_replays_on_a_later_day(tmp_path, monkeypatch):
+    monkeypatch.setattr('config.LEARNED_CONFIG_PATH', tmp_path / 'learned.json')
+    monkeypatch.setattr('data_logger.DB_PATH', tmp_path / 'strategy.db')
+    monkeypatch.setattr(main, 'IB', FakeIB)
+    monkeypatch.setattr(main, 'STOCK_CANDIDATES', [{'symbol': 'GOOG', 'min_shares': 100}])
+    monkeypatch.setattr(main, 'INDEX_CANDIDATES', [{'symbol': 'SPX', 'exchange': 'CBOE'}])
+    monkeypatch.setattr(main, 'retention_loop', AsyncMock())
+    monkeypatch.setattr(main.chain_store, 'install', MagicMock())
+    (tmp_path / 'earnings.csv').write_text('symbol,date\n')
+    monkeypatch.setattr(earnings_service, 'source', FileSource(tmp_path / 'earnings.csv'))
+    path = tmp_path / 'session.jsonl.gz'
+
+    # 录制：时钟停在过去某个交易日的盘中
+    wall = datetime(2026, 3, 2, 10, 30)
+    utils.freeze_clock(wall, pytz.timezone('US/Eastern').localize(wall).timestamp())
+    try:
+        recorder = AIOptionsMaster(mode='balanced', record_path=path)
+        await _run_one_cycle(recorder)
+        placed = recorder.ib._ib._ib.orders
+    finally:
+        utils.unfreeze_clock()
+    _reset_caches()
+
+    # 回放：真实时钟已是另一天，策略时钟回到录制时刻，所有请求都能匹配
+    try:
+        bot = AIOptionsMaster(mode='balanced', replay_path=path)
+        await bot.run_loop(max_cycles=1)
+        assert utils.now() == wall
+    finally:
+        utils.unfreeze_clock()
+        _reset_caches()
+
+    # 录制时卖出了 Covered Call 与 SPX Spread，回放时同样的下单请求也都命中录制
+    assert [c.secType for c in placed] == ['OPT', 'BAG']
+    replay = bot.ib._ib
+    assert replay.misses == 0 and replay.requests > 0
@@ -0,0 +1,158 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from ib_insync import Option, Stock, Ticker
+
+import market_data
+from market_data import MarketDataManager, req_tickers
+
+
+def _contract(con_id, sec_type='STK'):
+    if sec_type == 'OPT':
+        c = Option('SPX', '20260220', 5000 + con_id, 'P', 'SMART')
+    else:
+        c = Stock(f'S{con_id}', 'SMART', 'USD')
+    c.conId = con_id
+    return c
+
+
+def _fake_ib():
+    ib = MagicMock()
+
+    def req_mkt_data(contract, *args, **kwargs):
+        return Ticker(contract=contract, bid=1.0, ask=1.1, modelGreeks=MagicMock(delta=-0.1))
+
+    ib.reqMktData = MagicMock(side_effect=req_mkt_data)
+    ib.reqTickersAsync = AsyncMock(side_effect=lambda *cs: [Ticker(contract=c, bid=2.0, ask=2.1) for c in cs])
+    return ib
+
+
+@pytest.mark.asyncio
+async def test_streaming_reads_reuse_open_lines():
+    ib = _fake_ib()
+    manager = MarketDataManager(ib, max_lines=10)
+    c1, c2 = _contract(1), _contract(2, 'OPT')
+
+    first = await manager.get_tickers(c1, c2)
+    second = await manager.get_tickers(c2, c1)
+
+    assert [t.contract for t in first] == [c1, c2]
+    assert second[0] is first[1] and second[1] is first[0]
+    assert ib.reqMktData.call_count == 2
+    assert manager.stats['hits'] == 2
+    ib.reqTickersAsync.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_spares_referenced_lines():
+    ib = _fake_ib()
+    manager = MarketDataManager(ib, max_lines=2)
+    pinned, idle, new = _contract(1), _contract(2), _contract(3)
+
+    await manager.subscribe(pinned)
+    await manager.get_tickers(idle)
+    await manager.get_tickers(new)
+
+    assert manager.ticker(pinned) is not None
+    assert manager.ticker(idle) is None
+    assert manager.ticker(new) is not None
+    ib.cancelMktData.assert_called_once_with(idle)
+
+
+@pytest.mark.asyncio
+async def test_budget_exhausted_falls_back_to_snapshot():
+    ib = _fake_ib()
+    manager = MarketDataManager(ib, max_lines=1)
+    await manager.subscribe(_contract(1))
+
+    [ticker] = await manager.get_tickers(_contract(2))
+
+    assert ticker.bid == 2.0
+    assert manager.stats['snapshots'] == 1
+
+
+@pytest.mark.asyncio
+async def test_hold_releases_dropped_contracts():
+    ib = _fake_ib()
+    manager = MarketDataManager(ib, max_lines=1)
+    old, new = _contract(1), _contract(2)
+
+    await manager.hold('short_call:GOOG', [old])
+    await manager.hold('short_call:GOOG', [new])
+
+    assert manager.ticker(old) is None
+    assert manager.ticker(new) is not None
+
+
+@pytest.mark.asyncio
+async def test_req_tickers_uses_installed_manager_only_for_its_ib():
+    ib, other = _fake_ib(), _fake_ib()
+    market_data.install(ib, max_lines=5)
+    try:
+        await req_tickers(ib, _contract(1))
+        await req_tickers(other, _contract(1))
+        assert ib.reqMktData.call_count == 1
+        other.reqMktData.assert_not_called()
+        other.reqTickersAsync.assert_awaited_once()
+    finally:
+        market_data.uninstall()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_cache_reuses_fresh_quotes_without_manager():
+    ib = _fake_ib()
+    c1, c2 = _contract(1), _contract(2)
+
+    first = await req_tickers(ib, c1)
+    second = await req_tickers(ib, c2, c1)
+
+    assert second[1] is first[0]
+    assert ib.reqTickersAsync.await_count == 2
+    ib.reqTickersAsync.assert_awaited_with(c2)
+    assert market_data.ticker_cache.stats == {'hits': 1, 'misses': 2}
+
+
+@pytest.mark.asyncio
+async def test_snapshot_cache_expires_after_ttl(monkeypatch):
+    ib = _fake_ib()
+    c1 = _contract(1)
+    monkeypatch.setattr(market_data.ticker_cache, 'ttl', 0.5)
+    clock = [100.0]
+    monkeypatch.setattr(market_data.time, 'monotonic', lambda: clock[0])
+
+    await req_tickers(ib, c1)
+    clock[0] += 0.4
+    await req_tickers(ib, c1)
+    clock[0] += 0.6
+    await req_tickers(ib, c1)
+
+    assert ib.reqTickersAsync.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_lines_awaiting_first_quote_are_not_evicted_by_concurrent_requests():
+    import asyncio
+
+    ib = _fake_ib()
+
+    def req_mkt_data(contract, *args, **kwargs):
+        ticker = Ticker(contract=contract)
+
+        def arrive():
+            ticker.bid, ticker.ask = 1.0, 1.1
+        asyncio.get_running_loop().call_later(0.05, arrive)
+        return ticker
+
+    ib.reqMktData = MagicMock(side_effect=req_mkt_data)
+    manager = MarketDataManager(ib, max_lines=50)
+    batches = [[_contract(100 * b + k) for k in range(40)] for b in range(3)]
+
+    results = await asyncio.gather(*(manager.get_tickers(*batch) for batch in batches))
+
+    for batch, tickers in zip(batches, results):
+        assert [t.contract for t in tickers] == batch
+        assert all(t.bid in (1.0, 2.0) for t in tickers)
+    ib.cancelMktData.assert_not_called()
+    assert manager.lines_in_use == 50
+    assert manager.stats['snapshots'] == 70
+    assert all(line.refcount == 0 for line in manager._lines.values())
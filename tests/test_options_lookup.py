@@ -2,7 +2,9 @@ import pytest
 import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 from ib_insync import Option, Ticker
+from datetime import datetime, timedelta
 from options_lookup import find_contract_by_delta
+from pricing import bs_delta, year_fraction
 
 @pytest.mark.asyncio
 async def test_find_contract_by_delta_success():
@@ -71,3 +73,116 @@ async def test_find_contract_by_delta_wrong_expiry():
     result = await find_contract_by_delta(ib, underlying, '20260220', 0.15, 'C')
     
     assert result is None
+
+@pytest.mark.asyncio
+async def test_find_contract_by_delta_model_mode_confirms_few_strikes():
+    expiry = (datetime.now() + timedelta(days=30)).strftime('%Y%m%d')
+    ib = MagicMock()
+    strikes = [100.0 + i for i in range(60)]
+    mock_chain = MagicMock(exchange='SMART', expirations=[expiry], strikes=strikes)
+    ib.reqSecDefOptParamsAsync = AsyncMock(return_value=[mock_chain])
+    ib.qualifyContractsAsync = AsyncMock(side_effect=lambda *args: list(args))
+
+    underlying = MagicMock(symbol='GOOG', secType='STK', conId=123)
+    underlying_ticker = MagicMock()
+    underlying_ticker.marketPrice.return_value = 100.0
+
+    def make_ticker(contract):
+        # 带偏斜的“真实” IV，模型只能拿到三个样本
+        iv = 0.25 + (contract.strike - 100.0) * 0.002
+        delta = float(bs_delta(100.0, [contract.strike], year_fraction(expiry), iv, 'C')[0])
+        t = MagicMock(contract=contract, modelGreeks=MagicMock(delta=delta, impliedVol=iv), bid=1.0, ask=1.02)
+        t.marketPrice.return_value = 1.01
+        return t
+
+    requested = []
+
+    async def req_tickers(*contracts):
+        if contracts[0] is underlying:
+            return [underlying_ticker]
+        requested.extend(contracts)
+        return [make_ticker(c) for c in contracts]
+
+    ib.reqTickersAsync = AsyncMock(side_effect=req_tickers)
+
+    result = await find_contract_by_delta(ib, underlying, expiry, 0.15, 'C', mode='model', confirm_count=5)
+
+    best = min(strikes[1:], key=lambda s: abs(make_ticker(Option('GOOG', expiry, s, 'C')).modelGreeks.delta - 0.15))
+    assert result is not None
+    assert result.strike == best
+    # 只拉取 IV 样本 + 少量确认合约，而不是整条链
+    assert len(requested) <= 3 + 5
+
+
+def _linear_delta_ib(underlying, expiry, strikes, delta_of_strike, missing=()):
+    ib = MagicMock()
+    ib.reqSecDefOptParamsAsync = AsyncMock(return_value=[
+        MagicMock(exchange='SMART', expirations=[expiry], strikes=strikes)
+    ])
+    ib.qualifyContractsAsync = AsyncMock(side_effect=lambda *args: list(args))
+    underlying_ticker = MagicMock()
+    underlying_ticker.marketPrice.return_value = 5000.0
+
+    def make_ticker(contract):
+        greeks = None if contract.strike in missing else MagicMock(delta=-delta_of_strike(contract.strike))
+        t = MagicMock(contract=contract, modelGreeks=greeks, lastGreeks=None, bid=1.0, ask=1.02)
+        t.marketPrice.return_value = 1.01
+        return t
+
+    async def req_tickers(*contracts):
+        if contracts[0] is underlying:
+            return [underlying_ticker]
+        return [make_ticker(c) for c in contracts]
+
+    ib.reqTickersAsync = AsyncMock(side_effect=req_tickers)
+    return ib
+
+
+@pytest.mark.asyncio
+async def test_bisect_mode_matches_scan_with_fewer_requests():
+    from options_lookup import search_contract_by_delta
+
+    expiry = '20260220'
+    strikes = [4000.0 + 5 * i for i in range(200)]
+    delta_of_strike = lambda k: max(0.5 - (5000.0 - k) / 1000.0, 0.0)
+    underlying = MagicMock(symbol='SPX', secType='IND', conId=416904)
+
+    ib = _linear_delta_ib(underlying, expiry, strikes, delta_of_strike)
+    scan = await search_contract_by_delta(ib, underlying, expiry, 0.07, 'P', early_exit_diff=0.0)
+    ib = _linear_delta_ib(underlying, expiry, strikes, delta_of_strike)
+    bisect = await search_contract_by_delta(ib, underlying, expiry, 0.07, 'P', mode='bisect')
+
+    assert scan.contract.strike == bisect.contract.strike == 4570.0
+    assert bisect.mode == 'bisect'
+    assert bisect.ib_requests < scan.ib_requests / 3
+    assert bisect.round_trips <= 2 * 8
+
+
+@pytest.mark.asyncio
+async def test_bisect_mode_skips_strikes_without_greeks():
+    expiry = '20260220'
+    strikes = [4000.0 + 5 * i for i in range(200)]
+    delta_of_strike = lambda k: max(0.5 - (5000.0 - k) / 1000.0, 0.0)
+    underlying = MagicMock(symbol='SPX', secType='IND', conId=416904)
+    ib = _linear_delta_ib(underlying, expiry, strikes, delta_of_strike, missing={4570.0, 4575.0})
+
+    result = await find_contract_by_delta(ib, underlying, expiry, 0.07, 'P', mode='bisect')
+
+    assert result.strike in (4565.0, 4580.0)
+
+
+@pytest.mark.asyncio
+async def test_strikes_probed_counts_quoted_strikes_including_those_without_greeks():
+    from options_lookup import search_contract_by_delta
+
+    expiry = '20260220'
+    strikes = [4000.0 + 5 * i for i in range(200)]
+    delta_of_strike = lambda k: max(0.5 - (5000.0 - k) / 1000.0, 0.0)
+    underlying = MagicMock(symbol='SPX', secType='IND', conId=416904)
+    ib = _linear_delta_ib(underlying, expiry, strikes, delta_of_strike, missing={4570.0, 4575.0})
+
+    result = await search_contract_by_delta(ib, underlying, expiry, 0.07, 'P', mode='bisect')
+
+    quoted = {c.strike for call in ib.reqTickersAsync.call_args_list for c in call.args if c is not underlying}
+    assert result.strikes_probed == len(quoted)
+    assert {4570.0, 4575.0} & quoted
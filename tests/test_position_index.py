@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from eventkit import Event
+from ib_insync import Bag, CommissionReport, Execution, Fill, Option, Position, Stock
+
+from position_index import PositionIndex
+
+
+def _stock(symbol, con_id):
+    c = Stock(symbol, 'SMART', 'USD')
+    c.conId = con_id
+    return c
+
+
+def _option(symbol, con_id, strike=200, right='C', expiry='20261023'):
+    c = Option(symbol, expiry, strike, right, 'SMART', multiplier='100')
+    c.conId = con_id
+    return c
+
+
+def _fake_ib(positions):
+    ib = MagicMock()
+    ib.positions.return_value = positions
+    ib.positionEvent = Event('positionEvent')
+    ib.execDetailsEvent = Event('execDetailsEvent')
+    return ib
+
+
+def _fill(contract, side, shares, exec_id, price=1.5, time=None):
+    execution = Execution(execId=exec_id, side=side, shares=shares, price=price, acctNumber='DU1',
+                          time=time or datetime.now(timezone.utc))
+    return Fill(contract, execution, CommissionReport(), None)
+
+
+def test_lookups_by_full_and_partial_key():
+    goog, call, put = _stock('GOOG', 1), _option('GOOG', 2), _option('SPX', 3, 5000, 'P')
+    ib = _fake_ib([
+        Position('DU1', goog, 300, 150.0),
+        Position('DU1', call, -3, 120.0),
+        Position('DU1', put, -1, 300.0),
+    ])
+    index = PositionIndex(ib)
+    index.attach()
+
+    assert index.first('GOOG', 'STK', '', '').position == 300
+    assert index.first('GOOG', 'OPT', 'C').contract is call
+    assert index.get('GOOG', 'OPT', 'C', '20261023')[0].contract is call
+    assert index.get('GOOG', 'OPT', 'P') == []
+    assert [p.contract for p in index.all('OPT')] == [call, put]
+    assert index.first('MSFT', 'STK', '', '') is None
+
+
+def test_fills_apply_immediately_and_position_event_is_authoritative():
+    call = _option('GOOG', 2)
+    ib = _fake_ib([])
+    index = PositionIndex(ib)
+    index.attach()
+
+    fill = _fill(call, 'SLD', 2, 'e1')
+    ib.execDetailsEvent.emit(MagicMock(), fill)
+    ib.execDetailsEvent.emit(MagicMock(), fill)   # 重复推送的同一成交只计一次
+    ib.execDetailsEvent.emit(MagicMock(), _fill(Bag(symbol='GOOG'), 'SLD', 2, 'e2'))
+    assert index.first('GOOG', 'OPT', 'C').position == -2
+    assert index.first('GOOG', 'OPT', 'C').avgCost == 150.0
+
+    ib.positionEvent.emit(Position('DU1', call, -2, 148.0))
+    assert index.first('GOOG', 'OPT', 'C').avgCost == 148.0
+
+    ib.execDetailsEvent.emit(MagicMock(), _fill(call, 'BOT', 2, 'e3'))
+    assert index.get('GOOG', 'OPT') == []
+    assert len(index) == 0
+
+
+def test_closed_position_event_removes_entry_and_detach_stops_updates():
+    goog = _stock('GOOG', 1)
+    ib = _fake_ib([Position('DU1', goog, 100, 150.0)])
+    index = PositionIndex(ib)
+    index.attach()
+
+    ib.positionEvent.emit(Position('DU1', goog, 0, 0.0))
+    assert index.first('GOOG', 'STK', '', '') is None
+
+    index.detach()
+    ib.positionEvent.emit(Position('DU1', goog, 100, 150.0))
+    assert len(index) == 0
+
+
+def test_fill_already_in_position_event_is_not_counted_twice():
+    call = _option('GOOG', 2)
+    ib = _fake_ib([Position('DU1', call, -1, 120.0)])
+    index = PositionIndex(ib)
+    index.attach()
+
+    # 成交增量先到，随后的权威持仓已包含它：以权威值为准
+    ib.execDetailsEvent.emit(MagicMock(), _fill(call, 'SLD', 2, 'e1'))
+    assert index.first('GOOG', 'OPT', 'C').position == -3
+    ib.positionEvent.emit(Position('DU1', call, -3, 130.0))
+    assert index.first('GOOG', 'OPT', 'C').position == -3
+
+    # 权威持仓先到，之后才推送的更早成交已包含在内，忽略
+    executed = datetime.now(timezone.utc) - timedelta(seconds=1)
+    ib.positionEvent.emit(Position('DU1', call, -4, 135.0))
+    ib.execDetailsEvent.emit(MagicMock(), _fill(call, 'SLD', 1, 'e2', time=executed))
+    assert index.first('GOOG', 'OPT', 'C').position == -4
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+from pricing import (approximate_deltas, black76_delta, bs_delta, interpolate_iv, norm_cdf, norm_ppf, strike_for_delta,
+                     year_fraction)
+
+
+def test_norm_cdf_matches_known_values():
+    values = norm_cdf(np.array([-1.96, 0.0, 1.0]))
+    assert np.allclose(values, [0.0249979, 0.5, 0.8413447], atol=1e-6)
+
+
+def test_bs_delta_is_monotonic_in_strike():
+    strikes = np.linspace(80, 120, 41)
+    calls = bs_delta(100.0, strikes, 30 / 365, 0.25, 'C')
+    puts = bs_delta(100.0, strikes, 30 / 365, 0.25, 'P')
+    assert np.all(np.diff(calls) < 0)
+    assert np.all(np.diff(puts) < 0)
+    assert np.all((calls > 0) & (calls < 1))
+    assert np.all((puts < 0) & (puts > -1))
+
+
+def test_black76_put_call_delta_parity():
+    strikes = np.array([4800.0, 5000.0, 5200.0])
+    t = 7 / 365
+    call = black76_delta(5000.0, strikes, t, 0.2, 'C', rate=0.0)
+    put = black76_delta(5000.0, strikes, t, 0.2, 'P', rate=0.0)
+    assert np.allclose(call - put, 1.0)
+
+
+def test_interpolate_iv_flat_extrapolation():
+    iv = interpolate_iv([90, 100, 110, 130], [100, 120], [0.2, 0.3])
+    assert np.allclose(iv, [0.2, 0.2, 0.25, 0.3])
+
+
+def test_year_fraction_has_floor_for_expired_contracts():
+    est = pytz.timezone('US/Eastern')
+    now = est.localize(datetime(2026, 2, 20, 17, 0))
+    assert year_fraction('20260220', now) > 0
+    assert abs(year_fraction('20260227', est.localize(datetime(2026, 2, 20, 16, 0))) - 7 / 365) < 1e-9
+
+
+def test_approximate_deltas_uses_index_model():
+    now = datetime(2026, 2, 13, 10, 0)
+    stk = approximate_deltas(5000.0, [4900.0], '20260220', [4900.0], [0.2], 'P', sec_type='STK', now=now)
+    ind = approximate_deltas(5000.0, [4900.0], '20260220', [4900.0], [0.2], 'P', sec_type='IND', now=now)
+    assert stk[0] < 0 and ind[0] < 0
+    assert abs(stk[0] - ind[0]) < 0.01
+
+
+def test_bs_price_put_call_parity():
+    from pricing import bs_price
+    strikes = np.array([90.0, 100.0, 110.0])
+    t, rate = 0.25, 0.03
+    call = bs_price(100.0, strikes, t, 0.3, 'C', rate=rate)
+    put = bs_price(100.0, strikes, t, 0.3, 'P', rate=rate)
+    assert np.allclose(call - put, 100.0 - strikes * np.exp(-rate * t), atol=1e-5)
+    assert np.all(put > 0)
+
+
+def test_norm_ppf_inverts_norm_cdf():
+    p = np.array([1e-6, 0.01, 0.05, 0.3, 0.5, 0.93, 0.999])
+    assert np.allclose(norm_cdf(norm_ppf(p)), p, atol=1e-7)
+
+
+def test_strike_for_delta_inverts_bs_delta():
+    strikes = strike_for_delta(np.array([200.0, 5000.0]), 7 / 365, 0.25, 0.15, 'C')
+    assert np.allclose(bs_delta(np.array([200.0, 5000.0]), strikes, 7 / 365, 0.25, 'C'), 0.15, atol=1e-6)
+    put = strike_for_delta(5000.0, 1 / 365, 0.16, 0.07, 'P')
+    assert put < 5000 and abs(bs_delta(5000.0, put, 1 / 365, 0.16, 'P') + 0.07) < 1e-6
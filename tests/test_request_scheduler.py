@@ -0,0 +1,66 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from request_scheduler import (
+    PRIORITY_LOW, PRIORITY_URGENT, PacedIB, RequestScheduler, TokenBucket, priority_lane,
+)
+
+
+def test_token_bucket_wait_time_and_debt():
+    bucket = TokenBucket(rate=10.0, capacity=5.0)
+    assert bucket.wait_time(5) == 0.0
+    bucket.take(8)
+    # 透支 3 个，再要 1 个需等待 (3 + 1) / 10 秒
+    assert bucket.wait_time(1) == pytest.approx(0.4, abs=0.02)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_spaces_requests():
+    scheduler = RequestScheduler(limits={'market_data': (50.0, 1.0)}, global_rate=1000.0)
+    started = time.monotonic()
+    await asyncio.gather(*(scheduler.acquire('market_data') for _ in range(6)))
+    # 容量 1，之后每 20ms 放行一个
+    assert time.monotonic() - started >= 0.09
+    stats = scheduler.stats()['market_data']
+    assert stats['granted'] == 6
+    assert stats['max_queue_depth'] == 6
+    assert stats['max_wait'] > 0
+
+
+@pytest.mark.asyncio
+async def test_urgent_lane_jumps_the_queue():
+    scheduler = RequestScheduler(limits={'orders': (20.0, 1.0)}, global_rate=1000.0)
+    order = []
+
+    async def request(name, priority):
+        await scheduler.acquire('orders', priority=priority)
+        order.append(name)
+
+    tasks = [asyncio.ensure_future(request(f'low{i}', PRIORITY_LOW)) for i in range(4)]
+    await asyncio.sleep(0)
+    with priority_lane(PRIORITY_URGENT):
+        tasks.append(asyncio.ensure_future(request('urgent', None)))
+    await asyncio.gather(*tasks)
+
+    assert order[0] == 'low0'
+    assert order.index('urgent') == 1
+
+
+@pytest.mark.asyncio
+async def test_paced_ib_routes_requests():
+    ib = MagicMock()
+    ib.qualifyContractsAsync = AsyncMock(return_value=['a', 'b'])
+    ib.placeOrder = MagicMock(return_value='trade')
+    ib.isConnected.return_value = True
+    paced = PacedIB(ib)
+
+    assert await paced.qualifyContractsAsync('a', 'b') == ['a', 'b']
+    assert paced.placeOrder('contract', 'order') == 'trade'
+    assert paced.isConnected() is True
+
+    stats = paced.scheduler.stats()
+    assert stats['contract_details']['granted'] == 1
+    assert stats['orders']['charged'] == 1
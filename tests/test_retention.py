@@ -0,0 +1,111 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import data_logger
+from retention import RetentionPolicy, run_retention
+
+NOW = datetime(2026, 10, 18, 12, 30)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / 'strategy.db'
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    data_logger.migrate(conn)
+    conn.close()
+    return path
+
+
+def _insert(path, rows):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO market_snapshots (timestamp, symbol, value) VALUES (?, ?, ?)",
+            [(ts.isoformat(), symbol, value) for ts, symbol, value in rows]
+        )
+    conn.close()
+
+
+def _query(path, sql, params=()):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_raw_snapshots_roll_up_into_hourly_and_daily_ohlc(db):
+    start = datetime(2026, 10, 16, 9, 0)
+    # 两天、每 10 分钟一条 VIX
+    _insert(db, [(start + timedelta(minutes=10 * i), 'VIX', 15 + (i % 6)) for i in range(6 * 30)])
+
+    stats = run_retention(db, RetentionPolicy(raw_days=7, hourly_days=90, batch_hours=1000), now=NOW)
+
+    hourly = _query(db, "SELECT bucket_start, open, high, low, close, samples FROM market_rollups "
+                        "WHERE resolution = '1h' ORDER BY bucket_start")
+    assert stats['hourly_buckets'] == len(hourly) == 30
+    assert hourly[0] == ('2026-10-16T09:00:00', 15, 20, 15, 20, 6)
+
+    daily = _query(db, "SELECT bucket_start, samples FROM market_rollups WHERE resolution = '1d' ORDER BY bucket_start")
+    # 10-17 已结束，10-18 仍在进行，只汇总完整的自然日
+    assert daily == [('2026-10-16T00:00:00', 15 * 6), ('2026-10-17T00:00:00', 15 * 6)]
+    assert stats['raw_deleted'] == 0
+
+
+def test_expired_rows_deleted_only_after_rollup_and_passes_are_incremental(db):
+    old = datetime(2026, 10, 1, 10, 0)
+    _insert(db, [(old + timedelta(minutes=5 * i), 'SPX', 5000 + i) for i in range(24)])
+    _insert(db, [(datetime(2026, 10, 18, 11, 5), 'SPX', 5800)])
+
+    policy = RetentionPolicy(raw_days=7, hourly_days=90, batch_hours=1, delete_chunk=5)
+    stats = run_retention(db, policy, now=NOW)
+    # 每轮只推进 1 小时，尚未汇总的 11:00 之后原始记录不能删
+    assert stats['hourly_buckets'] == 1
+    assert stats['raw_deleted'] == 12
+    assert _query(db, "SELECT COUNT(*) FROM market_snapshots")[0][0] == 13
+
+    run_retention(db, policy, now=NOW)
+    assert _query(db, "SELECT COUNT(*) FROM market_snapshots")[0][0] == 1
+
+    # 逐轮追到当前小时，重复执行不会重复汇总
+    while _query(db, "SELECT value FROM retention_state WHERE name = 'rollup_1h'")[0][0] < '2026-10-18T12:00:00':
+        run_retention(db, policy, now=NOW)
+    assert run_retention(db, policy, now=NOW)['hourly_buckets'] == 0
+    hourly = _query(db, "SELECT bucket_start, open, close, samples FROM market_rollups "
+                        "WHERE resolution = '1h' AND symbol = 'SPX' ORDER BY bucket_start")
+    assert hourly == [
+        ('2026-10-01T10:00:00', 5000, 5011, 12),
+        ('2026-10-01T11:00:00', 5012, 5023, 12),
+        ('2026-10-18T11:00:00', 5800, 5800, 1),
+    ]
+    assert _query(db, "SELECT samples FROM market_rollups WHERE resolution = '1d' AND bucket_start = '2026-10-01T00:00:00'") == [(24,)]
+
+
+def test_hourly_rows_expire_after_daily_rollup(db):
+    _insert(db, [(datetime(2026, 6, 1, h, 0), 'VIX', 20 + h) for h in range(24)])
+
+    stats = run_retention(db, RetentionPolicy(raw_days=7, hourly_days=90, batch_hours=10_000, batch_days=1000),
+                          now=NOW)
+
+    assert stats['raw_deleted'] == 24 and stats['hourly_deleted'] == 24
+    assert _query(db, "SELECT resolution, open, high, low, close, samples FROM market_rollups") == [
+        ('1d', 20, 43, 20, 43, 24)
+    ]
+
+
+def test_hour_is_rolled_up_only_after_queued_writes_settle(db):
+    top = datetime(2026, 10, 18, 13, 0)
+    _insert(db, [(top - timedelta(minutes=30), 'VIX', 20)])
+    policy = RetentionPolicy(raw_days=0, hourly_days=90)
+
+    # 整点刚过：12:59:59 的快照可能还在写入批次里，12 点这一小时暂不汇总，原始数据也不删除
+    assert run_retention(db, policy, now=top + timedelta(seconds=5))['hourly_buckets'] == 0
+    _insert(db, [(top - timedelta(seconds=0.2), 'VIX', 25)])
+
+    stats = run_retention(db, policy, now=top + timedelta(minutes=5))
+    assert _query(db, "SELECT bucket_start, high, samples FROM market_rollups WHERE resolution = '1h' "
+                      "AND bucket_start = '2026-10-18T12:00:00'") == [('2026-10-18T12:00:00', 25, 2)]
+    assert stats['raw_deleted'] == 2
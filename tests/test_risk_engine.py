@@ -0,0 +1,105 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytz
+from eventkit import Event
+from ib_insync import Option, PnL, PnLSingle, Position
+
+import utils
+from risk_engine import RiskEngine
+
+
+def _fake_ib():
+    ib = MagicMock()
+    ib.pnlEvent = Event('pnlEvent')
+    ib.pnlSingleEvent = Event('pnlSingleEvent')
+    ib.reqPnL = MagicMock(side_effect=lambda account, model='': PnL(account, model))
+    ib.reqPnLSingle = MagicMock(side_effect=lambda account, model, con_id: PnLSingle(account, model, con_id))
+    del ib.wrapper
+    return ib
+
+
+def _push(ib, pnl, daily):
+    pnl.dailyPnL = daily
+    ib.pnlEvent.emit(pnl)
+
+
+@pytest.mark.asyncio
+async def test_breach_on_streamed_pnl_triggers_exit_once():
+    ib = _fake_ib()
+    on_breach = AsyncMock()
+    engine = RiskEngine(ib, 'DU1', initial_nav=100_000, max_drawdown=0.01, on_breach=on_breach)
+    engine.start()
+    pnl = engine._pnl
+
+    _push(ib, pnl, 200.0)       # 启动时的基准
+    _push(ib, pnl, -700.0)      # 亏损 900 = 0.9%
+    await engine.wait()
+    on_breach.assert_not_awaited()
+
+    _push(ib, pnl, -900.0)      # 亏损 1100 = 1.1%
+    _push(ib, pnl, -1500.0)
+    await engine.wait()
+
+    on_breach.assert_awaited_once()
+    assert engine.tripped
+    assert engine.stats['detect_ms'] is not None and engine.stats['react_ms'] is not None
+    assert engine.stats['max_drawdown_seen'] == pytest.approx(0.017)
+
+
+@pytest.mark.asyncio
+async def test_position_pnl_used_until_account_pnl_arrives_and_sync_cancels():
+    ib = _fake_ib()
+    on_breach = AsyncMock()
+    engine = RiskEngine(ib, 'DU1', initial_nav=50_000, max_drawdown=0.01, on_breach=on_breach)
+    engine.start()
+    spx = Option('SPX', '20261023', 5000, 'P', 'SMART')
+    spx.conId = 7
+    engine.sync_positions([Position('DU1', spx, -1, 300.0)])
+    single = engine._singles[7]
+
+    single.dailyPnL = 0.0
+    ib.pnlSingleEvent.emit(single)
+    single.dailyPnL = -600.0
+    ib.pnlSingleEvent.emit(single)
+    await engine.wait()
+
+    on_breach.assert_awaited_once()
+
+    engine.sync_positions([])
+    ib.cancelPnLSingle.assert_called_once_with('DU1', '', 7)
+    engine.stop()
+    ib.cancelPnL.assert_called_once_with('DU1')
+
+
+def _freeze_eastern(wall):
+    utils.freeze_clock(wall, pytz.timezone('US/Eastern').localize(wall).timestamp())
+
+
+@pytest.mark.asyncio
+async def test_baseline_resets_when_the_trading_day_changes():
+    ib = _fake_ib()
+    on_breach = AsyncMock()
+    engine = RiskEngine(ib, 'DU1', initial_nav=100_000, max_drawdown=0.01, on_breach=on_breach)
+    engine.start()
+    pnl = engine._pnl
+    try:
+        _freeze_eastern(datetime(2026, 3, 2, 15, 0))
+        _push(ib, pnl, 1500.0)      # 启动时当日已盈利 1500
+        _push(ib, pnl, 1000.0)
+
+        # 次日 IB 重置 dailyPnL：不能拿前一日的 1500 作基准 (否则亏损被算成 1600)
+        _freeze_eastern(datetime(2026, 3, 3, 9, 31))
+        _push(ib, pnl, 0.0)
+        _push(ib, pnl, -100.0)
+        await engine.wait()
+        on_breach.assert_not_awaited()
+        assert engine.drawdown() == pytest.approx(0.001)
+
+        # 新基准下的真实亏损照常触发
+        _push(ib, pnl, -1200.0)
+        await engine.wait()
+        on_breach.assert_awaited_once()
+    finally:
+        utils.unfreeze_clock()
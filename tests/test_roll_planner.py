@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+import pytest
+from ib_insync import Option, Stock, Ticker
+
+from options_lookup import ChainSnapshot
+import roll_planner
+from roll_planner import plan_roll, score_roll_candidates
+
+
+def _expiry(days):
+    return (datetime.now() + timedelta(days=days)).strftime('%Y%m%d')
+
+
+def _snapshot(expiry, rows):
+    """rows: [(strike, bid, ask, |delta|)]"""
+    strikes, bids, asks, deltas = (np.array(col, dtype=float) for col in zip(*rows))
+    contracts = tuple(Option('GOOG', expiry, s, 'C', 'SMART') for s in strikes)
+    return ChainSnapshot('GOOG', expiry, 'C', 200.0, datetime.now(), strikes, bids, asks, deltas,
+                         np.full(len(strikes), 0.3), contracts)
+
+
+def test_scoring_applies_costs_liquidity_and_delta_window():
+    snapshot = _snapshot(_expiry(14), [
+        (205, 2.00, 2.10, 0.30),   # Delta 偏离目标
+        (210, 1.20, 1.25, 0.16),
+        (215, 1.10, 1.60, 0.14),   # Spread 太宽
+        (220, 0.50, 0.52, 0.12),   # 扣除成本后净收入为负
+    ])
+
+    net, score = score_roll_candidates(snapshot, old_cost=0.60, qty=2, target_delta=0.15)
+
+    assert np.isfinite(score).tolist() == [False, True, False, False]
+    assert net[1] == pytest.approx((1.20 - 0.60) * 200)
+
+
+def _chain_ib(quotes_by_expiry):
+    """quotes_by_expiry: {expiry: {strike: (bid, ask, delta)}}"""
+    ib = MagicMock()
+    strikes = sorted({s for quotes in quotes_by_expiry.values() for s in quotes})
+    ib.reqSecDefOptParamsAsync = AsyncMock(return_value=[
+        MagicMock(exchange='SMART', expirations=sorted(quotes_by_expiry), strikes=strikes)
+    ])
+    ib.qualifyContractsAsync = AsyncMock(side_effect=lambda *cs: list(cs))
+
+    async def req_tickers(*contracts):
+        tickers = []
+        for c in contracts:
+            if c.secType == 'STK':
+                tickers.append(Ticker(contract=c, last=200.0))
+                continue
+            bid, ask, delta = quotes_by_expiry[c.lastTradeDateOrContractMonth][c.strike]
+            tickers.append(Ticker(contract=c, bid=bid, ask=ask, modelGreeks=MagicMock(delta=delta, impliedVol=0.3)))
+        return tickers
+
+    ib.reqTickersAsync = AsyncMock(side_effect=req_tickers)
+    return ib
+
+
+@pytest.mark.asyncio
+async def test_plan_roll_falls_through_to_next_expiry_when_first_is_illiquid():
+    week1, week2, week3 = _expiry(7), _expiry(14), _expiry(21)
+    ib = _chain_ib({
+        week1: {210.0: (0.90, 1.40, 0.15)},
+        week2: {210.0: (1.30, 1.35, 0.16)},
+        week3: {210.0: (1.50, 1.55, 0.17)},
+    })
+    stock = Stock('GOOG', 'SMART', 'USD')
+    stock.conId = 208813720
+
+    plan = await plan_roll(ib, stock, old_cost=0.50, qty=1, target_delta=0.15, expiries=[week1, week2, week3])
+
+    assert plan.expiry == week2      # 第三周净收入更高，但按剩余天数折算更低
+    assert plan.contract.strike == 210.0
+    assert plan.net == pytest.approx((1.30 - 0.50) * 100)
+
+
+@pytest.mark.asyncio
+async def test_plan_roll_returns_none_when_no_candidate_covers_costs():
+    week1 = _expiry(7)
+    ib = _chain_ib({week1: {210.0: (0.52, 0.53, 0.15)}})
+    stock = Stock('GOOG', 'SMART', 'USD')
+    stock.conId = 208813720
+
+    assert await plan_roll(ib, stock, old_cost=0.50, qty=1, target_delta=0.15, expiries=[week1]) is None
+
+
+@pytest.mark.asyncio
+async def test_plan_roll_keeps_concurrent_chain_fetches_within_line_budget(monkeypatch):
+    expiries = [_expiry(7 * w) for w in (1, 2, 3)]
+    in_flight, peak = 0, 0
+
+    async def fetch(ib, underlying, expiry, right, max_strikes):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _snapshot(expiry, [(210, 1.30, 1.35, 0.16)])
+
+    monkeypatch.setattr(roll_planner, 'fetch_chain_snapshot', fetch)
+    # 95 条行情线只够两个 40 行权价的截面同时在途
+    monkeypatch.setattr(roll_planner, 'get_manager', lambda ib: MagicMock(max_lines=95))
+
+    plan = await plan_roll(MagicMock(), Stock('GOOG', 'SMART', 'USD'), old_cost=0.50, qty=1,
+                           target_delta=0.15, expiries=expiries)
+
+    assert plan.expiry == expiries[0]
+    assert peak == 2
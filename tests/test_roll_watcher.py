@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from ib_insync import Option, OptionComputation, Position, Ticker
+
+import market_data
+from roll_watcher import RollWatcher
+
+
+def _greeks(delta):
+    return OptionComputation(0, 0.2, delta, 1.0, 0.0, 0.0, 0.0, 0.0, 100.0)
+
+
+def _short_call(con_id=11, days=5):
+    expiry = (datetime.now() + timedelta(days=days)).strftime('%Y%m%d')
+    contract = Option('GOOG', expiry, 200, 'C', 'SMART')
+    contract.conId = con_id
+    contract.localSymbol = f'GOOG C{con_id}'
+    return Position('DU1', contract, -1, 1.0)
+
+
+@pytest.fixture
+def ib():
+    ib = MagicMock()
+    ib.reqMktData = MagicMock(
+        side_effect=lambda c, *a, **k: Ticker(contract=c, bid=1.0, ask=1.1, modelGreeks=_greeks(0.20))
+    )
+    market_data.install(ib)
+    yield ib
+    market_data.uninstall()
+
+
+@pytest.mark.asyncio
+async def test_delta_crossing_fires_once_within_cooldown(ib):
+    on_trigger = AsyncMock()
+    watcher = RollWatcher(ib, on_trigger, delta_threshold=0.45, dte_threshold=1, debounce=0)
+    position = _short_call()
+    await watcher.watch(position)
+    ticker = market_data.get_manager(ib).ticker(position.contract)
+
+    ticker.updateEvent.emit(ticker)
+    await watcher.drain()
+    on_trigger.assert_not_awaited()
+
+    ticker.modelGreeks = _greeks(0.52)
+    ticker.updateEvent.emit(ticker)
+    ticker.updateEvent.emit(ticker)
+    await watcher.drain()
+
+    on_trigger.assert_awaited_once_with(position)
+    assert watcher.stats['triggers'] == 1
+    await watcher.close()
+
+
+@pytest.mark.asyncio
+async def test_updates_are_debounced_into_trailing_evaluation(ib):
+    on_trigger = AsyncMock()
+    watcher = RollWatcher(ib, on_trigger, delta_threshold=0.45, dte_threshold=1, debounce=0.05)
+    position = _short_call()
+    await watcher.watch(position)
+    ticker = market_data.get_manager(ib).ticker(position.contract)
+
+    for delta in (0.30, 0.40, 0.50):
+        ticker.modelGreeks = _greeks(delta)
+        ticker.updateEvent.emit(ticker)
+    assert watcher.stats['evaluations'] == 1
+    on_trigger.assert_not_awaited()
+
+    await asyncio.sleep(0.1)
+    await watcher.drain()
+    assert watcher.stats['updates'] == 3
+    assert watcher.stats['evaluations'] == 2
+    on_trigger.assert_awaited_once_with(position)
+    await watcher.close()
+
+
+@pytest.mark.asyncio
+async def test_dte_below_threshold_fires_on_watch_and_sync_releases_lines(ib):
+    on_trigger = AsyncMock()
+    watcher = RollWatcher(ib, on_trigger, delta_threshold=0.45, dte_threshold=1)
+    expiring = _short_call(con_id=21, days=0)
+
+    await watcher.sync([expiring])
+    await watcher.drain()
+    on_trigger.assert_awaited_once_with(expiring)
+
+    await watcher.sync([])
+    assert watcher.watched == []
+    manager = market_data.get_manager(ib)
+    assert manager._lines[21].refcount == 0
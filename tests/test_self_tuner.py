@@ -0,0 +1,102 @@
+import sqlite3
+from statistics import mean, variance
+
+import pytest
+import pytest_asyncio
+
+import data_logger
+from config import load_parameters
+import self_tuner
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch):
+    path = tmp_path / 'strategy.db'
+    monkeypatch.setattr(data_logger, 'DB_PATH', path)
+    monkeypatch.setattr('config.LEARNED_CONFIG_PATH', tmp_path / 'learned.json')
+    await data_logger.ensure_db()
+    yield path
+    await data_logger.close_db()
+
+
+def _stats(path, mode):
+    conn = sqlite3.connect(path)
+    try:
+        return self_tuner.load_trade_stats(conn, mode)
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_running_aggregates_match_full_history(db):
+    deltas = [0.12, 0.15, 0.18, 0.11, 0.2, 0.16]
+    for d in deltas:
+        await data_logger.log_trade('COVERED_CALL', 'GOOG', 'OPEN', 1, delta=d, mode='base')
+    await data_logger.log_trades([('SPREAD', 'SPX', 'OPEN', 1, None, 0.07, None, None, None, 'base'),
+                                  ('EMERGENCY', 'SPX', 'EXIT', 1)])
+    await data_logger.flush_db()
+
+    stats = _stats(db, 'base')
+
+    cc = stats['COVERED_CALL']
+    assert cc.count == len(deltas)
+    assert cc.mean == pytest.approx(mean(deltas))
+    assert cc.variance == pytest.approx(variance(deltas))
+    assert deltas[0] < cc.ewma < max(deltas)
+    assert stats['SPREAD'].count == 1 and stats['SPREAD'].variance is None
+    assert 'EMERGENCY' not in stats
+
+
+@pytest.mark.asyncio
+async def test_mode_specific_stats_with_fallback_to_all_modes(db):
+    for d in (0.1, 0.2):
+        await data_logger.log_trade('SPREAD', 'SPX', 'OPEN', 1, delta=d, mode='base')
+    for d in (0.3, 0.4, 0.5):
+        await data_logger.log_trade('SPREAD', 'SPX', 'OPEN', 1, delta=d, mode='aggressive')
+    await data_logger.flush_db()
+
+    assert _stats(db, 'aggressive')['SPREAD'].mean == pytest.approx(0.4)
+    merged = _stats(db, 'conservative')['SPREAD']
+    assert merged.count == 5
+    assert merged.mean == pytest.approx(0.3)
+    assert merged.variance == pytest.approx(variance([0.1, 0.2, 0.3, 0.4, 0.5]))
+
+
+@pytest.mark.asyncio
+async def test_legacy_trades_backfilled_and_tuning_runs_off_loop(tmp_path, monkeypatch):
+    path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(path)
+    conn.execute(data_logger.TRADES_TABLE_SQL)
+    conn.executemany(
+        "INSERT INTO trades (timestamp, trade_type, symbol, action, delta) VALUES (?, ?, ?, ?, ?)",
+        [('2026-02-11T15:00:00', 'ROLLING', 'GOOG', 'ROLL', d) for d in (0.4, 0.5, 0.6)]
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(data_logger, 'DB_PATH', path)
+    monkeypatch.setattr('config.LEARNED_CONFIG_PATH', tmp_path / 'learned.json')
+    await data_logger.ensure_db()
+    await data_logger.log_trade('COVERED_CALL', 'GOOG', 'OPEN', 1, delta=0.12, mode='base')
+
+    try:
+        tuned = await self_tuner.tune_parameters_async('base')
+    finally:
+        await data_logger.close_db()
+
+    assert _stats(path, 'base')['ROLLING'].count == 3
+    assert tuned == {'CC_DELTA_TARGET': 0.12, 'ROLL_DELTA_THRESHOLD': 0.55}
+    assert load_parameters('base')['ROLL_DELTA_THRESHOLD'] == 0.55
+
+
+def test_tuning_migrates_an_unmigrated_database(tmp_path, monkeypatch):
+    path = tmp_path / 'strategy.db'
+    # 旧版本留下的数据库：只有 trades 表，没有 trade_stats
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE trades (id INTEGER PRIMARY KEY, timestamp TEXT, trade_type TEXT, symbol TEXT, "
+                 "action TEXT, quantity INTEGER, price REAL, delta REAL, notes TEXT)")
+    conn.close()
+    monkeypatch.setattr(data_logger, 'DB_PATH', path)
+    monkeypatch.setattr('config.LEARNED_CONFIG_PATH', tmp_path / 'learned.json')
+
+    assert self_tuner.tune_parameters('base') == {}
+    assert _stats(path, 'base') == {}
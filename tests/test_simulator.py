@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import simulator
+from simulator import from_history, monte_carlo, near_earnings_mask, simulate_covered_calls, simulate_put_spreads
+
+PARAMS = {'CC_DELTA_TARGET': 0.15, 'PCS_SELL_DELTA': 0.07, 'PCS_WIDTH': 30,
+          'ROLL_DELTA_THRESHOLD': 0.45, 'ROLL_DTE_THRESHOLD': 1}
+
+
+def _dates(*days):
+    return np.array([f'2026-10-{d:02d}' for d in days], dtype='datetime64[D]')
+
+
+def test_next_friday_matches_live_rule_and_earnings_window():
+    days = simulator._days(_dates(12, 15, 16, 17, 18))     # 周一、周四、周五、周六、周日
+    assert (simulator.next_friday(days) - days).tolist() == [4, 1, 7, 6, 5]
+    assert (simulator.next_friday(days[:1], 1) - days[:1]).tolist() == [11]
+
+    mask = near_earnings_mask(_dates(12, 15, 19, 22, 23), ['2026-10-22'])
+    assert mask.tolist() == [False, False, True, True, False]
+
+
+def test_put_spread_pauses_in_panic_and_caps_loss_at_width():
+    dates = _dates(12, 13, 14, 15, 16)
+    close = [5000, 5000, 4800, 4800, 4800]
+    vix = [20, 20, 45, 20, 20]
+    market = from_history(dates, close, iv=0.16, vix=vix)
+
+    result = simulate_put_spreads(market, PARAMS)
+
+    # 10-13 持平赚净收入，10-14 暴跌亏满宽度，10-15 因前一日 VIX 45 暂停，10-16 持平
+    pnl = np.diff(result.equity[0])
+    assert pnl[0] > 0 and pnl[3] > 0
+    assert pnl[1] == pytest.approx(pnl[0] - 3000)
+    assert pnl[2] == 0
+    assert result.trades.tolist() == [3]
+
+
+def test_covered_call_rules_earnings_vix_and_roll_validation():
+    dates = _dates(12, 13, 14, 15, 16, 19)
+    calm = from_history(dates, [200, 200, 200, 200, 200, 200], iv=0.3, vix=20)
+    stressed = calm._replace(vix=np.full_like(calm.vix, 35.0))
+    earnings = calm._replace(near_earnings=np.array([True, True, False, False, False, False]))
+    rally = from_history(dates, [200, 212, 225, 225, 225, 225], iv=0.3, vix=20)
+
+    calm_result = simulate_covered_calls(calm, PARAMS)
+    stressed_result = simulate_covered_calls(stressed, PARAMS)
+    earnings_result = simulate_covered_calls(earnings, PARAMS)
+    rally_result = simulate_covered_calls(rally, PARAMS)
+
+    # 横盘：周一开仓，周四 DTE 0 < 1 触发 Rolling 到下周之后 (净收入通过验证)，收权利金
+    assert calm_result.trades.tolist() == [2] and calm_result.pnl[0] > 0
+    # 高 VIX 目标 Delta 打八折 -> 行权价更远、权利金更少
+    assert 0 < stressed_result.pnl[0] < calm_result.pnl[0]
+    # 财报窗口内不开仓，推迟到 10-14 才首次卖出
+    assert earnings_result.equity[0, :2].tolist() == [0.0, 0.0] and earnings_result.trades.tolist() == [2]
+    # 大涨后 Delta 超阈值，但买回成本远高于新权利金，Rolling 不通过 Net Credit 验证而继续持有，
+    # 周五按内在价值结算后重新开仓
+    assert rally_result.trades.tolist() == [2]
+    assert rally_result.pnl[0] < -1500
+
+
+def test_paths_are_simulated_independently_in_one_pass():
+    dates = np.busday_offset(np.datetime64('2026-01-02'), np.arange(60), roll='forward')
+    market = monte_carlo(200.0, dates, 64, iv=0.3, realized_vol=0.25, earnings_dates=[dates[30]], seed=3)
+
+    together = simulate_covered_calls(market, PARAMS)
+    single = simulate_covered_calls(market._replace(spot=market.spot[5:6], iv=market.iv[5:6], vix=market.vix[5:6]),
+                                    PARAMS)
+
+    assert together.equity.shape == (64, 60)
+    assert np.allclose(together.equity[5], single.equity[0])
+    combined = together + simulate_put_spreads(market, PARAMS, strike_step=1.0)
+    assert set(combined.summary()) >= {'mean', 'p05', 'win_rate', 'mean_max_drawdown'}
+
+
+def test_simulated_regime_follows_term_structure_and_hysteresis():
+    dates = _dates(12, 13, 14, 15, 16)
+    close = [5000] * 5
+    # VIX 45 -> 39：仍在回差内，PANIC 保持，次日继续暂停
+    sticky = simulate_put_spreads(from_history(dates, close, iv=0.16, vix=[20, 45, 39, 20, 20]), PARAMS)
+    assert np.diff(sticky.equity[0]).tolist()[1:3] == [0, 0]
+
+    # VIX 不高但期限结构倒挂：与实盘一样按 ELEVATED 缩小目标 Delta
+    cc_dates = _dates(12, 13, 14, 15, 16, 19)
+    calm = from_history(cc_dates, [200] * 6, iv=0.3, vix=20)
+    inverted = from_history(cc_dates, [200] * 6, iv=0.3, vix=20, term_slope=-0.05)
+    stressed = calm._replace(vix=np.full_like(calm.vix, 35.0))
+    assert simulate_covered_calls(inverted, PARAMS).pnl[0] == pytest.approx(simulate_covered_calls(stressed, PARAMS).pnl[0])
+    assert simulate_covered_calls(inverted, PARAMS).pnl[0] < simulate_covered_calls(calm, PARAMS).pnl[0]
+
+
+def test_expiring_call_is_rolled_before_settlement_like_the_live_bot():
+    # ROLL_DTE_THRESHOLD = 0：实盘在到期日 (DTE -1) 才触发 Rolling，模拟器须先检查 Rolling 再结算
+    dates = _dates(12, 13, 14, 15, 16, 19, 20, 21, 22, 23)
+    market = from_history(dates, [200] * 10, iv=0.3, vix=20)
+    params = dict(PARAMS, ROLL_DTE_THRESHOLD=0, ROLL_DELTA_THRESHOLD=0.99)
+
+    result = simulate_covered_calls(market, params)
+
+    # 10-12 开仓，10-16 到期日滚动到 10-30 (而非结算后新开 10-23 到期、10-23 再滚动一次)
+    assert result.trades.tolist() == [2]
+    assert result.pnl[0] > 0
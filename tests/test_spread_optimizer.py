@@ -0,0 +1,101 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+import pytest
+from ib_insync import Index, Option, Ticker
+
+from options_lookup import ChainSnapshot
+from spread_optimizer import best_put_spread, score_put_spreads, select_put_spread
+
+EXPIRY = '20261023'
+
+
+def _snapshot(rows):
+    """rows: [(strike, bid, ask, |delta|)]"""
+    strikes, bids, asks, deltas = (np.array(col, dtype=float) for col in zip(*rows))
+    contracts = tuple(Option('SPX', EXPIRY, s, 'P', 'SMART') for s in strikes)
+    return ChainSnapshot('SPX', EXPIRY, 'P', 5000.0, datetime.now(), strikes, bids, asks, deltas,
+                         np.full(len(strikes), 0.2), contracts)
+
+
+def test_joint_pick_skips_illiquid_fixed_width_leg():
+    snapshot = _snapshot([
+        (4900, 0.50, 0.55, 0.03),
+        (4910, 0.80, 1.60, 0.04),   # 固定宽度 30 处的买入腿：Spread 太宽
+        (4920, 1.00, 1.05, 0.05),
+        (4940, 2.00, 2.10, 0.07),
+        (4960, 3.80, 3.95, 0.11),
+    ])
+
+    pick = best_put_spread(snapshot, sell_delta=0.07, width=30, delta_tolerance=0.01)
+
+    assert pick.sell.strike == 4940
+    assert pick.buy.strike == 4920
+    assert pick.width == 20
+    assert pick.credit == pytest.approx(0.95)
+
+
+def test_scores_prefer_credit_per_width_and_mask_infeasible_pairs():
+    snapshot = _snapshot([
+        (4900, 0.50, 0.55, 0.03),
+        (4920, 1.00, 1.05, 0.05),
+        (4940, 2.00, 2.10, 0.07),
+    ])
+
+    scores = score_put_spreads(snapshot, 0.07, min_width=15, max_width=45, delta_tolerance=0.01)
+
+    assert np.isneginf(scores[0]).all() and np.isneginf(scores[1]).all()   # 卖出腿 Delta 不符
+    assert np.isneginf(scores[2, 2])                                       # 同一行权价
+    assert scores[2, 1] > scores[2, 0] > -np.inf                           # 20 宽的收益率更高
+
+
+def test_short_leg_nearest_target_delta_and_width_near_target_win():
+    snapshot = _snapshot([
+        (4890, 0.45, 0.50, 0.030),
+        (4900, 0.60, 0.65, 0.040),
+        (4910, 0.75, 0.80, 0.050),
+        (4920, 0.95, 1.00, 0.055),
+        (4930, 1.30, 1.35, 0.070),
+        (4940, 1.80, 1.85, 0.0945),   # 权利金最厚，但 Delta 偏离目标
+    ])
+
+    pick = best_put_spread(snapshot, sell_delta=0.07, width=30)
+
+    assert pick.sell.strike == 4930 and pick.sell_delta == pytest.approx(0.07)
+    assert pick.width == 30
+
+
+def test_no_pick_when_nothing_feasible():
+    snapshot = _snapshot([(4900, 0.50, 0.55, 0.03), (4940, 0.0, 0.05, 0.07)])
+    assert best_put_spread(snapshot, sell_delta=0.07, width=30) is None
+
+
+@pytest.mark.asyncio
+async def test_select_put_spread_uses_one_batched_quote_pass():
+    quotes = {4900: (0.50, 0.55, -0.03), 4920: (1.00, 1.05, -0.05), 4940: (2.00, 2.10, -0.07), 4960: (3.8, 3.9, -0.11)}
+    ib = MagicMock()
+    ib.reqSecDefOptParamsAsync = AsyncMock(return_value=[
+        MagicMock(exchange='SMART', expirations=[EXPIRY], strikes=[4900.0, 4920.0, 4940.0, 4960.0, 5020.0])
+    ])
+    ib.qualifyContractsAsync = AsyncMock(side_effect=lambda *cs: list(cs))
+
+    async def req_tickers(*contracts):
+        tickers = []
+        for c in contracts:
+            if c.secType == 'IND':
+                tickers.append(Ticker(contract=c, last=5000.0))
+                continue
+            bid, ask, delta = quotes[c.strike]
+            tickers.append(Ticker(contract=c, bid=bid, ask=ask, modelGreeks=MagicMock(delta=delta, impliedVol=0.2)))
+        return tickers
+
+    ib.reqTickersAsync = AsyncMock(side_effect=req_tickers)
+    underlying = Index('SPX', 'CBOE', 'USD')
+    underlying.conId = 416904
+
+    pick = await select_put_spread(ib, underlying, EXPIRY, 0.07, 30, delta_tolerance=0.01)
+
+    assert (pick.sell.strike, pick.buy.strike) == (4940, 4920)
+    assert ib.reqTickersAsync.await_count == 2        # 标的 + 整条链一次
+    assert ib.qualifyContractsAsync.await_count == 1
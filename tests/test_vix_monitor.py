@@ -0,0 +1,115 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from ib_insync import Ticker
+
+import market_data
+from vix_monitor import CALM, ELEVATED, PANIC, REGIMES, VolRegimeService, classify, regime_paths, term_slope
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def ib():
+    ib = MagicMock()
+    con_ids = {'VIX9D': 901, 'VIX': 902, 'VIX3M': 903}
+
+    async def qualify(*contracts):
+        for c in contracts:
+            c.conId = con_ids[c.symbol]
+        return list(contracts)
+
+    ib.qualifyContractsAsync = qualify
+    ib.reqMktData = MagicMock(side_effect=lambda c, *a, **k: Ticker(contract=c, last=20.0))
+    market_data.install(ib)
+    yield ib
+    market_data.uninstall()
+
+
+def test_classify_levels_and_term_structure_inversion():
+    assert classify(None) == CALM
+    assert classify(18.0, term_slope(16.0, 18.0, 21.0)) == CALM
+    assert classify(31.0) == ELEVATED
+    assert classify(45.0) == PANIC
+    # VIX 不高但 9 天高于 3 个月 (倒挂)
+    assert classify(24.0, term_slope(27.0, 24.0, 23.0)) == ELEVATED
+
+
+def test_escalates_immediately_and_deescalates_with_hysteresis():
+    clock = FakeClock()
+    service = VolRegimeService(MagicMock(), halflife=60, hysteresis=2.0, clock=clock)
+    events = []
+    service.regimeEvent += lambda old, new: events.append((old.regime, new.regime))
+
+    service.update('VIX', 20.0)
+    clock.now = 1
+    service.update('VIX', 42.0)
+    assert service.regime == PANIC
+    assert service.state.vix_ewma < 21       # 1 秒的间隔几乎不改变 EWMA
+
+    # 最新值回落但尚在回差内：保持
+    clock.now = 2
+    assert service.update('VIX', 39.0).regime == PANIC
+    # 回落到阈值下方 hysteresis 以外且 EWMA 也低：降级
+    clock.now = 3
+    assert service.update('VIX', 37.0).regime == ELEVATED
+    clock.now = 600
+    assert service.update('VIX', 29.0).regime == ELEVATED
+    clock.now = 1200
+    assert service.update('VIX', 20.0).regime == CALM
+
+    assert events == [(CALM, PANIC), (PANIC, ELEVATED), (ELEVATED, CALM)]
+
+
+def test_regime_paths_match_the_live_service():
+    times = [0, 1, 2, 3, 600, 1200]
+    vix = [20.0, 42.0, 39.0, 37.0, 29.0, 20.0]
+    slope = [0.1, 0.1, 0.1, 0.1, -0.05, 0.1]
+    clock = FakeClock()
+    service = VolRegimeService(MagicMock(), halflife=60, hysteresis=2.0, clock=clock)
+    live = []
+    for now, v, s in zip(times, vix, slope):
+        clock.now = now
+        service.update('VIX9D', v)
+        service.update('VIX3M', v + s * v)
+        live.append(service.update('VIX', v).regime)
+
+    levels = regime_paths([vix, [20.0] * 6], [slope, [0.1] * 6], elapsed=np.diff(times), halflife=60, hysteresis=2.0)
+
+    assert [REGIMES[i] for i in levels[0]] == live == [CALM, PANIC, PANIC, ELEVATED, ELEVATED, CALM]
+    assert levels[1].tolist() == [0] * 6
+
+
+@pytest.mark.asyncio
+async def test_streams_term_structure_and_reacts_to_ticks(ib):
+    service = VolRegimeService(ib)
+    events = []
+    service.regimeEvent += lambda old, new: events.append(new)
+
+    state = await service.start()
+    assert service.streaming
+    assert state.vix == 20.0 and state.slope == pytest.approx(0.0) and state.regime == CALM
+
+    manager = market_data.get_manager(ib)
+    assert manager.lines_in_use == 3
+    requests = ib.reqMktData.call_count
+    tickers = {line.contract.symbol: line.ticker for line in manager._lines.values()}
+
+    tickers['VIX9D'].last = 26.0
+    tickers['VIX9D'].updateEvent.emit(tickers['VIX9D'])
+    tickers['VIX3M'].last = 21.0
+    tickers['VIX3M'].updateEvent.emit(tickers['VIX3M'])
+
+    assert service.state.slope == pytest.approx(-0.25)
+    assert service.regime == ELEVATED and len(events) == 1 and events[0].inverted
+    assert ib.reqMktData.call_count == requests
+
+    await service.stop()
+    assert not service.streaming
@@ -5,20 +5,43 @@ import pytz
 
 logger = logging.getLogger(__name__)
 
+# 回放时策略时钟冻结在录制开始时刻：(本地墙钟时间, Unix 时间戳)；None 为真实时钟
+_frozen_clock = None
+
+
+def freeze_clock(wall: datetime, timestamp: float):
+    """将策略时钟 (now/到期日/DTE/交易时段) 冻结在给定时刻，回放录制文件时使用"""
+    global _frozen_clock
+    _frozen_clock = (wall, timestamp)
+
+
+def unfreeze_clock():
+    global _frozen_clock
+    _frozen_clock = None
+
+
+def now(tz=None) -> datetime:
+    """策略时钟：与 datetime.now(tz) 相同，回放时返回录制开始时刻"""
+    if _frozen_clock is None:
+        return datetime.now(tz)
+    wall, timestamp = _frozen_clock
+    return wall if tz is None else datetime.fromtimestamp(timestamp, tz)
+
+
 def get_next_friday(offset_weeks=0):
     """获取下周五（或本周五）的日期字符串 YYYYMMDD"""
-    now = datetime.now()
+    now_ = now()
     # 0=Monday, 4=Friday
-    days_ahead = 4 - now.weekday()
+    days_ahead = 4 - now_.weekday()
     if days_ahead <= 0: # 如果今天已经是周五或周末，取下周五
         days_ahead += 7
-    target_date = now + timedelta(days=days_ahead + (offset_weeks * 7))
+    target_date = now_ + timedelta(days=days_ahead + (offset_weeks * 7))
     return target_date.strftime('%Y%m%d')
 
 def is_trading_hours():
     """检查是否处于美股常规交易时段 (9:30 AM - 4:00 PM EST)"""
     est = pytz.timezone('US/Eastern')
-    now_est = datetime.now(est)
+    now_est = now(est)
     
     # 周一到周五
     if now_est.weekday() >= 5:
@@ -40,3 +63,8 @@ def validate_net_credit(new_credit, old_cost, contracts_count, commission_per_co
     
     net = (new_credit - old_cost) * 100 * contracts_count
     return net > min_profit_buffer, net
+
+def days_to_expiry(expiry):
+    """到期日 (YYYYMMDD) 距今的自然日数 (与 Rolling 的 DTE 判断口径一致)"""
+    expiry_dt = datetime.strptime(expiry, '%Y%m%d')
+    return (expiry_dt - now()).days
@@ -1,15 +1,44 @@
 import logging
+import math
+import time
+from typing import NamedTuple, Optional
 
-from ib_insync import Index
+import numpy as np
+from eventkit import Event
+from ib_insync import Index, util
+
+from config import VIX_ELEVATED, VIX_EWMA_HALFLIFE, VIX_HYSTERESIS, VIX_INVERSION_SLOPE, VIX_PANIC
+from contract_registry import registry
+from market_data import get_manager, req_tickers
 
 logger = logging.getLogger(__name__)
 
+# 波动率期限结构：9 天、30 天、3 个月
+VOL_INDEXES = ('VIX9D', 'VIX', 'VIX3M')
+
+CALM, ELEVATED, PANIC = 'CALM', 'ELEVATED', 'PANIC'
+REGIMES = (CALM, ELEVATED, PANIC)
+_SEVERITY = {name: level for level, name in enumerate(REGIMES)}
+
+
+def _level(ticker) -> Optional[float]:
+    value = ticker.marketPrice()
+    if value is None or util.isNan(value) or value <= 0:
+        value = ticker.last
+    if value is None or util.isNan(value) or value <= 0:
+        return None
+    return value
+
 
 async def fetch_vix(ib):
     try:
         vix = Index('VIX', 'CBOE', 'USD')
-        await ib.qualifyContractsAsync(vix)
-        [ticker] = await ib.reqTickersAsync(vix)
+        await registry.qualify(ib, vix)
+        manager = get_manager(ib)
+        if manager:
+            # VIX 每轮都要读，常驻订阅
+            await manager.hold('vix', [vix])
+        [ticker] = await req_tickers(ib, vix)
         value = ticker.marketPrice()
         if value is None or value <= 0:
             value = ticker.last
@@ -17,3 +46,204 @@ async def fetch_vix(ib):
     except Exception as exc:
         logger.warning(f"无法读取 VIX 价格: {exc}")
         return None
+
+
+class VolState(NamedTuple):
+    """波动率环境快照 (不可变，策略直接读取 VolRegimeService.state)"""
+    regime: str
+    vix: Optional[float]
+    vix_ewma: Optional[float]
+    vix9d: Optional[float]
+    vix3m: Optional[float]
+    slope: Optional[float]      # (VIX3M - VIX9D) / VIX，小于 0 为期限结构倒挂
+    updated_at: float
+
+    @property
+    def inverted(self) -> bool:
+        return self.slope is not None and self.slope < VIX_INVERSION_SLOPE
+
+
+def term_slope(vix9d, vix, vix3m) -> Optional[float]:
+    if vix9d is None or vix is None or vix3m is None:
+        return None
+    return (vix3m - vix9d) / vix
+
+
+def severity(vix, slope=None) -> np.ndarray:
+    """classify 的向量化版本：返回 REGIMES 下标 (0/1/2)；slope 为 NaN 视为未知 (不算倒挂)"""
+    vix = np.asarray(vix, dtype=float)
+    level = np.where(vix > VIX_PANIC, 2, np.where(vix > VIX_ELEVATED, 1, 0))
+    if slope is not None:
+        with np.errstate(invalid='ignore'):
+            level = np.maximum(level, np.asarray(slope, dtype=float) < VIX_INVERSION_SLOPE)
+    return level
+
+
+def classify(vix, slope=None) -> str:
+    """VIX > VIX_PANIC 为恐慌；VIX > VIX_ELEVATED 或期限结构倒挂为高波动"""
+    if vix is None:
+        return CALM
+    return REGIMES[int(severity(vix, slope))]
+
+
+def _ewma_paths(values: np.ndarray, decay: np.ndarray) -> np.ndarray:
+    """按样本间隔衰减的 EWMA，与 VolRegimeService 的更新公式一致"""
+    if np.all(decay >= 1.0):
+        # 样本间隔远大于半衰期 (如日线对 15 分钟半衰期)：权重全部落在最新值上
+        return values.copy()
+    # 系数随间隔变化且可能下溢为 0，累积乘积形式数值不稳定，保留逐样本递推 (每步一次数组运算)
+    ewma = np.empty_like(values)
+    ewma[:, 0] = values[:, 0]
+    for d in range(1, values.shape[1]):
+        ewma[:, d] = ewma[:, d - 1] + decay[d - 1] * (values[:, d] - ewma[:, d - 1])
+    return ewma
+
+
+def regime_paths(vix, slope=None, elapsed=None, halflife: float = VIX_EWMA_HALFLIFE,
+                 hysteresis: float = VIX_HYSTERESIS) -> np.ndarray:
+    """
+    按 VolRegimeService 的规则推进环境 (立即升级、EWMA + 回差降级)，对全部路径与样本向量化。
+    vix/slope 为 (paths, samples)，elapsed 为相邻样本间隔秒数 (samples - 1,)；返回 REGIMES 下标矩阵。
+
+    降级条件 relaxed 不低于 target，因此每一级 L 的状态等价于"最近一次 target >= L 之后
+    relaxed 一直 >= L"，用两个累积最大值比较位置即可，无需逐样本循环。
+    """
+    vix = np.atleast_2d(np.asarray(vix, dtype=float))
+    slope = None if slope is None else np.broadcast_to(np.asarray(slope, dtype=float), vix.shape)
+    decay = np.ones(vix.shape[1] - 1) if elapsed is None else \
+        1.0 - np.exp(-np.log(2) * np.asarray(elapsed, dtype=float) / halflife)
+    ewma = _ewma_paths(vix, decay)
+    target = severity(vix, slope)
+    # 降级：最新值与 EWMA 中较高者加上回差后仍低于阈值才降，且不因此升级
+    relaxed = severity(np.maximum(vix, ewma) + hysteresis, slope)
+    index = np.broadcast_to(np.arange(vix.shape[1]), vix.shape)
+    levels = np.zeros(vix.shape, dtype=np.int8)
+    for level in range(1, len(REGIMES)):
+        raised = np.maximum.accumulate(np.where(target >= level, index, -1), axis=1)
+        released = np.maximum.accumulate(np.where(relaxed < level, index, -1), axis=1)
+        levels += raised > released
+    return levels
+
+
+class VolRegimeService:
+    """
+    常驻的波动率环境服务：流式订阅 VIX9D/VIX/VIX3M，维护按时间衰减的 VIX EWMA 与期限结构斜率。
+    - 升级 (CALM -> ELEVATED -> PANIC) 按最新 VIX 立即生效；
+    - 降级要求最新值与 EWMA 都回落到阈值下方 hysteresis 以外，避免在阈值附近来回切换；
+    - 环境变化时发出 regimeEvent(old_state, new_state)，策略随时读取 state 无需额外请求。
+    """
+
+    def __init__(self, ib, halflife: float = VIX_EWMA_HALFLIFE, hysteresis: float = VIX_HYSTERESIS,
+                 clock=time.monotonic):
+        self.ib = ib
+        self.halflife = halflife
+        self.hysteresis = hysteresis
+        self.clock = clock
+        self.state = VolState(CALM, None, None, None, None, None, 0.0)
+        self.regimeEvent = Event('regimeEvent')
+        self._names = {}            # conId -> 指数名
+        self._tickers = {}          # 指数名 -> Ticker
+        self._levels = {}           # 指数名 -> 最新值
+        self._ewma = None
+        self._ewma_at = None
+        self.stats = {'updates': 0, 'changes': 0}
+
+    @property
+    def regime(self) -> str:
+        return self.state.regime
+
+    @property
+    def streaming(self) -> bool:
+        return bool(self._tickers)
+
+    async def start(self):
+        manager = get_manager(self.ib)
+        if manager is None:
+            raise RuntimeError("VolRegimeService 需要先 market_data.install(ib)")
+        contracts = [Index(name, 'CBOE', 'USD') for name in VOL_INDEXES]
+        try:
+            qualified = await registry.qualify(self.ib, *contracts)
+        except Exception as exc:
+            # 期限结构指数取不到时 (如旧的录制文件) 只跟踪 VIX
+            logger.warning(f"无法确认 VIX 期限结构指数，仅跟踪 VIX: {exc}")
+            qualified = await registry.qualify(self.ib, contracts[VOL_INDEXES.index('VIX')])
+        if not any(c.symbol == 'VIX' for c in qualified):
+            raise RuntimeError("无法确认 VIX 指数合约")
+
+        await manager.hold('vol_regime', qualified)
+        for contract in qualified:
+            ticker = manager.ticker(contract)
+            self._names[contract.conId] = contract.symbol
+            self._tickers[contract.symbol] = ticker
+            ticker.updateEvent += self._on_update
+        logger.info(f"🌡️ 波动率环境监控已启动: {', '.join(c.symbol for c in qualified)}")
+        return self.refresh()
+
+    async def stop(self):
+        for ticker in self._tickers.values():
+            ticker.updateEvent -= self._on_update
+        self._tickers.clear()
+        self._names.clear()
+        manager = get_manager(self.ib)
+        if manager:
+            await manager.hold('vol_regime', [])
+
+    def refresh(self) -> VolState:
+        """从已订阅的 Ticker 读取当前值 (零请求)，供主循环每轮兜底；返回最新 state"""
+        for name, ticker in self._tickers.items():
+            value = _level(ticker)
+            if value is not None:
+                self._record(name, value)
+        self._recompute()
+        return self.state
+
+    def _on_update(self, ticker):
+        name = self._names.get(ticker.contract.conId if ticker.contract else None)
+        value = _level(ticker) if name else None
+        if value is None:
+            return
+        self.stats['updates'] += 1
+        self._record(name, value)
+        self._recompute()
+
+    def update(self, name: str, value: float) -> VolState:
+        """直接写入一个指数值 (回测/测试用)"""
+        self._record(name, value)
+        self._recompute()
+        return self.state
+
+    def _record(self, name, value):
+        self._levels[name] = value
+        if name != 'VIX':
+            return
+        now = self.clock()
+        if self._ewma is None:
+            self._ewma = value
+        else:
+            # 按时间间隔衰减：更新不规律时权重仍只取决于经过的时间
+            alpha = 1.0 - math.exp(-math.log(2) * max(now - self._ewma_at, 0.0) / self.halflife)
+            self._ewma += alpha * (value - self._ewma)
+        self._ewma_at = now
+
+    def _recompute(self):
+        vix = self._levels.get('VIX')
+        if vix is None:
+            return
+        vix9d, vix3m = self._levels.get('VIX9D'), self._levels.get('VIX3M')
+        slope = term_slope(vix9d, vix, vix3m)
+        current = self.state.regime
+        target = classify(vix, slope)
+        if _SEVERITY[target] < _SEVERITY[current]:
+            # 降级：最新值与 EWMA 中较高者加上回差后仍低于阈值才降
+            target = classify(max(vix, self._ewma) + self.hysteresis, slope)
+            if _SEVERITY[target] > _SEVERITY[current]:
+                target = current
+        old = self.state
+        self.state = VolState(target, vix, self._ewma, vix9d, vix3m, slope, self.clock())
+        if target != current:
+            self.stats['changes'] += 1
+            slope_text = f"{slope:+.3f}" if slope is not None else "n/a"
+            logger.warning(
+                f"🌡️ 波动率环境 {current} -> {target} (VIX={vix:.2f}, EWMA={self._ewma:.2f}, 期限斜率={slope_text})"
+            )
+            self.regimeEvent.emit(old, self.state)